@@ -0,0 +1,278 @@
+import argparse
+import io
+import json
+import math
+import os
+import re
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor
+import pyarrow as pa
+import tornado.httpserver
+import tornado.ioloop
+import tornado.web
+import lotplotter
+import td_parser
+import ingest
+import exporters
+from catalog import TiepointCatalog, build_catalog, validate_json_format
+from tiepoint_index import TiepointIndex
+
+# Media type of Arrow IPC stream responses, requested through the Accept header
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+# Most tiepoints returned by one search
+MAX_TIEPOINTS = 500
+
+# The catalog tiepoints of a worker process, and by name; set once when the worker starts (see init_worker)
+worker_tiepoints = []
+worker_tiepoints_by_name = {}
+
+def init_worker(tiepoints):
+    global worker_tiepoints, worker_tiepoints_by_name
+    worker_tiepoints = tiepoints
+    worker_tiepoints_by_name = {tiepoint["name"]: tiepoint for tiepoint in tiepoints}
+
+# A bad request found while reading it, possibly in a worker process; handlers respond with it as an HTTP error
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(status, message)
+        self.status = status
+        self.message = message
+
+# Convert the courses of a request (a "td_data" list of course dicts, or free "text" in any format td_parser reads)
+# into technical description dicts, raising ValueError with every invalid course
+def parse_courses(data):
+    problems = []
+    if "text" in data:
+        courses = list(td_parser.parse(str(data["text"]).splitlines(), problems))
+        problems = [f"Line {line_number}: {error}" for line_number, _, error in problems]
+    else:
+        courses = []
+        for index, course in enumerate(data.get("td_data") or []):
+            try:
+                courses.append(td_parser.parse_fields(*(str(course.get(key, "")) for key in ["ns", "deg", "min", "ew", "dist"])))
+            except (ValueError, AttributeError) as e:
+                problems.append(f"Course {index + 1}: {e}")
+    if problems:
+        raise ValueError("; ".join(problems))
+    if not courses:
+        raise ValueError("No Data")
+    return courses
+
+# Tiepoint of a request: a catalog name (found with find, e.g. TiepointCatalog.get), or a full tiepoint dict
+def resolve_tiepoint(tiepoint, find):
+    if isinstance(tiepoint, dict):
+        is_valid, message = validate_json_format([tiepoint])
+        if not is_valid:
+            raise RequestError(400, message)
+        return tiepoint
+    found = find(str(tiepoint))
+    if found is None:
+        raise RequestError(404, f"Unknown tiepoint: {tiepoint}")
+    return found
+
+# (lot_id, tiepoint, courses) of one request lot
+def resolve_lot(data, find, lot_id=""):
+    if not isinstance(data, dict):
+        raise RequestError(400, "Expected a JSON object with tiepoint and td_data or text.")
+    tiepoint = resolve_tiepoint(data.get("tiepoint"), find)
+    if data.get("lot_id") is not None:
+        lot_id = str(data["lot_id"])
+    try:
+        courses = parse_courses(data)
+    except ValueError as e:
+        raise RequestError(400, f"Lot {lot_id}: {e}" if lot_id else str(e))
+    return lot_id, tiepoint, courses
+
+def parse_json(body):
+    try:
+        return json.loads(body)
+    except ValueError as e:
+        raise RequestError(400, f"Invalid JSON: {e}")
+
+# (lots, compass_rule) of a /boundaries body: a multi-lot CSV, or {"lots": [...], "compass_rule": ...} with request
+# lots. Runs in a worker, against the worker's tiepoints
+def read_batch(body, csv, compass_rule=False):
+    if csv:
+        errors = []
+        try:
+            chunks = ingest.read_csv_chunks(io.StringIO(body.decode("utf-8-sig")))
+            lots = [lot for batch in ingest.batch_lots(ingest.read_lots(chunks), worker_tiepoints, 10000, errors) for lot in batch]
+        except ValueError as e:
+            # A missing column, or a body that is not UTF-8
+            raise RequestError(400, f"Invalid CSV: {e}")
+        if errors:
+            raise RequestError(400, "; ".join(f"Lot {lot_id}: {error}" for lot_id, error in errors))
+    else:
+        data = parse_json(body)
+        if not isinstance(data, dict) or not isinstance(data.get("lots"), list):
+            raise RequestError(400, "Expected a JSON object with a lots list.")
+        lots = [resolve_lot(lot, worker_tiepoints_by_name.get, str(index)) for index, lot in enumerate(data["lots"])]
+        if "compass_rule" in data:
+            compass_rule = bool(data["compass_rule"])
+    if not lots:
+        raise RequestError(400, "No Data")
+    return lots, compass_rule
+
+# Boundary and closure of every lot as JSON-ready dicts, for (lot_id, tiepoint, courses) lots
+def lot_results(lots, compass_rule=False):
+    tiepoints = [tiepoint for _, tiepoint, _ in lots]
+    boundaries = lotplotter.calculate_boundaries(tiepoints, [courses for _, _, courses in lots])
+    closures = lotplotter.check_closures(boundaries)
+    if compass_rule:
+        boundaries = lotplotter.adjust_compass_rule(boundaries, tiepoints)
+    results = []
+    for index, (lot_id, tiepoint, _) in enumerate(lots):
+        lot_slice = slice(boundaries.offsets[index], boundaries.offsets[index + 1])
+        precision = float(closures.precision[index])
+        results.append({
+            "lot_id": lot_id,
+            "tiepoint": tiepoint["name"],
+            "points": list(zip(boundaries.x[lot_slice].tolist(), boundaries.y[lot_slice].tolist())),
+            "geographic": list(zip(boundaries.longitude[lot_slice].tolist(), boundaries.latitude[lot_slice].tolist())),
+            "area": float(closures.area[index]),
+            "perimeter": float(closures.perimeter[index]),
+            "misclosure": float(closures.misclosure[index]),
+            "precision": precision if math.isfinite(precision) else None,
+            "flagged": bool(closures.flagged[index]),
+        })
+    return results
+
+# Worker: read, compute and serialize a /boundaries request from its raw body, so none of it blocks the server's
+# event loop
+def batch_response(body, csv, arrow, compass_rule=False):
+    lots, compass_rule = read_batch(body, csv, compass_rule)
+    if arrow:
+        record_batch = ingest.compute_batch(lots, compass_rule)
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, ingest.OUTPUT_SCHEMA, options=pa.ipc.IpcWriteOptions(compression="zstd")) as writer:
+            writer.write_batch(record_batch)
+        return sink.getvalue()
+    return json.dumps({"lots": lot_results(lots, compass_rule)}, separators=(",", ":")).encode("utf-8")
+
+# Attachment header for a file name: plain ASCII for every client, and the full UTF-8 name (RFC 6266) for the rest
+def content_disposition(file_name):
+    ascii_name = re.sub(r"[^\w.-]", "_", file_name, flags=re.ASCII)
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{urllib.parse.quote(file_name)}"
+
+class BaseHandler(tornado.web.RequestHandler):
+    @property
+    def catalog(self):
+        return self.settings["catalog"]
+
+    # Errors as JSON, with the message of a request error instead of the bare status reason
+    def write_error(self, status_code, **kwargs):
+        error = kwargs.get("exc_info", (None, None))[1]
+        message = error.log_message if isinstance(error, tornado.web.HTTPError) and error.log_message else self._reason
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.finish({"error": message})
+
+    # Parsed JSON request body
+    def json_body(self):
+        try:
+            return parse_json(self.request.body)
+        except RequestError as e:
+            raise tornado.web.HTTPError(e.status, e.message)
+
+    def request_tiepoint(self, tiepoint):
+        try:
+            return resolve_tiepoint(tiepoint, self.catalog.get)
+        except RequestError as e:
+            raise tornado.web.HTTPError(e.status, e.message)
+
+    def request_lot(self, data, lot_id=""):
+        try:
+            return resolve_lot(data, self.catalog.get, lot_id)
+        except RequestError as e:
+            raise tornado.web.HTTPError(e.status, e.message)
+
+# POST /boundary: one lot, computed inline (well under a millisecond)
+class BoundaryHandler(BaseHandler):
+    def post(self):
+        data = self.json_body()
+        result = lot_results([self.request_lot(data)], bool(data.get("compass_rule")))[0]
+        self.write(result)
+
+# POST /boundaries: many lots, computed in the worker pool. The body is {"lots": [...]} with request lots, or a
+# multi-lot CSV (Content-Type text/csv). Responds with JSON, or the corners as an Arrow stream when accepted
+class BoundariesHandler(BaseHandler):
+    async def post(self):
+        csv = self.request.headers.get("Content-Type", "").startswith("text/csv")
+        compass_rule = self.get_query_argument("compass_rule", "") in ("1", "true")
+        arrow = ARROW_STREAM in self.request.headers.get("Accept", "")
+        try:
+            body = await tornado.ioloop.IOLoop.current().run_in_executor(self.settings["executor"], batch_response, self.request.body, csv, arrow, compass_rule)
+        except RequestError as e:
+            raise tornado.web.HTTPError(e.status, e.message)
+        self.set_header("Content-Type", ARROW_STREAM if arrow else "application/json; charset=UTF-8")
+        self.write(body)
+
+# GET /tiepoints?search=&offset=&limit=, or ?latitude=&longitude=&count= for the nearest tiepoints
+class TiepointsHandler(BaseHandler):
+    def get(self):
+        try:
+            if self.get_query_argument("latitude", None) is not None:
+                latitude, longitude = float(self.get_query_argument("latitude")), float(self.get_query_argument("longitude"))
+                nearest = self.settings["tiepoint_index"].nearest(latitude, longitude, min(int(self.get_query_argument("count", "5")), MAX_TIEPOINTS))
+                self.write({"tiepoints": [dict(tiepoint, distance=distance) for tiepoint, distance in nearest]})
+                return
+            search = self.get_query_argument("search", "")
+            offset = int(self.get_query_argument("offset", "0"))
+            limit = min(int(self.get_query_argument("limit", "50")), MAX_TIEPOINTS)
+        except (ValueError, tornado.web.MissingArgumentError) as e:
+            raise tornado.web.HTTPError(400, str(e))
+        self.write({"count": self.catalog.count(search), "tiepoints": self.catalog.search(search, offset, limit)})
+
+# GET /tiepoints/<name>
+class TiepointHandler(BaseHandler):
+    def get(self, name):
+        self.write(self.request_tiepoint(name))
+
+# POST /export/<format>: one lot rendered as a download in any registered export format (see exporters.registry)
+class ExportHandler(BaseHandler):
+    def post(self, fmt):
+        exporter = exporters.registry().get(fmt)
+        if exporter is None:
+            raise tornado.web.HTTPError(404, f"Unknown export format: {fmt}")
+        data = self.json_body()
+        lot_id, tiepoint, courses = self.request_lot(data)
+        result = lot_results([(lot_id, tiepoint, courses)], bool(data.get("compass_rule")))[0]
+        content = exporters.render(fmt, dict(result, td_data=courses))
+        self.set_header("Content-Type", exporter.mime)
+        self.set_header("Content-Disposition", content_disposition(exporters.safe_file_name(lot_id) + exporter.extension))
+        self.write(content.encode("utf-8") if isinstance(content, str) else content)
+
+# The API over a tiepoint catalog, with batches computed by a pool of worker processes that each load the catalog
+# tiepoints once, when they start
+def make_app(tiepoints_path="tiepoints.json", workers=None):
+    catalog = TiepointCatalog(build_catalog(tiepoints_path, os.path.splitext(tiepoints_path)[0] + ".sqlite"))
+    tiepoints = catalog.all()
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(tiepoints,))
+    return tornado.web.Application([
+        (r"/boundary", BoundaryHandler),
+        (r"/boundaries", BoundariesHandler),
+        (r"/tiepoints", TiepointsHandler),
+        (r"/tiepoints/(.+)", TiepointHandler),
+        (r"/export/([\w-]+)", ExportHandler),
+    ], catalog=catalog, tiepoint_index=TiepointIndex(tiepoints), executor=executor, compress_response=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP JSON API for lot boundary computation.")
+    parser.add_argument("-t", "--tiepoints", default="tiepoints.json", help="tiepoint catalog JSON (default: tiepoints.json)")
+    parser.add_argument("-p", "--port", type=int, default=8502, help="port to listen on (default: 8502)")
+    parser.add_argument("--address", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help="worker processes for batches (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    app = make_app(args.tiepoints, args.workers)
+    # Keep idle keep-alive connections open long enough for clients that send request after request
+    server = tornado.httpserver.HTTPServer(app, idle_connection_timeout=300, max_body_size=256 * 1024 * 1024)
+    server.listen(args.port, args.address)
+    print(f"Listening on http://{args.address}:{args.port}")
+    try:
+        tornado.ioloop.IOLoop.current().start()
+    finally:
+        app.settings["executor"].shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import argparse
+import gc
+import io
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+import numpy as np
+import lotplotter
+import td_parser
+import ingest
+import exporters
+from catalog import validate_json_format
+
+# Sizes of the generated inputs: courses of one lot, and lots (or tiepoints) of one batch
+COURSE_SIZES = [4, 100, 10000, 1000000]
+LOT_SIZES = [1, 100, 10000, 100000]
+
+# Courses of every lot in the multi-lot benchmarks, a typical title's boundary
+COURSES_PER_LOT = 8
+
+# Largest single-lot export and lots per combined export (the exporters build whole documents in memory)
+MAX_EXPORT_COURSES = 100000
+MAX_EXPORT_LOTS = 10000
+
+# A result is slower than its baseline when its best time grows by more than the threshold and by more than
+# this many seconds, and uses more memory when its peak grows by more than the threshold and this many bytes
+MIN_SECONDS = 0.0005
+MIN_BYTES = 64 * 1024
+
+# Tiepoints spread around Cebu like the shipped catalog
+def synthetic_tiepoints(count, rng):
+    latitude = rng.uniform(9.5, 11.5, count)
+    longitude = rng.uniform(123.3, 124.1, count)
+    return [{
+        "name": f"BLLM NO. {index + 1}",
+        "northing": round(float(rng.uniform(15000, 25000)), 3),
+        "easting": round(float(rng.uniform(15000, 25000)), 3),
+        "latitude": {"deg": int(lat), "min": int(lat * 60 % 60), "sec": round(lat * 3600 % 60, 2)},
+        "longitude": {"deg": int(lon), "min": int(lon * 60 % 60), "sec": round(lon * 3600 % 60, 2)},
+        "k_latitude": round(float(rng.uniform(30.6, 30.8)), 3),
+        "k_longitude": round(float(rng.uniform(30.3, 30.5)), 3),
+    } for index, (lat, lon) in enumerate(zip(latitude.tolist(), longitude.tolist()))]
+
+# Courses of a closed lot: a tieline from the tiepoint, then corners around a circle about 20 meters apart with
+# bearings rounded to the minute and distances to the centimeter like a title, and a last course back to the first corner
+def synthetic_courses(count, rng):
+    corners = max(count - 1, 1)
+    radius = max(corners * 20 / (2 * math.pi), 10.0)
+    angles = np.sort(rng.uniform(0, 2 * math.pi, corners))
+    x, y = radius * np.sin(angles), radius * np.cos(angles)
+    tieline = rng.uniform(-500, 500, 2)
+    dx, dy = np.concatenate(([tieline[0]], np.diff(x))), np.concatenate(([tieline[1]], np.diff(y)))
+    minutes = np.round(np.degrees(np.arctan2(np.abs(dx), np.abs(dy))) * 60)
+    dist = np.round(np.hypot(dx, dy), 2)
+    # Close the lot from where the rounded courses after the tieline actually end
+    radians = np.radians(minutes[1:] / 60)
+    end_x = (np.sign(dx[1:]) * dist[1:] * np.sin(radians)).sum()
+    end_y = (np.sign(dy[1:]) * dist[1:] * np.cos(radians)).sum()
+    if count > 1:
+        dx, dy = np.append(dx, -end_x), np.append(dy, -end_y)
+        minutes = np.append(minutes, round(math.degrees(math.atan2(abs(end_x), abs(end_y))) * 60))
+        dist = np.append(dist, round(math.hypot(end_x, end_y), 2))
+    return [{"ns": "N" if north >= 0 else "S", "deg": int(minute // 60), "min": int(minute % 60), "ew": "E" if east >= 0 else "W", "dist": distance}
+        for north, east, minute, distance in zip(dy.tolist(), dx.tolist(), minutes.tolist(), dist.tolist())]
+
+# A course as free text in the style of a title, e.g. "1-2 N 45°30' E, 120.50 m"
+def course_text(index, course):
+    return f"{index}-{index + 1} {course['ns']} {course['deg']}°{course['min']:02d}' {course['ew']}, {course['dist']:.2f} m"
+
+# Multi-lot CSV text of count lots, readable by ingest.py
+def lots_csv(count, tiepoints, rng):
+    stream = io.StringIO()
+    stream.write(",".join(ingest.COLUMNS) + "\n")
+    for lot in range(count):
+        tiepoint = tiepoints[lot % len(tiepoints)]["name"]
+        stream.writelines(f"LOT-{lot + 1},{tiepoint},{course['ns']},{course['deg']},{course['min']},{course['ew']},{course['dist']}\n"
+            for course in synthetic_courses(COURSES_PER_LOT, rng))
+    return stream.getvalue()
+
+# Lot dicts as the exporters take them (see exporters.lot_csv and the bulk exporters)
+def export_lots(count, courses_per_lot, tiepoints, rng):
+    lots = [(f"LOT-{lot + 1}", tiepoints[lot % len(tiepoints)], synthetic_courses(courses_per_lot, rng)) for lot in range(count)]
+    boundaries = lotplotter.calculate_boundaries([tiepoint for _, tiepoint, _ in lots], [courses for _, _, courses in lots])
+    areas, misclosures = lotplotter.calculate_areas_misclosures(boundaries)
+    results = []
+    for index, (lot_id, tiepoint, courses) in enumerate(lots):
+        lot_slice = slice(boundaries.offsets[index], boundaries.offsets[index + 1])
+        results.append({"lot_id": lot_id, "tiepoint": tiepoint["name"], "td_data": courses,
+            "points": list(zip(boundaries.x[lot_slice].tolist(), boundaries.y[lot_slice].tolist())),
+            "geographic": list(zip(boundaries.longitude[lot_slice].tolist(), boundaries.latitude[lot_slice].tolist())),
+            "area": float(areas[index]), "misclosure": float(misclosures[index])})
+    return results
+
+def read_lots_csv(text, tiepoints):
+    errors = []
+    lots = [lot for batch in ingest.batch_lots(ingest.read_lots(ingest.read_csv_chunks(io.StringIO(text))), tiepoints, 10000, errors) for lot in batch]
+    if errors:
+        raise ValueError(f"Synthetic lots failed to parse: {errors[:3]}")
+    return lots
+
+# Combined export to the null device, encoded as a file would be, so disk speed does not blur the exporter's own;
+# formats written as several files (encoding None) go to the directory
+def write_lots(fmt, lots, directory):
+    exporter = exporters.registry()[fmt]
+    path = os.path.join(directory, "lots" + exporter.extension) if exporter.encoding is None else os.devnull
+    exporters.write_lots(fmt, path, lots)
+
+# Random generator of one benchmark, seeded by its name, so its input does not depend on which other benchmarks ran
+def benchmark_rng(seed, key):
+    return np.random.default_rng([seed, zlib.crc32(key.encode("utf-8"))])
+
+# Yield the benchmarks as (name, unit, size, setup, run): setup builds the input from a random generator outside
+# the measurement and run takes it. Sizes above max_courses courses or max_lots lots are left out
+def benchmarks(seed, directory, max_courses, max_lots):
+    tiepoints = synthetic_tiepoints(36, benchmark_rng(seed, "tiepoints"))
+    course_sizes = [size for size in COURSE_SIZES if size <= max_courses]
+    lot_sizes = [size for size in LOT_SIZES if size <= max_lots]
+
+    for size in course_sizes:
+        yield "calculate_boundary", "courses", size, lambda rng, size=size: synthetic_courses(size, rng), lambda courses: lotplotter.calculate_boundary(tiepoints[0], courses)
+    for size in lot_sizes:
+        yield ("calculate_boundaries", "lots", size, lambda rng, size=size: [synthetic_courses(COURSES_PER_LOT, rng) for _ in range(size)],
+            lambda lots: lotplotter.calculate_boundaries([tiepoints[index % len(tiepoints)] for index in range(len(lots))], lots))
+    for size in course_sizes:
+        yield ("td_parser.parse", "courses", size, lambda rng, size=size: [course_text(index + 1, course) for index, course in enumerate(synthetic_courses(size, rng))],
+            lambda lines: list(td_parser.parse(lines)))
+    for size in lot_sizes:
+        yield "ingest.read_lots", "lots", size, lambda rng, size=size: lots_csv(size, tiepoints, rng), lambda text: read_lots_csv(text, tiepoints)
+    for size in lot_sizes:
+        yield "validate_json_format", "tiepoints", size, lambda rng, size=size: synthetic_tiepoints(size, rng), validate_json_format
+    for fmt in exporters.registry():
+        for size in course_sizes:
+            if size <= MAX_EXPORT_COURSES:
+                yield f"export.{fmt}", "courses", size, lambda rng, size=size: export_lots(1, size, tiepoints, rng)[0], lambda lot, fmt=fmt: exporters.render(fmt, lot)
+        if exporters.registry()[fmt].write_lots is None:
+            continue
+        for size in lot_sizes:
+            if size <= MAX_EXPORT_LOTS:
+                yield (f"export.{fmt}.lots", "lots", size, lambda rng, size=size: export_lots(size, COURSES_PER_LOT, tiepoints, rng),
+                    lambda lots, fmt=fmt: write_lots(fmt, lots, directory))
+
+# Best and median wall time of up to repeat runs (fewer once max_time has passed), with the garbage collector off
+# as timeit does, then the peak memory traced during one more run
+def measure(run, data, repeat, max_time):
+    times = []
+    gc.collect()
+    gc.disable()
+    try:
+        while len(times) < repeat and sum(times) < max_time:
+            started = time.perf_counter()
+            run(data)
+            times.append(time.perf_counter() - started)
+    finally:
+        gc.enable()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run(data)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(times), "median": statistics.median(times), "runs": len(times), "peak_bytes": peak}
+
+def run_benchmarks(args):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, unit, size, setup, run in benchmarks(args.seed, directory, args.max_courses, args.max_lots):
+            key = f"{name}/{size}"
+            if args.filter and not any(pattern in key for pattern in args.filter):
+                continue
+            result = dict(measure(run, setup(benchmark_rng(args.seed, key)), args.repeat, args.max_time), benchmark=name, unit=unit, size=size)
+            results[key] = result
+            print(f"{key:<36} {result['seconds'] * 1000:>11.3f} ms {result['peak_bytes'] / 1048576:>10.2f} MiB  ({size / result['seconds']:,.0f} {unit}/s)", file=sys.stderr)
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "results": results,
+    }
+
+# Compare results with a baseline report, returning (rows, regressions) where each row is
+# (key, baseline seconds, seconds, time ratio, baseline peak, peak, memory ratio, status)
+def compare(report, baseline, threshold):
+    rows = []
+    regressions = 0
+    for key, result in report["results"].items():
+        old = baseline["results"].get(key)
+        if old is None:
+            rows.append((key, None, result["seconds"], None, None, result["peak_bytes"], None, "new"))
+            continue
+        time_ratio = result["seconds"] / old["seconds"] if old["seconds"] else math.inf
+        memory_ratio = result["peak_bytes"] / old["peak_bytes"] if old["peak_bytes"] else math.inf
+        status = []
+        if time_ratio > 1 + threshold and result["seconds"] - old["seconds"] > MIN_SECONDS:
+            status.append("slower")
+        if memory_ratio > 1 + threshold and result["peak_bytes"] - old["peak_bytes"] > MIN_BYTES:
+            status.append("more memory")
+        if not status and time_ratio < 1 / (1 + threshold) and old["seconds"] - result["seconds"] > MIN_SECONDS:
+            status.append("faster")
+        regressions += "slower" in status or "more memory" in status
+        rows.append((key, old["seconds"], result["seconds"], time_ratio, old["peak_bytes"], result["peak_bytes"], memory_ratio, ", ".join(status)))
+    return rows, regressions
+
+def print_comparison(rows, stream):
+    print(f"{'benchmark':<36} {'baseline ms':>12} {'ms':>12} {'ratio':>7} {'baseline MiB':>13} {'MiB':>10} {'ratio':>7}  status", file=stream)
+    for key, old_seconds, seconds, time_ratio, old_peak, peak, memory_ratio, status in rows:
+        print(f"{key:<36} {'' if old_seconds is None else f'{old_seconds * 1000:.3f}':>12} {seconds * 1000:>12.3f} {'' if time_ratio is None else f'{time_ratio:.2f}':>7} "
+            f"{'' if old_peak is None else f'{old_peak / 1048576:.2f}':>13} {peak / 1048576:>10.2f} {'' if memory_ratio is None else f'{memory_ratio:.2f}':>7}  {status}", file=stream)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the boundary engine, parsers, tiepoint validation and exporters on generated lots.")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file (default: standard output)")
+    parser.add_argument("-b", "--baseline", help="compare the results with this earlier JSON results file and exit with 1 on any regression")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative growth of time or peak memory counted as a regression (default: 0.2)")
+    parser.add_argument("-k", "--filter", action="append", help="run only benchmarks whose name/size contains this text (repeatable)")
+    parser.add_argument("--max-courses", type=int, default=max(COURSE_SIZES), help=f"largest lot in courses (default: {max(COURSE_SIZES)})")
+    parser.add_argument("--max-lots", type=int, default=max(LOT_SIZES), help=f"largest batch in lots (default: {max(LOT_SIZES)})")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="timed runs per benchmark, of which the best is reported (default: 5)")
+    parser.add_argument("--max-time", type=float, default=5.0, help="stop repeating a benchmark after this many seconds (default: 5)")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the generated inputs (default: 1)")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        rows, regressions = compare(report, baseline, args.threshold)
+        print_comparison(rows, sys.stderr)
+        print(f"{regressions} of {len(rows)} benchmarks regressed by more than {args.threshold:.0%}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+# Thread-safe LRU cache bounded by entry count and total bytes
+class LRUCache:
+    def __init__(self, max_entries=1024, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        with self.lock:
+            # Values larger than the whole cache are not kept
+            if nbytes > self.max_bytes:
+                return value
+            if key in self.entries:
+                self.bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, nbytes)
+            self.bytes += nbytes
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self.entries.popitem(last=False)
+                self.bytes -= evicted_bytes
+                self.evictions += 1
+            return value
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+# Stable content hash of a technical description
+def technical_description_key(technical_description):
+    digest = hashlib.blake2b(digest_size=16)
+    for array in technical_description.arrays():
+        digest.update(array.tobytes())
+        digest.update(b"|")
+    return digest.hexdigest()
+
+# Stable content hash of a tiepoint record, a technical description and the tieline/adjustment settings
+def boundary_key(tiepoint, technical_description, show_tieline, x_adjustment, y_adjustment, compass_rule=False):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps(tiepoint, sort_keys=True).encode("utf-8"))
+    digest.update(technical_description_key(technical_description).encode("utf-8"))
+    digest.update(json.dumps([bool(show_tieline), float(x_adjustment), float(y_adjustment), bool(compass_rule)]).encode("utf-8"))
+    return digest.hexdigest()
+
+# Cache arrays read-only so sessions sharing them cannot modify each other's results
+def freeze(arrays):
+    for array in arrays:
+        array.flags.writeable = False
+    return arrays, sum(array.nbytes for array in arrays)
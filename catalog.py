@@ -0,0 +1,179 @@
+import json
+import os
+import sqlite3
+import threading
+
+# Columns of the tiepoints table, in the order rows are read back
+COLUMNS = ["name", "northing", "easting", "lat_deg", "lat_min", "lat_sec", "lon_deg", "lon_min", "lon_sec", "k_latitude", "k_longitude"]
+
+# Define a function to validate the structure of the JSON data
+def validate_json_format(data):
+    # Expected keys for each tiepoint entry
+    required_keys = ["name", "northing", "easting", "latitude", "longitude", "k_latitude", "k_longitude"]
+
+    # Check if the data is a list
+    if not isinstance(data, list):
+        return False, "The JSON should be a list of tiepoint entries."
+
+    # Check each tiepoint entry for the required keys and data types
+    for idx, item in enumerate(data):
+        if not isinstance(item, dict):
+            return False, f"Entry {idx + 1} is not a dictionary."
+
+        # Check for required keys
+        for key in required_keys:
+            if key not in item:
+                return False, f"Missing key '{key}' in entry {idx + 1}."
+
+        # Check the data types of the fields
+        if not isinstance(item["name"], str):
+            return False, f"Invalid type for 'name' in entry {idx + 1}. Expected string."
+        if not isinstance(item["northing"], (int, float)):
+            return False, f"Invalid type for 'northing' in entry {idx + 1}. Expected number."
+        if not isinstance(item["easting"], (int, float)):
+            return False, f"Invalid type for 'easting' in entry {idx + 1}. Expected number."
+
+        # Validate latitude and longitude subfields (assuming they should be dictionaries with degrees, minutes, and seconds)
+        latitude = item.get("latitude", {})
+        if not isinstance(latitude, dict) or not all(k in latitude for k in ["deg", "min", "sec"]):
+            return False, f"Invalid format for 'latitude' in entry {idx + 1}."
+
+        longitude = item.get("longitude", {})
+        if not isinstance(longitude, dict) or not all(k in longitude for k in ["deg", "min", "sec"]):
+            return False, f"Invalid format for 'longitude' in entry {idx + 1}."
+
+        # Degrees, minutes and seconds must be numbers
+        for key in ["latitude", "longitude"]:
+            if not all(isinstance(item[key][k], (int, float)) for k in ["deg", "min", "sec"]):
+                return False, f"Invalid type in '{key}' in entry {idx + 1}. Expected numbers."
+
+        # Ensure k_latitude and k_longitude are numbers
+        if not isinstance(item["k_latitude"], (int, float)):
+            return False, f"Invalid type for 'k_latitude' in entry {idx + 1}. Expected number."
+        if not isinstance(item["k_longitude"], (int, float)):
+            return False, f"Invalid type for 'k_longitude' in entry {idx + 1}. Expected number."
+
+    return True, "The JSON format is valid."
+
+# Flatten a tiepoint dict into a table row
+def to_row(tiepoint):
+    return (tiepoint["name"], tiepoint["northing"], tiepoint["easting"],
+        tiepoint["latitude"]["deg"], tiepoint["latitude"]["min"], tiepoint["latitude"]["sec"],
+        tiepoint["longitude"]["deg"], tiepoint["longitude"]["min"], tiepoint["longitude"]["sec"],
+        tiepoint["k_latitude"], tiepoint["k_longitude"])
+
+# Rebuild a tiepoint dict (same shape as tiepoints.json) from a table row
+def from_row(row):
+    return {
+        "name": row[0],
+        "northing": row[1],
+        "easting": row[2],
+        "latitude": {"deg": row[3], "min": row[4], "sec": row[5]},
+        "longitude": {"deg": row[6], "min": row[7], "sec": row[8]},
+        "k_latitude": row[9],
+        "k_longitude": row[10],
+    }
+
+# Escape LIKE wildcards in user input
+def like_escape(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+# Build (or rebuild, when the JSON is newer) the SQLite catalog next to the JSON file
+def build_catalog(json_path, db_path):
+    if os.path.exists(db_path) and os.path.getmtime(db_path) >= os.path.getmtime(json_path):
+        return db_path
+    with open(json_path, "r") as file:
+        tiepoints = json.load(file)
+    is_valid, message = validate_json_format(tiepoints)
+    if not is_valid:
+        raise ValueError(message)
+
+    # Write to a temporary file and swap it in, so other processes never see a half-built catalog
+    temp_path = f"{db_path}.{os.getpid()}.tmp"
+    connection = sqlite3.connect(temp_path)
+    try:
+        connection.execute(f"CREATE TABLE tiepoints (id INTEGER PRIMARY KEY, name TEXT COLLATE NOCASE, {', '.join(f'{column} NUMERIC' for column in COLUMNS[1:])})")
+        connection.executemany(f"INSERT INTO tiepoints ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", (to_row(tiepoint) for tiepoint in tiepoints))
+        connection.execute("CREATE INDEX tiepoints_name ON tiepoints (name)")
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(temp_path, db_path)
+    return db_path
+
+# Read-only tiepoint catalog shared by every session of the process
+class TiepointCatalog:
+    def __init__(self, db_path):
+        self.connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.size = self._query("SELECT COUNT(*) FROM tiepoints")[0][0]
+
+    def _query(self, sql, parameters=()):
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def __len__(self):
+        return self.size
+
+    # Names containing every word of text, minus the excluded names
+    def _where(self, text, exclude):
+        words = text.split()
+        conditions = ["name LIKE ? ESCAPE '\\'" for _ in words]
+        parameters = [f"%{like_escape(word)}%" for word in words]
+        if exclude:
+            conditions.append(f"name NOT IN ({', '.join('?' * len(exclude))})")
+            parameters.extend(exclude)
+        return " AND ".join(conditions) or "1", parameters
+
+    # Matching tiepoints, names starting with text first
+    def search(self, text="", offset=0, limit=50, exclude=()):
+        where, parameters = self._where(text, exclude)
+        rows = self._query(
+            f"SELECT {', '.join(COLUMNS)} FROM tiepoints WHERE {where} ORDER BY name NOT LIKE ? ESCAPE '\\', name LIMIT ? OFFSET ?",
+            parameters + [f"{like_escape(text.strip())}%", limit, offset])
+        return [from_row(row) for row in rows]
+
+    def count(self, text="", exclude=()):
+        where, parameters = self._where(text, exclude)
+        return self._query(f"SELECT COUNT(*) FROM tiepoints WHERE {where}", parameters)[0][0]
+
+    def get(self, name):
+        rows = self._query(f"SELECT {', '.join(COLUMNS)} FROM tiepoints WHERE name = ? LIMIT 1", (name,))
+        return from_row(rows[0]) if rows else None
+
+    # Every tiepoint, in catalog order
+    def all(self):
+        return [from_row(row) for row in self._query(f"SELECT {', '.join(COLUMNS)} FROM tiepoints ORDER BY id")]
+
+# A user's imported tiepoints layered over the shared catalog; overlay entries shadow base entries of the same name
+class CatalogView:
+    def __init__(self, base, overlay=()):
+        self.base = base
+        self.overlay = list(overlay)
+        self.overlay_names = sorted({tiepoint["name"] for tiepoint in self.overlay})
+
+    def _overlay_matches(self, text):
+        words = text.lower().split()
+        prefix = text.strip().lower()
+        matches = [tiepoint for tiepoint in self.overlay if all(word in tiepoint["name"].lower() for word in words)]
+        return sorted(matches, key=lambda tiepoint: (not tiepoint["name"].lower().startswith(prefix), tiepoint["name"].lower()))
+
+    def search(self, text="", offset=0, limit=50):
+        overlay = self._overlay_matches(text)
+        results = overlay[offset:offset + limit]
+        if len(results) < limit:
+            results += self.base.search(text, max(0, offset - len(overlay)), limit - len(results), exclude=self.overlay_names)
+        return results
+
+    def count(self, text=""):
+        return len(self._overlay_matches(text)) + self.base.count(text, exclude=self.overlay_names)
+
+    def get(self, name):
+        for tiepoint in self.overlay:
+            if tiepoint["name"] == name:
+                return tiepoint
+        return self.base.get(name)
+
+    def all(self):
+        names = set(self.overlay_names)
+        return self.overlay + [tiepoint for tiepoint in self.base.all() if tiepoint["name"] not in names]
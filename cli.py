@@ -0,0 +1,211 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import lotplotter
+import exporters
+import ingest
+import parcels
+import overlaps
+
+# Expand the input arguments into multi-lot CSV/Parquet file paths
+def input_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith((".csv", ".parquet"))))
+        else:
+            files.append(path)
+    return files
+
+# Columns of the closure QA report
+QA_COLUMNS = ["lot_id", "tiepoint", "corners", "perimeter", "misclosure", "precision", "area", "flagged"]
+
+# Worker: compute a chunk of lots and write one file per lot, or return the lots for a combined output,
+# along with the closure QA rows of the lots (as computed, before any adjustment)
+def process_work_unit(lots, fmt, output_dir, combined, min_precision=lotplotter.MIN_PRECISION, adjust=False):
+    start = time.perf_counter()
+    tiepoints = [tiepoint for _, tiepoint, _ in lots]
+    boundaries = lotplotter.calculate_boundaries(tiepoints, [courses for _, _, courses in lots])
+    closures = lotplotter.check_closures(boundaries, min_precision)
+    qa_rows = [[lot_id, tiepoint["name"], int(corners), round(float(perimeter), 3), round(float(misclosure), 3), round(float(precision), 1), round(float(area), 3), bool(flagged)]
+        for (lot_id, tiepoint, _), corners, perimeter, misclosure, precision, area, flagged in zip(lots, np.diff(boundaries.offsets),
+            closures.perimeter, closures.misclosure, closures.precision, closures.area, closures.flagged)]
+    if adjust:
+        boundaries = lotplotter.adjust_compass_rule(boundaries, tiepoints)
+        areas, misclosures = lotplotter.calculate_areas_misclosures(boundaries)
+    else:
+        areas, misclosures = closures.area, closures.misclosure
+    compute_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = []
+    for index, (lot_id, tiepoint, courses) in enumerate(lots):
+        lot_slice = slice(boundaries.offsets[index], boundaries.offsets[index + 1])
+        points = list(zip(boundaries.x[lot_slice].tolist(), boundaries.y[lot_slice].tolist()))
+        geographic = list(zip(boundaries.longitude[lot_slice].tolist(), boundaries.latitude[lot_slice].tolist()))
+        lot = {"lot_id": lot_id, "tiepoint": tiepoint["name"], "td_data": courses, "points": points,
+            "geographic": geographic, "area": float(areas[index]), "misclosure": float(misclosures[index])}
+        if combined:
+            results.append(lot)
+            continue
+        content = exporters.render(fmt, lot)
+        path = os.path.join(output_dir, exporters.safe_file_name(lot_id) + exporters.registry()[fmt].extension)
+        with open(path, "w", encoding="utf-8", newline="") if isinstance(content, str) else open(path, "wb") as file:
+            file.write(content)
+    export_time = time.perf_counter() - start
+
+    return len(lots), compute_time, export_time, results, qa_rows
+
+# Submit work units with a bounded number in flight and yield their lots in input order,
+# writing the QA rows to qa_writer (a csv writer) as the units finish
+def run_work_units(executor, work_units, fmt, output_dir, combined, workers, totals, qa_writer=None, min_precision=lotplotter.MIN_PRECISION, adjust=False):
+    pending = deque()
+
+    def collect(future):
+        start = time.perf_counter()
+        count, compute, export, results, qa_rows = future.result()
+        totals["wait"] += time.perf_counter() - start
+        totals["lots"] += count
+        totals["compute"] += compute
+        totals["export"] += export
+        totals["flagged"] += sum(row[-1] for row in qa_rows)
+        if qa_writer is not None:
+            qa_writer.writerows(qa_rows)
+        return results
+
+    for work_unit in work_units:
+        # Keep reading only a little ahead of the workers so memory stays bounded
+        if len(pending) >= 2 * workers:
+            yield from collect(pending.popleft())
+        pending.append(executor.submit(process_work_unit, work_unit, fmt, output_dir, combined, min_precision, adjust))
+    while pending:
+        yield from collect(pending.popleft())
+
+# Compute every lot in this process (the engine is vectorized) and write map tiles for the server's parcel layer
+def write_tiles(args, tiepoints):
+    min_zoom, _, max_zoom = args.zooms.partition("-")
+    started = time.perf_counter()
+    errors = []
+    parcel_set = parcels.read_parcels(ingest.read_sources(input_files(args.inputs)), tiepoints, errors)
+    tile_count = parcel_set.write_tiles(args.output, int(min_zoom), int(max_zoom or min_zoom))
+    elapsed = time.perf_counter() - started
+    for lot_id, error in errors:
+        print(f"Skipped lot {lot_id}: {error}", file=sys.stderr)
+    print(f"Lots: {len(parcel_set)} processed, {len(errors)} skipped, {tile_count} tiles written in {elapsed:.2f}s")
+    return 1 if errors and not len(parcel_set) else 0
+
+# Compute every lot in this process and write the overlapping and gapped pairs as a CSV table and a GeoJSON layer
+def write_overlaps(args, tiepoints):
+    csv_path = args.output if os.path.splitext(args.output)[1] else args.output + ".csv"
+    os.makedirs(os.path.dirname(csv_path) or ".", exist_ok=True)
+    started = time.perf_counter()
+    errors = []
+    parcel_set = parcels.read_parcels(ingest.read_sources(input_files(args.inputs)), tiepoints, errors)
+    rows, data = overlaps.find_overlaps_gaps(parcel_set, args.min_area, args.max_gap)
+    with open(csv_path, "w", encoding="utf-8", newline="") as stream:
+        writer = csv.DictWriter(stream, fieldnames=["kind", "lot_id", "other_lot_id", "area", "percent", "latitude", "longitude"])
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(os.path.splitext(csv_path)[0] + ".geojson", "w", encoding="utf-8") as file:
+        json.dump(data, file, separators=(",", ":"))
+    elapsed = time.perf_counter() - started
+    for lot_id, error in errors:
+        print(f"Skipped lot {lot_id}: {error}", file=sys.stderr)
+    overlap_count = sum(row["kind"] == "overlap" for row in rows)
+    print(f"Lots: {len(parcel_set)} processed, {len(errors)} skipped, {overlap_count} overlaps and {len(rows) - overlap_count} gaps found in {elapsed:.2f}s")
+    return 1 if errors and not len(parcel_set) else 0
+
+# Compute every lot in this process, streaming the corners of every input file into one Parquet file
+# (ingest.OUTPUT_SCHEMA) that the server can show as its parcel layer
+def write_corners(args, tiepoints):
+    output_path = args.output if os.path.splitext(args.output)[1] else args.output + ".parquet"
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    started = time.perf_counter()
+    errors = []
+    lot_count, corner_count = ingest.ingest(input_files(args.inputs), output_path, tiepoints, args.chunk_size, errors=errors, compass_rule=args.adjust)
+    elapsed = time.perf_counter() - started
+    for lot_id, error in errors:
+        print(f"Skipped lot {lot_id}: {error}", file=sys.stderr)
+    print(f"Lots: {lot_count} processed, {len(errors)} skipped, {corner_count} corners written to {output_path} in {elapsed:.2f}s")
+    return 1 if errors and not lot_count else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute and export lot boundaries from multi-lot technical description files.")
+    parser.add_argument("inputs", nargs="+", help="multi-lot CSV/Parquet files or directories containing them")
+    parser.add_argument("-t", "--tiepoints", default="tiepoints.json", help="tiepoint catalog JSON (default: tiepoints.json)")
+    parser.add_argument("-f", "--format", choices=sorted(exporters.registry()) + ["parquet", "tiles", "overlaps"], default="dxf",
+        help="output format; parquet writes the corners of every lot to the output Parquet file, tiles writes pre-simplified GeoJSON map tiles into the output directory, overlaps writes the overlapping and gapped lot pairs to the output CSV file and a GeoJSON file next to it (default: dxf)")
+    parser.add_argument("-o", "--output", default="output", help="output directory, or output file with --combined (default: output)")
+    parser.add_argument("--combined", action="store_true", help="write all lots into one output file")
+    parser.add_argument("--polygons", action="store_true", help="write lots as polygons in a combined shapefile")
+    parser.add_argument("--min-area", type=float, default=overlaps.MIN_AREA, help=f"smallest overlap or gap reported by the overlaps format, in square meters (default: {overlaps.MIN_AREA:g})")
+    parser.add_argument("--max-gap", type=float, default=overlaps.MAX_GAP, help=f"widest gap between neighbouring lots reported by the overlaps format, in meters (default: {overlaps.MAX_GAP:g})")
+    parser.add_argument("--zooms", default="12-18", help="zoom levels of the tiles format, as min-max (default: 12-18)")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help="worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=256, help="lots per work unit (default: 256)")
+    parser.add_argument("--qa", metavar="PATH", help="write a closure report (perimeter, misclosure, relative precision, area) of every lot to this CSV file")
+    parser.add_argument("--min-precision", type=int, default=lotplotter.MIN_PRECISION, help=f"flag lots whose relative precision is below 1:N (default: {lotplotter.MIN_PRECISION})")
+    parser.add_argument("--adjust", action="store_true", help="export lots adjusted by the compass rule so every lot closes")
+    args = parser.parse_args(argv)
+
+    with open(args.tiepoints, "r") as file:
+        tiepoints = json.load(file)
+
+    if args.format == "parquet":
+        return write_corners(args, tiepoints)
+    if args.format == "tiles":
+        return write_tiles(args, tiepoints)
+    if args.format == "overlaps":
+        return write_overlaps(args, tiepoints)
+
+    if args.combined and exporters.registry()[args.format].write_lots is None:
+        parser.error(f"the {args.format} format cannot be combined into one file")
+    if args.combined:
+        output_dir = os.path.dirname(args.output) or "."
+        output_path = args.output if os.path.splitext(args.output)[1] else args.output + exporters.registry()[args.format].extension
+    else:
+        output_dir = args.output
+    os.makedirs(output_dir, exist_ok=True)
+
+    started = time.perf_counter()
+    errors = []
+    totals = {"lots": 0, "compute": 0.0, "export": 0.0, "wait": 0.0, "flagged": 0}
+
+    work_units = ingest.batch_lots(ingest.read_lots(ingest.read_sources(input_files(args.inputs))), tiepoints, args.chunk_size, errors)
+    write_time = 0.0
+    qa_file = open(args.qa, "w", encoding="utf-8", newline="") if args.qa else None
+    try:
+        qa_writer = None
+        if qa_file is not None:
+            qa_writer = csv.writer(qa_file)
+            qa_writer.writerow(QA_COLUMNS)
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            lots = run_work_units(executor, work_units, args.format, output_dir, args.combined, args.workers, totals, qa_writer, args.min_precision, args.adjust)
+            if args.combined:
+                start = time.perf_counter()
+                exporters.write_lots(args.format, output_path, lots, args.polygons)
+                write_time = time.perf_counter() - start - totals["wait"]
+            else:
+                for _ in lots:
+                    pass
+    finally:
+        if qa_file is not None:
+            qa_file.close()
+
+    elapsed = time.perf_counter() - started
+    lot_count = totals["lots"]
+    for lot_id, error in errors:
+        print(f"Skipped lot {lot_id}: {error}", file=sys.stderr)
+    print(f"Lots: {lot_count} processed, {len(errors)} skipped in {elapsed:.2f}s ({lot_count / elapsed if elapsed else 0:.1f} lots/s)")
+    print(f"Closure: {totals['flagged']} lots below 1:{args.min_precision}" + (f", report written to {args.qa}" if args.qa else ""))
+    print(f"Compute: {totals['compute']:.2f}s, Export: {totals['export']:.2f}s (summed across {args.workers} workers), Combined write: {write_time:.2f}s")
+    return 1 if errors and not lot_count else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+import io
+import csv
+import datetime
+import functools
+import importlib
+import os
+import re
+import zipfile
+from collections import namedtuple
+from xml.sax.saxutils import escape
+
+# ezdxf, simplekml and shapefile take most of this module's import time and only matter to someone exporting,
+# so each is imported by the first function that needs it
+
+# Function to generate CSV content as a string
+def generate_csv(td_data):
+    with io.StringIO() as output:
+        writer = csv.DictWriter(output, fieldnames=["ns", "deg", "min", "ew", "dist"])
+        writer.writerow({"ns": "NS", "deg": "Deg", "min": "Min", "ew": "EW", "dist": "Dist"})
+        writer.writerows(td_data)
+        return output.getvalue()
+
+def generate_dxf(points):
+    import ezdxf
+    # Create a new DXF document with DXF version R2004
+    doc = ezdxf.new(dxfversion='R2004')
+    msp = doc.modelspace()
+
+    # Create a polyline from the provided coordinates
+    msp.add_lwpolyline(points)
+
+    # Write DXF straight to bytes, without an intermediate string copy
+    byte_stream = io.BytesIO()
+    with io.TextIOWrapper(byte_stream, encoding=doc.output_encoding, errors="dxfreplace", newline="") as text_stream:
+        doc.write(text_stream)
+        text_stream.flush()
+        return byte_stream.getvalue()
+
+def generate_kml(geographic):
+    import simplekml
+    kml = simplekml.Kml()
+    # Add a line connecting the points
+    line = kml.newlinestring(name="Path", coords=geographic)
+
+    line.style.linestyle.color = "ffff00ff"  # Magenta color
+    line.style.linestyle.width = 5  # Thickness of the line
+
+    # If you need to return the KML as a string:
+    return kml.kml()
+
+# WGS 84 geographic coordinate system, written as the shapefile's .prj
+WGS84_PRJ = 'GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137.0,298.257223563]],PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]]'
+
+# A lot is closed when its last corner returns to its first within the tolerance (in grid units)
+def is_closed(points, tolerance=0.5):
+    if len(points) < 4:
+        return False
+    return ((points[-1][0] - points[0][0]) ** 2 + (points[-1][1] - points[0][1]) ** 2) ** 0.5 <= tolerance
+
+# Closed ring of a lot, clockwise as the shapefile specification expects for outer rings
+def polygon_ring(coords):
+    ring = list(coords[:-1]) + [coords[0]]
+    signed_area = sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(ring, ring[1:]))
+    return ring[::-1] if signed_area > 0 else ring
+
+# Write the shapes into in-memory .shp/.shx/.dbf buffers and zip them with a .prj
+def zip_shapefile(shapes, polygon=False):
+    import shapefile
+    shp, shx, dbf = io.BytesIO(), io.BytesIO(), io.BytesIO()
+    writer = shapefile.Writer(shp=shp, shx=shx, dbf=dbf, shapeType=shapefile.POLYGON if polygon else shapefile.POLYLINE)
+    writer.field('NAME', 'C', '40')
+    for name, coords in shapes:
+        if polygon:
+            writer.poly([polygon_ring(coords)])
+        else:
+            writer.line([coords])
+        writer.record(name)
+    writer.close()
+
+    base_name = f"Lotplotter_{datetime.datetime.now():%Y%m%d_%H%M%S}"
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
+        zip_file.writestr(base_name + '.shp', shp.getvalue())
+        zip_file.writestr(base_name + '.shx', shx.getvalue())
+        zip_file.writestr(base_name + '.dbf', dbf.getvalue())
+        zip_file.writestr(base_name + '.prj', WGS84_PRJ)
+    zip_buffer.seek(0)
+    return zip_buffer
+
+# Zipped shapefile of one lot: a polygon when polygon is set (closed lots), otherwise a polyline
+def generate_shp(geographic, polygon=False):
+    return zip_shapefile([('Path', geographic)], polygon)
+
+# Bulk exporters: each takes an iterable of lot dicts with lot_id, tiepoint (name), td_data, points,
+# geographic, area and misclosure, and writes lots to the output as they arrive
+
+# Technical descriptions of many lots as one multi-lot CSV, readable by ingest.py
+def write_csv_lots(stream, lots):
+    writer = csv.writer(stream)
+    writer.writerow(["Lot ID", "Tiepoint", "NS", "Deg", "Min", "EW", "Dist"])
+    for lot in lots:
+        writer.writerows([lot["lot_id"], lot["tiepoint"], line["ns"], line["deg"], line["min"], line["ew"], line["dist"]] for line in lot["td_data"])
+
+# Application name of the lot attributes stored as DXF extended data
+DXF_APPID = "LOTPLOTTER"
+
+# Make a lot id safe to use as a file name
+def safe_file_name(lot_id):
+    return re.sub(r"[^\w.-]+", "_", lot_id).strip("._") or "lot"
+
+# Characters not allowed in DXF layer names
+def dxf_layer_name(lot_id):
+    return re.sub(r'[<>/\\":;?*|=`,]', "_", str(lot_id))[:255] or "0"
+
+# One polyline per lot on its own layer, written as a minimal DXF R12 file entity by entity
+def write_dxf_lots(stream, lots):
+    stream.write("0\nSECTION\n2\nHEADER\n9\n$ACADVER\n1\nAC1009\n0\nENDSEC\n")
+    stream.write(f"0\nSECTION\n2\nTABLES\n0\nTABLE\n2\nAPPID\n70\n1\n0\nAPPID\n2\n{DXF_APPID}\n70\n0\n0\nENDTAB\n0\nENDSEC\n")
+    stream.write("0\nSECTION\n2\nENTITIES\n")
+    for lot in lots:
+        layer = dxf_layer_name(lot["lot_id"])
+        stream.write(f"0\nPOLYLINE\n8\n{layer}\n66\n1\n10\n0.0\n20\n0.0\n30\n0.0\n70\n0\n")
+        stream.write(f"1001\n{DXF_APPID}\n1000\n{str(lot['lot_id'])[:255]}\n1000\n{lot['tiepoint'][:255]}\n1040\n{lot['area']!r}\n1040\n{lot['misclosure']!r}\n")
+        stream.write("".join(f"0\nVERTEX\n8\n{layer}\n10\n{x!r}\n20\n{y!r}\n30\n0.0\n" for x, y in lot["points"]))
+        stream.write(f"0\nSEQEND\n8\n{layer}\n")
+    stream.write("0\nENDSEC\n0\nEOF\n")
+
+# One folder per lot holding the lot's line, with the lot attributes as ExtendedData
+def write_kml_lots(stream, lots):
+    stream.write('<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="http://www.opengis.net/kml/2.2"><Document>')
+    stream.write('<Style id="lot"><LineStyle><color>ffff00ff</color><width>5</width></LineStyle></Style>')
+    for lot in lots:
+        name = escape(str(lot["lot_id"]))
+        stream.write(f"<Folder><name>{name}</name><Placemark><name>{name}</name><styleUrl>#lot</styleUrl><ExtendedData>")
+        stream.write(f'<Data name="lot_id"><value>{name}</value></Data>')
+        stream.write(f'<Data name="tiepoint"><value>{escape(lot["tiepoint"])}</value></Data>')
+        stream.write(f'<Data name="area"><value>{lot["area"]:.3f}</value></Data>')
+        stream.write(f'<Data name="misclosure"><value>{lot["misclosure"]:.4f}</value></Data>')
+        stream.write("</ExtendedData><LineString><coordinates>")
+        stream.write(" ".join(f"{longitude!r},{latitude!r}" for longitude, latitude in lot["geographic"]))
+        stream.write("</coordinates></LineString></Placemark></Folder>")
+    stream.write("</Document></kml>\n")
+
+# One record per lot with the lot attributes as DBF fields; polygons for closed lots when polygon is set.
+# shp, shx and dbf are file paths or seekable binary streams, written record by record.
+def write_shp_lots(shp, shx, dbf, lots, polygon=False):
+    import shapefile
+    writer = shapefile.Writer(shp=shp, shx=shx, dbf=dbf, shapeType=shapefile.POLYGON if polygon else shapefile.POLYLINE)
+    writer.field('LOT_ID', 'C', '40')
+    writer.field('TIEPOINT', 'C', '100')
+    writer.field('AREA', 'N', 18, 3)
+    writer.field('MISCLOSE', 'N', 12, 4)
+    for lot in lots:
+        if polygon:
+            writer.poly([polygon_ring(lot["geographic"])])
+        else:
+            writer.line([lot["geographic"]])
+        writer.record(str(lot["lot_id"])[:40], lot["tiepoint"][:100], lot["area"], lot["misclosure"])
+    writer.close()
+
+# Write the bulk shapefile next to base_path, then stream the files into a zip archive
+def write_shp_zip(zip_path, lots, polygon=False):
+    base_path = os.path.splitext(zip_path)[0]
+    paths = [base_path + ext for ext in ('.shp', '.shx', '.dbf', '.prj')]
+    with open(paths[0], 'wb') as shp, open(paths[1], 'wb') as shx, open(paths[2], 'wb') as dbf:
+        write_shp_lots(shp, shx, dbf, lots, polygon)
+    with open(paths[3], 'w') as prj:
+        prj.write(WGS84_PRJ)
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for path in paths:
+            zip_file.write(path, arcname=os.path.basename(path))
+            os.remove(path)
+
+# Single-lot exporters: each takes a lot dict with lot_id, tiepoint (name), td_data, points and geographic, and
+# tieline when the first corner is the tiepoint, and returns the file content as text or bytes
+
+def lot_csv(lot):
+    return generate_csv(lot["td_data"])
+
+def lot_dxf(lot):
+    return generate_dxf(lot["points"])
+
+def lot_kml(lot):
+    return generate_kml(lot["geographic"])
+
+# Closed lots are exported as a polygon of the lot corners (without the tieline), others as a polyline
+def lot_shp(lot):
+    start = 1 if lot.get("tieline") else 0
+    if is_closed(lot["points"][start:]):
+        return generate_shp(lot["geographic"][start:], polygon=True).getvalue()
+    return generate_shp(lot["geographic"]).getvalue()
+
+# An export format. render and write_lots name their functions as "module:function", imported on first use;
+# write_lots (optional, for combined multi-lot files) takes a text stream in the given encoding, or the output
+# path and the polygon option when encoding is None. boundary is False for formats that need only the courses
+Exporter = namedtuple("Exporter", ["name", "label", "extension", "mime", "render", "write_lots", "encoding", "boundary"])
+
+EXPORTERS = {}
+
+# Environment variable listing extra exporter plugin modules (comma separated) that call register on import
+PLUGINS_VARIABLE = "LOTPLOTTER_EXPORTERS"
+
+def register(name, label, extension, mime, render, write_lots=None, encoding="utf-8", boundary=True):
+    EXPORTERS[name] = Exporter(name, label, extension, mime, render, write_lots, encoding, boundary)
+
+# Every registered exporter by name, in registration order, once the plugin modules have registered theirs
+def registry():
+    load_plugins()
+    return EXPORTERS
+
+@functools.lru_cache(maxsize=None)
+def load_plugins():
+    for module_name in filter(None, (name.strip() for name in os.environ.get(PLUGINS_VARIABLE, "").split(","))):
+        importlib.import_module(module_name)
+
+@functools.lru_cache(maxsize=None)
+def load(target):
+    module_name, _, function_name = target.partition(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+# Export one lot dict in a format
+def render(name, lot):
+    return load(registry()[name].render)(lot)
+
+# Write many lot dicts (see the bulk exporters) into one file in a format
+def write_lots(name, path, lots, polygon=False):
+    exporter = registry()[name]
+    if exporter.write_lots is None:
+        raise ValueError(f"The {exporter.label} format cannot hold many lots in one file.")
+    write = load(exporter.write_lots)
+    if exporter.encoding is None:
+        write(path, lots, polygon)
+    else:
+        with open(path, "w", encoding=exporter.encoding, errors="replace", newline="") as stream:
+            write(stream, lots)
+
+register("csv", "CSV", ".csv", "text/csv", "exporters:lot_csv", "exporters:write_csv_lots", boundary=False)
+register("dxf", "DXF", ".dxf", "application/dxf", "exporters:lot_dxf", "exporters:write_dxf_lots", encoding="cp1252")
+register("kml", "KML", ".kml", "application/vnd.google-earth.kml+xml", "exporters:lot_kml", "exporters:write_kml_lots")
+register("shp", "SHP", ".zip", "application/zip", "exporters:lot_shp", "exporters:write_shp_zip", encoding=None)
+register("geojson", "GeoJSON", ".geojson", "application/geo+json", "geojson_export:lot_geojson", "geojson_export:write_geojson_lots")
@@ -0,0 +1,28 @@
+import json
+from exporters import is_closed
+
+# GeoJSON exporter plugin (registered in exporters.py). Coordinates are longitude/latitude as RFC 7946 expects
+
+# Closed lots as a polygon of the lot corners (without the tieline), others as a line string
+def lot_geometry(points, geographic, tieline=False):
+    start = 1 if tieline else 0
+    if is_closed(points[start:]):
+        ring = [list(coordinate) for coordinate in geographic[start:-1]]
+        return {"type": "Polygon", "coordinates": [ring + ring[:1]]}
+    return {"type": "LineString", "coordinates": [list(coordinate) for coordinate in geographic]}
+
+def lot_geojson(lot):
+    feature = {"type": "Feature", "properties": {"lot_id": lot.get("lot_id"), "tiepoint": lot.get("tiepoint")},
+        "geometry": lot_geometry(lot["points"], lot["geographic"], lot.get("tieline"))}
+    return json.dumps(feature, separators=(",", ":"))
+
+# One feature per lot with the lot attributes as properties, written as the lots arrive
+def write_geojson_lots(stream, lots):
+    stream.write('{"type":"FeatureCollection","features":[')
+    separator = ""
+    for lot in lots:
+        feature = {"type": "Feature", "properties": {"lot_id": lot["lot_id"], "tiepoint": lot["tiepoint"], "area": lot["area"], "misclosure": lot["misclosure"]},
+            "geometry": lot_geometry(lot["points"], lot["geographic"])}
+        stream.write(separator + json.dumps(feature, separators=(",", ":")))
+        separator = ","
+    stream.write("]}\n")
@@ -0,0 +1,134 @@
+import numpy as np
+import lotplotter
+import instrumentation
+from technical_description import TechnicalDescription
+
+# Traverse of a TechnicalDescription that keeps departures, latitudes and their running sums,
+# so a single-course change only recomputes the suffix after it
+class IncrementalTraverse:
+    def __init__(self, technical_description=None, tiepoint=None):
+        self.reset(technical_description if technical_description is not None else TechnicalDescription(), tiepoint)
+
+    # Recompute everything, e.g. after an import replaced the technical description
+    def reset(self, technical_description, tiepoint=None):
+        self.technical_description = technical_description
+        self.tiepoint = tiepoint
+        self.projection = lotplotter.Projection(tiepoint) if tiepoint is not None else None
+        self.departures, self.latitudes = lotplotter.compute_departures_latitudes(*technical_description.arrays())
+        self.x = self.y = self.longitude = self.latitude = np.empty(0)
+        self._recompute(0)
+
+    def set_tiepoint(self, tiepoint):
+        if tiepoint != self.tiepoint:
+            self.tiepoint = tiepoint
+            self.projection = lotplotter.Projection(tiepoint)
+            self._recompute(0)
+
+    def __len__(self):
+        return len(self.departures)
+
+    # Rebuild corners and geographic coordinates from course index onwards
+    @instrumentation.timed("traverse.recompute")
+    def _recompute(self, index):
+        if self.tiepoint is None:
+            return
+        size = len(self.departures)
+        keep = min(index, len(self.x))
+        if len(self.x) == size:
+            x, y, longitude, latitude = self.x, self.y, self.longitude, self.latitude
+        else:
+            x, y, longitude, latitude = (np.concatenate((array[:keep], np.empty(size - keep))) for array in (self.x, self.y, self.longitude, self.latitude))
+
+        # Same summation order as a full traverse, starting from the last unchanged corner
+        start = (x[keep - 1], y[keep - 1]) if keep else (self.tiepoint['easting'], self.tiepoint['northing'])
+        x[keep:], y[keep:] = lotplotter.traverse(start, self.departures[keep:], self.latitudes[keep:])
+        longitude[keep:], latitude[keep:] = self.projection.to_geographic(x[keep:], y[keep:])
+        self.x, self.y, self.longitude, self.latitude = x, y, longitude, latitude
+
+    def _course_delta(self, index):
+        codes, deg, min, dist = (array[index:index + 1] for array in self.technical_description.arrays())
+        departures, latitudes = lotplotter.compute_departures_latitudes(codes, deg, min, dist)
+        return departures[0], latitudes[0]
+
+    def update(self, index, data):
+        self.technical_description[index] = data
+        self.departures[index], self.latitudes[index] = self._course_delta(index)
+        self._recompute(index)
+
+    def insert(self, index, data):
+        index = max(0, min(index if index >= 0 else index + len(self), len(self)))
+        self.technical_description.insert(index, data)
+        departure, latitude = self._course_delta(index)
+        self.departures = np.insert(self.departures, index, departure)
+        self.latitudes = np.insert(self.latitudes, index, latitude)
+        self._recompute(index)
+
+    def append(self, data):
+        self.insert(len(self), data)
+
+    def delete(self, index):
+        self.technical_description.delete(index)
+        self.departures = np.delete(self.departures, index)
+        self.latitudes = np.delete(self.latitudes, index)
+        self._recompute(index)
+
+    def copy(self, index):
+        self.technical_description.copy(index)
+        self.departures = np.insert(self.departures, index, self.departures[index])
+        self.latitudes = np.insert(self.latitudes, index, self.latitudes[index])
+        self._recompute(index)
+
+    def move_up(self, index):
+        if index > 0:
+            self._swap(index - 1)
+
+    def move_down(self, index):
+        if index < len(self) - 1:
+            self._swap(index)
+
+    # Swap courses index and index + 1
+    def _swap(self, index):
+        self.technical_description.swap(index, index + 1)
+        self.departures[[index, index + 1]] = self.departures[[index + 1, index]]
+        self.latitudes[[index, index + 1]] = self.latitudes[[index + 1, index]]
+        self._recompute(index)
+
+    # Apply a batch of edits with one recompute: updates (index -> course dict, by current index), then the
+    # rearrangement order (see TechnicalDescription.reorder), then the added courses at the end
+    def apply(self, updates=None, order=None, added=()):
+        updates = updates or {}
+        for index, data in updates.items():
+            self.technical_description[index] = data
+        if updates:
+            indices = np.fromiter(updates, dtype=np.intp, count=len(updates))
+            courses = (array[indices] for array in self.technical_description.arrays())
+            self.departures[indices], self.latitudes[indices] = lotplotter.compute_departures_latitudes(*courses)
+
+        if order is None:
+            order = np.arange(len(self))
+        order = np.asarray(order, dtype=np.intp)
+        self.technical_description.reorder(order)
+        self.departures = self.departures[order]
+        self.latitudes = self.latitudes[order]
+
+        for data in added:
+            self.technical_description.append(data)
+        if added:
+            courses = (array[len(order):] for array in self.technical_description.arrays())
+            departures, latitudes = lotplotter.compute_departures_latitudes(*courses)
+            self.departures = np.concatenate((self.departures, departures))
+            self.latitudes = np.concatenate((self.latitudes, latitudes))
+
+        # Corners before the first moved, updated or added course stay as they are
+        changed = np.flatnonzero((order != np.arange(len(order))) | np.isin(order, list(updates)))
+        self._recompute(int(changed[0]) if len(changed) else len(order))
+
+    # Same outputs as lotplotter.calculate_boundary
+    def points(self):
+        return list(zip(self.x.tolist(), self.y.tolist()))
+
+    def geographic(self):
+        return list(zip(self.longitude.tolist(), self.latitude.tolist()))
+
+    def map_coord(self):
+        return list(zip(self.latitude.tolist(), self.longitude.tolist()))
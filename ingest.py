@@ -0,0 +1,172 @@
+import csv
+import io
+import itertools
+import pyarrow as pa
+import pyarrow.parquet as pq
+import lotplotter
+import td_parser
+
+# Columns of a multi-lot technical description file
+COLUMNS = ["lot_id", "tiepoint", "ns", "deg", "min", "ew", "dist"]
+
+# Accepted header names for each column
+COLUMN_ALIASES = {
+    "lot_id": "lot_id", "lot": "lot_id", "lot id": "lot_id", "lotid": "lot_id",
+    "tiepoint": "tiepoint", "tiepoint_id": "tiepoint", "tiepoint id": "tiepoint", "tie point": "tiepoint",
+    "ns": "ns",
+    "deg": "deg", "degrees": "deg",
+    "min": "min", "minutes": "min",
+    "ew": "ew",
+    "dist": "dist", "distance": "dist",
+}
+
+# Schema of the computed corners written to Parquet
+OUTPUT_SCHEMA = pa.schema([
+    ("lot_id", pa.string()),
+    ("tiepoint", pa.string()),
+    ("corner", pa.int32()),
+    ("x", pa.float64()),
+    ("y", pa.float64()),
+    ("longitude", pa.float64()),
+    ("latitude", pa.float64()),
+])
+
+# Map a header row to column positions, or None if the row is data
+def read_header(row):
+    names = [COLUMN_ALIASES.get(value.strip().lower()) for value in row]
+    if "lot_id" not in names:
+        return None
+    missing = [column for column in COLUMNS if column not in names]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    return [names.index(column) for column in COLUMNS]
+
+# Yield chunks of rows (lists of 7 strings in COLUMNS order) from a CSV text or binary stream
+def read_csv_chunks(stream, chunk_size=65536):
+    if isinstance(stream, (io.RawIOBase, io.BufferedIOBase)) or hasattr(stream, "getbuffer"):
+        stream = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    reader = csv.reader(stream)
+    positions = list(range(len(COLUMNS)))
+
+    first = next(reader, None)
+    if first is None:
+        return
+    header = read_header(first)
+    if header is not None:
+        positions = header
+        pending = []
+    else:
+        pending = [first]
+
+    while True:
+        rows = pending + list(itertools.islice(reader, chunk_size - len(pending)))
+        pending = []
+        if not rows:
+            return
+        yield [[row[position] if position < len(row) else "" for position in positions] for row in rows if row]
+
+# Yield chunks of rows from a Parquet file without loading it whole
+def read_parquet_chunks(source, chunk_size=65536):
+    parquet_file = pq.ParquetFile(source)
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=COLUMNS):
+        columns = [batch.column(column).cast(pa.string()).to_pylist() for column in COLUMNS]
+        yield [["" if value is None else value for value in row] for row in zip(*columns)]
+
+# Yield chunks of rows from multi-lot files: a path, a list of paths (CSV or .parquet), or a CSV stream
+def read_sources(source, chunk_size=65536):
+    if not isinstance(source, (str, list, tuple)):
+        yield from read_csv_chunks(source, chunk_size)
+        return
+    for path in [source] if isinstance(source, str) else source:
+        if path.lower().endswith(".parquet"):
+            yield from read_parquet_chunks(path, chunk_size)
+        else:
+            with open(path, "r", encoding="utf-8-sig", newline="") as stream:
+                yield from read_csv_chunks(stream, chunk_size)
+
+# Convert one row into a technical description dict, raising ValueError if invalid
+def parse_course(row):
+    return td_parser.parse_fields(*row[2:])
+
+# Group consecutive rows of the same lot into (lot_id, tiepoint, courses, error) tuples
+def read_lots(chunks):
+    lot_id = None
+    for chunk in chunks:
+        for row in chunk:
+            if row[0] != lot_id:
+                if lot_id is not None:
+                    yield lot_id, tiepoint, courses, error
+                lot_id, tiepoint, courses, error = row[0], row[1].strip(), [], None
+            if error is None:
+                try:
+                    courses.append(parse_course(row))
+                except ValueError as e:
+                    error = str(e)
+    if lot_id is not None:
+        yield lot_id, tiepoint, courses, error
+
+# Look up a tiepoint by name, or by its position in the tiepoint list
+def make_tiepoint_lookup(tiepoints):
+    by_name = {tiepoint["name"]: tiepoint for tiepoint in tiepoints}
+    def lookup(key):
+        if key in by_name:
+            return by_name[key]
+        if key.isdigit() and int(key) < len(tiepoints):
+            return tiepoints[int(key)]
+        return None
+    return lookup
+
+# Compute a batch of lots and return its corners as an Arrow record batch, optionally closed by the compass rule
+def compute_batch(lots, compass_rule=False):
+    tiepoints = [tiepoint for _, tiepoint, _ in lots]
+    boundaries = lotplotter.calculate_boundaries(tiepoints, [courses for _, _, courses in lots])
+    if compass_rule:
+        boundaries = lotplotter.adjust_compass_rule(boundaries, tiepoints)
+    return corners_batch(lots, boundaries)
+
+# Corners of computed lots as an Arrow record batch
+def corners_batch(lots, boundaries):
+    lengths = [len(courses) for _, _, courses in lots]
+    return pa.record_batch([
+        pa.array([lot_id for (lot_id, _, _), length in zip(lots, lengths) for _ in range(length)], pa.string()),
+        pa.array([tiepoint["name"] for (_, tiepoint, _), length in zip(lots, lengths) for _ in range(length)], pa.string()),
+        pa.array([corner for length in lengths for corner in range(length)], pa.int32()),
+        pa.array(boundaries.x),
+        pa.array(boundaries.y),
+        pa.array(boundaries.longitude),
+        pa.array(boundaries.latitude),
+    ], schema=OUTPUT_SCHEMA)
+
+# Yield bounded batches of valid lots as (lot_id, tiepoint, courses), reporting invalid ones to errors
+def batch_lots(lots, tiepoints, batch_size=1000, errors=None):
+    lookup = make_tiepoint_lookup(tiepoints)
+    batch = []
+    for lot_id, tiepoint_key, courses, error in lots:
+        tiepoint = lookup(tiepoint_key)
+        if error is None and tiepoint is None:
+            error = f"Unknown tiepoint: {tiepoint_key}"
+        if error is None and not courses:
+            error = "No Data"
+        if error is not None:
+            if errors is not None:
+                errors.append((lot_id, error))
+            continue
+        batch.append((lot_id, tiepoint, courses))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# Stream multi-lot CSV or Parquet files (see read_sources) through the engine into one Parquet file of corners,
+# optionally closed by the compass rule
+def ingest(source, output, tiepoints, batch_size=1000, chunk_size=65536, errors=None, compass_rule=False):
+    lot_count = 0
+    corner_count = 0
+    with pq.ParquetWriter(output, OUTPUT_SCHEMA) as writer:
+        for batch in batch_lots(read_lots(read_sources(source, chunk_size)), tiepoints, batch_size, errors):
+            record_batch = compute_batch(batch, compass_rule)
+            writer.write_batch(record_batch)
+            lot_count += len(batch)
+            corner_count += record_batch.num_rows
+    return lot_count, corner_count
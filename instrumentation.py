@@ -0,0 +1,198 @@
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+# Set to record spans from the start (LOTPLOTTER_INSTRUMENT=1), and the JSON file the process metrics are written to
+ENABLE_VARIABLE = "LOTPLOTTER_INSTRUMENT"
+METRICS_VARIABLE = "LOTPLOTTER_METRICS"
+
+# Durations kept per span name for the percentiles; counts and totals cover every span since the last reset
+SAMPLES = 2048
+
+# Spans kept per thread between traces, e.g. those of the widget callbacks that run before a Streamlit rerun
+PENDING_SPANS = 100
+
+# Seconds between metrics files written by dump_if_due
+DUMP_SECONDS = 60
+
+# Spans record only while enabled; a disabled span costs a flag check and returns a shared no-op context manager
+enabled = os.environ.get(ENABLE_VARIABLE, "").lower() not in ("", "0", "false", "no")
+metrics_path = os.environ.get(METRICS_VARIABLE) or os.path.join(tempfile.gettempdir(), "lotplotter-metrics.json")
+
+# Process-wide durations per span name: [count, total milliseconds, recent samples]
+metrics = {}
+lock = threading.Lock()
+
+# Caches (objects with a stats() dict, see cache.LRUCache) reported with the metrics
+caches = {}
+
+# The trace being collected by this thread, how deep its open spans are, and the spans since its last trace
+local = threading.local()
+
+# Serializes metrics file writes and the check of when the last one was written
+dump_lock = threading.Lock()
+last_dump = time.monotonic()
+
+# The spans of one run (e.g. a Streamlit rerun), in the order they started: (offset, depth, name, milliseconds)
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.clock = time.perf_counter()
+        self.milliseconds = None
+        self.spans = []
+
+class Span:
+    __slots__ = ("name", "started", "depth")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.depth = getattr(local, "depth", 0)
+        local.depth = self.depth + 1
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        ended = time.perf_counter()
+        local.depth = self.depth
+        milliseconds = (ended - self.started) * 1000
+        record(self.name, milliseconds)
+        trace = getattr(local, "trace", None)
+        if trace is not None:
+            trace.spans.append(((self.started - trace.clock) * 1000, self.depth, self.name, milliseconds))
+            return
+        pending = getattr(local, "pending", None)
+        if pending is None:
+            pending = local.pending = deque(maxlen=PENDING_SPANS)
+        pending.append((self.started, self.depth, self.name, milliseconds))
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return None
+
+NULL_SPAN = NullSpan()
+
+# Time a block: with span("map.st_folium"): ...
+def span(name):
+    return Span(name) if enabled else NULL_SPAN
+
+# Time every call of a function as a span
+def timed(name):
+    def decorate(func):
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with Span(name):
+                return func(*args, **kwargs)
+        return run
+    return decorate
+
+def record(name, milliseconds):
+    with lock:
+        metric = metrics.get(name)
+        if metric is None:
+            metric = metrics[name] = [0, 0.0, deque(maxlen=SAMPLES)]
+        metric[0] += 1
+        metric[1] += milliseconds
+        metric[2].append(milliseconds)
+
+# Start collecting this thread's spans into a new trace (dropping any trace left open by an interrupted run),
+# None while disabled. Spans recorded since the thread's last trace start it, at negative offsets
+def begin_trace(name):
+    local.trace = None
+    local.depth = 0
+    pending = getattr(local, "pending", None) or ()
+    local.pending = None
+    if not enabled:
+        return None
+    trace = local.trace = Trace(name)
+    trace.spans.extend(((started - trace.clock) * 1000, depth, span_name, milliseconds) for started, depth, span_name, milliseconds in pending)
+    return trace
+
+def current_trace():
+    return getattr(local, "trace", None)
+
+# Stop collecting and return the trace, with its total recorded as a span of its own name
+def end_trace():
+    trace = getattr(local, "trace", None)
+    local.trace = None
+    if trace is None:
+        return None
+    trace.milliseconds = (time.perf_counter() - trace.clock) * 1000
+    record(trace.name, trace.milliseconds)
+    return trace
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+def reset():
+    with lock:
+        metrics.clear()
+
+def register_cache(name, cache):
+    caches[name] = cache
+
+# Nearest-rank percentile of sorted values
+def percentile(values, fraction):
+    return values[min(len(values) - 1, max(0, round(fraction * len(values)) - 1))]
+
+# Counts, totals and recent percentiles of every span, and the statistics of every registered cache
+def snapshot():
+    with lock:
+        spans = {name: (count, total, sorted(samples)) for name, (count, total, samples) in metrics.items()}
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "pid": os.getpid(),
+        "enabled": enabled,
+        "spans": {name: {
+            "count": count,
+            "total_ms": round(total, 3),
+            "mean_ms": round(total / count, 3),
+            "p50_ms": round(percentile(samples, 0.50), 3),
+            "p95_ms": round(percentile(samples, 0.95), 3),
+            "p99_ms": round(percentile(samples, 0.99), 3),
+            "max_ms": round(samples[-1], 3),
+        } for name, (count, total, samples) in sorted(spans.items())},
+        "caches": {name: cache.stats() for name, cache in caches.items()},
+    }
+
+# Write the snapshot to the metrics file, replacing it whole so readers never see a partial file
+def dump(path=None):
+    with dump_lock:
+        return write_metrics(path or metrics_path)
+
+# Write the metrics file when enabled and DUMP_SECONDS have passed since the last one
+def dump_if_due():
+    if not enabled:
+        return
+    with dump_lock:
+        if time.monotonic() - last_dump >= DUMP_SECONDS:
+            write_metrics(metrics_path)
+
+# Called with dump_lock held; each write goes through its own temporary file next to the metrics file
+def write_metrics(path):
+    global last_dump
+    data = snapshot()
+    descriptor, temporary = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(descriptor, "w", encoding="utf-8") as file:
+            json.dump(data, file, indent=2)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    last_dump = time.monotonic()
+    return path
@@ -0,0 +1,239 @@
+import bisect
+import io
+import itertools
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import pyarrow as pa
+import pyarrow.parquet as pq
+import lotplotter
+import ingest
+
+# Lots per work unit; progress and cancellation advance one unit at a time
+BATCH_SIZE = 250
+
+# Finished jobs, with their results, are deleted this many seconds after finishing, and beyond the newest MAX_JOBS
+JOB_SECONDS = 24 * 60 * 60
+MAX_JOBS = 100
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+# Per-lot status of a job's results
+LOT_SCHEMA = pa.schema([
+    ("lot_id", pa.string()),
+    ("tiepoint", pa.string()),
+    ("status", pa.string()),
+    ("corners", pa.int32()),
+    ("area", pa.float64()),
+    ("misclosure", pa.float64()),
+    ("precision", pa.float64()),
+    ("error", pa.string()),
+])
+
+# Worker: the corners and the per-lot status of a batch of (lot_id, tiepoint, courses) lots
+def compute_lots(lots, min_precision=lotplotter.MIN_PRECISION):
+    boundaries = lotplotter.calculate_boundaries([tiepoint for _, tiepoint, _ in lots], [courses for _, _, courses in lots])
+    closures = lotplotter.check_closures(boundaries, min_precision)
+    lots_batch = pa.record_batch([
+        pa.array([lot_id for lot_id, _, _ in lots], pa.string()),
+        pa.array([tiepoint["name"] for _, tiepoint, _ in lots], pa.string()),
+        pa.array(["flagged" if flagged else "ok" for flagged in closures.flagged.tolist()], pa.string()),
+        pa.array([len(courses) for _, _, courses in lots], pa.int32()),
+        pa.array(closures.area),
+        pa.array(closures.misclosure),
+        pa.array([precision if math.isfinite(precision) else None for precision in closures.precision.tolist()], pa.float64()),
+        pa.nulls(len(lots), pa.string()),
+    ], schema=LOT_SCHEMA)
+    return ingest.corners_batch(lots, boundaries), lots_batch
+
+# Status rows of lots that could not be computed
+def skipped_lots(errors):
+    return pa.record_batch([
+        pa.array([lot_id for lot_id, _ in errors], pa.string()),
+        pa.nulls(len(errors), pa.string()),
+        pa.array(["skipped"] * len(errors), pa.string()),
+        pa.array([0] * len(errors), pa.int32()),
+        pa.nulls(len(errors), pa.float64()),
+        pa.nulls(len(errors), pa.float64()),
+        pa.nulls(len(errors), pa.float64()),
+        pa.array([error for _, error in errors], pa.string()),
+    ], schema=LOT_SCHEMA)
+
+# One multi-lot import: progress counters, per-lot status batches kept in memory for paging, and the computed
+# corners streamed to a Parquet file (ingest.OUTPUT_SCHEMA) in the job's directory. The total is known once the
+# whole upload has been read; until then progress follows how much of it has been read
+class Job:
+    def __init__(self, name, directory):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.directory = os.path.join(directory, self.id)
+        self.corners_path = os.path.join(self.directory, "corners.parquet")
+        self.status = QUEUED
+        self.error = None
+        self.total = None
+        self.done = 0
+        self.skipped = 0
+        self.flagged = 0
+        self.submitted = time.time()
+        self.finished = None
+        self.source = None
+        self.size = 0
+        # Status batches and the number of rows up to the end of each, appended in that order
+        self.lot_batches = []
+        self.lot_ends = []
+        self.cancel_event = threading.Event()
+        self.removed = False
+        self._lots_csv = None
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    @property
+    def progress(self):
+        if self.total:
+            return (self.done + self.skipped) / self.total
+        source = self.source
+        return min(source.tell() / self.size, 1.0) if source is not None and self.size else 0.0
+
+    def add_lots(self, batch):
+        self.lot_batches.append(batch)
+        self.lot_ends.append(self.lot_count() + batch.num_rows)
+
+    # Per-lot status rows offset to offset + limit, as a pandas DataFrame, built from only the batches holding them
+    def lots(self, offset=0, limit=None):
+        count = len(self.lot_ends)
+        total = self.lot_ends[count - 1] if count else 0
+        stop = total if limit is None else min(total, offset + limit)
+        if offset >= stop:
+            return pa.Table.from_batches([], LOT_SCHEMA).to_pandas()
+        first = bisect.bisect_right(self.lot_ends, offset, 0, count)
+        last = bisect.bisect_right(self.lot_ends, stop - 1, 0, count)
+        start = self.lot_ends[first - 1] if first else 0
+        table = pa.Table.from_batches(self.lot_batches[first:last + 1], LOT_SCHEMA)
+        return table.slice(offset - start, stop - offset).to_pandas()
+
+    def lot_count(self):
+        return self.lot_ends[-1] if self.lot_ends else 0
+
+    # Per-lot status as CSV text, built once the job has finished
+    def lots_csv(self):
+        if self.active:
+            return None
+        if self._lots_csv is None:
+            self._lots_csv = self.lots().to_csv(index=False)
+        return self._lots_csv
+
+# Process-wide pool of worker processes running the import jobs of every session. Each job is coordinated by a
+# thread that parses the upload and keeps only a few work units in flight, so jobs share the workers
+class JobQueue:
+    def __init__(self, workers=None, directory=None, job_seconds=JOB_SECONDS, max_jobs=MAX_JOBS):
+        self.workers = workers or os.cpu_count() or 1
+        # Spawned workers do not inherit the web server's threads and sockets
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        self.directory = directory or os.path.join(tempfile.gettempdir(), "lotplotter-jobs")
+        self.job_seconds = job_seconds
+        self.max_jobs = max_jobs
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    # Start importing a multi-lot CSV or technical description Parquet upload (bytes) and return the job
+    def submit(self, name, data, tiepoints, min_precision=lotplotter.MIN_PRECISION):
+        self.expire()
+        job = Job(name, self.directory)
+        with self.lock:
+            self.jobs[job.id] = job
+        threading.Thread(target=self._run, args=(job, data, tiepoints, min_precision), name=f"job-{job.id}", daemon=True).start()
+        return job
+
+    def get(self, job_id):
+        self.expire()
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job.cancel_event.set()
+
+    # Cancel a job and delete its results; a running job's thread deletes them once it has closed its files
+    def remove(self, job_id):
+        with self.lock:
+            job = self.jobs.pop(job_id, None)
+        if job is None:
+            return
+        job.removed = True
+        job.cancel_event.set()
+        if not job.active:
+            shutil.rmtree(job.directory, ignore_errors=True)
+
+    # Remove the finished jobs older than job_seconds, and the oldest beyond the newest max_jobs finished ones
+    def expire(self):
+        with self.lock:
+            finished = sorted((job for job in self.jobs.values() if job.finished is not None), key=lambda job: job.finished, reverse=True)
+        oldest = time.time() - self.job_seconds
+        for index, job in enumerate(finished):
+            if index >= self.max_jobs or job.finished < oldest:
+                self.remove(job.id)
+
+    # Read the upload one work unit at a time, so a cancel also stops the reading and only the units in flight are
+    # held in memory. The final status is set once the corners file is complete
+    def _run(self, job, data, tiepoints, min_precision):
+        try:
+            job.size = len(data)
+            job.source = source = io.BytesIO(data)
+            if job.name.lower().endswith(".parquet"):
+                chunks = ingest.read_parquet_chunks(source)
+            else:
+                chunks = ingest.read_csv_chunks(source)
+            errors = []
+            batches = ingest.batch_lots(ingest.read_lots(chunks), tiepoints, BATCH_SIZE, errors)
+            job.status = RUNNING
+
+            os.makedirs(job.directory, exist_ok=True)
+            pending = deque()
+            status = DONE
+            with pq.ParquetWriter(job.corners_path, ingest.OUTPUT_SCHEMA) as writer:
+                for batch in itertools.chain(batches, [None]):
+                    # Lots found invalid while reading this unit
+                    if len(errors) > job.skipped:
+                        job.add_lots(skipped_lots(errors[job.skipped:]))
+                        job.skipped = len(errors)
+                    # Wait for the oldest unit once enough are in flight, and drain the rest at the end
+                    while pending and (batch is None or len(pending) >= self.workers or job.cancel_event.is_set()):
+                        future = pending.popleft()
+                        if job.cancel_event.is_set():
+                            future.cancel()
+                            continue
+                        corners, lots = future.result()
+                        writer.write_batch(corners)
+                        job.add_lots(lots)
+                        job.done += lots.num_rows
+                        job.flagged += lots.column("status").to_pylist().count("flagged")
+                    if job.cancel_event.is_set():
+                        status = CANCELLED
+                        break
+                    if batch is not None:
+                        pending.append(self.executor.submit(compute_lots, batch, min_precision))
+            if status == DONE:
+                job.total = job.done + job.skipped
+            job.status = status
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+        finally:
+            job.source = None
+            job.finished = time.time()
+            if job.removed:
+                shutil.rmtree(job.directory, ignore_errors=True)
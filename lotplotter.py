@@ -1,4 +1,18 @@
 import math
+from collections import namedtuple
+import numpy as np
+import instrumentation
+
+# Quadrant codes of the vectorized traverse engine (bearings first, then due directions)
+QUADRANT_CODES = {('N', 'E'): 0, ('S', 'E'): 1, ('S', 'W'): 2, ('N', 'W'): 3, ('DN', ''): 4, ('DE', ''): 5, ('DS', ''): 6, ('DW', ''): 7}
+DUE_CODE = 4
+
+# Departure (x) and latitude (y) signs per quadrant code
+DEPARTURE_SIGN = np.array([1.0, 1.0, -1.0, -1.0, 0.0, 1.0, 0.0, -1.0])
+LATITUDE_SIGN = np.array([1.0, -1.0, -1.0, 1.0, 1.0, 0.0, -1.0, 0.0])
+
+# Columnar result of a batch computation: corners of lot i are rows offsets[i]:offsets[i+1]
+Boundaries = namedtuple('Boundaries', ['offsets', 'x', 'y', 'longitude', 'latitude'])
 
 # Calculate the next coordinate from a reference point based on bearing and distance
 def get_next_coordinate(reference_point, line):
@@ -49,28 +63,233 @@ def get_lat_long(reference_longitude_x, reference_latitude_y, reference_point, k
     latitude_y = round(convert_dms_to_dd(reference_latitude_y) + (point[1] - reference_point[1]) / (3600 * k_latitude_y), 7)
     return (longitude_x, latitude_y)
 
+# Grid to geographic transform of one tiepoint, with the decimal degree origin and scale factors worked out once.
+# The X/Y adjustment only shifts the origin, so adjusted conversion costs the same as unadjusted
+class Projection:
+    def __init__(self, tiepoint, x_adjustment=0.0, y_adjustment=0.0):
+        self.easting = tiepoint['easting']
+        self.northing = tiepoint['northing']
+        self.longitude_unit = 3600 * tiepoint['k_longitude']
+        self.latitude_unit = 3600 * tiepoint['k_latitude']
+        self.longitude = convert_dms_to_dd(tiepoint['longitude']) + x_adjustment / self.longitude_unit
+        self.latitude = convert_dms_to_dd(tiepoint['latitude']) + y_adjustment / self.latitude_unit
+
+    def to_geographic(self, x, y):
+        longitude_x = np.round(self.longitude + (np.asarray(x) - self.easting) / self.longitude_unit, 7)
+        latitude_y = np.round(self.latitude + (np.asarray(y) - self.northing) / self.latitude_unit, 7)
+        return longitude_x, latitude_y
+
+    def to_grid(self, longitude, latitude):
+        x = self.easting + (np.asarray(longitude) - self.longitude) * self.longitude_unit
+        y = self.northing + (np.asarray(latitude) - self.latitude) * self.latitude_unit
+        return x, y
+
+# Encode the NS/EW pair of a course into its quadrant code
+def encode_quadrant(ns, ew):
+    if ns in ('DN', 'DS', 'DE', 'DW'):
+        ew = ''
+    try:
+        return QUADRANT_CODES[(ns, ew)]
+    except KeyError:
+        raise ValueError(f"Invalid bearing: {ns} {ew}")
+
+# Convert a list of technical description dicts into quadrant code, degree, minute and distance arrays
+def encode_courses(technical_descriptions):
+    # Array backed technical descriptions are consumed without conversion
+    if hasattr(technical_descriptions, 'arrays'):
+        return technical_descriptions.arrays()
+    count = len(technical_descriptions)
+    codes = np.empty(count, dtype=np.int8)
+    deg = np.empty(count, dtype=np.int16)
+    min = np.empty(count, dtype=np.int16)
+    dist = np.empty(count, dtype=np.float64)
+    for index, line in enumerate(technical_descriptions):
+        codes[index] = encode_quadrant(line['ns'], line['ew'])
+        deg[index] = int(line['deg'])
+        min[index] = int(line['min'])
+        dist[index] = float(line['dist'])
+    return codes, deg, min, dist
+
+# Compute the departure (x) and latitude (y) of every course in one pass
+def compute_departures_latitudes(codes, deg, min, dist):
+    due = codes >= DUE_CODE
+    angle = np.radians(deg + min / 60)
+    sin_angle = np.where(due, 1.0, np.sin(angle))
+    cos_angle = np.where(due, 1.0, np.cos(angle))
+    departures = DEPARTURE_SIGN[codes] * dist * sin_angle
+    latitudes = LATITUDE_SIGN[codes] * dist * cos_angle
+    return departures, latitudes
+
+# Accumulate departures and latitudes from the reference point into the corner coordinates
+def traverse(reference_point, departures, latitudes):
+    x = np.cumsum(np.concatenate(([reference_point[0]], departures)))[1:]
+    y = np.cumsum(np.concatenate(([reference_point[1]], latitudes)))[1:]
+    return x, y
+
+# Vectorized get_lat_long over arrays of easting/northing
+def grid_to_geographic(tiepoint, x, y):
+    return Projection(tiepoint).to_geographic(x, y)
+
+# Compute the corner and geographic coordinate arrays of a technical description
+def calculate_boundary_arrays(tiepoint, technical_descriptions):
+    codes, deg, min, dist = encode_courses(technical_descriptions)
+    departures, latitudes = compute_departures_latitudes(codes, deg, min, dist)
+    x, y = traverse((tiepoint['easting'], tiepoint['northing']), departures, latitudes)
+    longitude_x, latitude_y = grid_to_geographic(tiepoint, x, y)
+    return x, y, longitude_x, latitude_y
+
 # Main function to compute all the points
+@instrumentation.timed("lotplotter.calculate_boundary")
 def calculate_boundary(tiepoint, technical_descriptions):
-    # Initialize the points
-    points = []
-    reference_point = (tiepoint['easting'], tiepoint['northing'])
-    
-    # Start at tiepoint
-    point = reference_point
-
-    # Calculate Cartesian points
-    for line in technical_descriptions:
-        point = get_next_coordinate(point, line)
-        points.append(point)
-
-    # Convert to geographic coordinates (dd)
-    geo_coord_dd = []
-    for point in points:
-        longitude_x, latitude_y = get_lat_long(tiepoint['longitude'], tiepoint['latitude'], reference_point, tiepoint['k_longitude'], tiepoint['k_latitude'], point)
-        geo_coord_dd.append((longitude_x, latitude_y))
+    x, y, longitude_x, latitude_y = calculate_boundary_arrays(tiepoint, technical_descriptions)
+    points = list(zip(x.tolist(), y.tolist()))
+    geo_coord_dd = list(zip(longitude_x.tolist(), latitude_y.tolist()))
 
     # Reverse
-    map_coord_dd = [(coord[1], coord[0]) for coord in geo_coord_dd]
+    map_coord_dd = list(zip(latitude_y.tolist(), longitude_x.tolist()))
 
     # Return the points and geographic coordinates in DD and map compatible coordinate formats
-    return points, geo_coord_dd, map_coord_dd
\ No newline at end of file
+    return points, geo_coord_dd, map_coord_dd
+
+# Pack the courses of many lots into one offset-indexed set of arrays
+def pack_courses(technical_descriptions):
+    lengths = np.array([len(lines) for lines in technical_descriptions], dtype=np.int64)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    if technical_descriptions and all(hasattr(lines, 'arrays') for lines in technical_descriptions):
+        codes, deg, min, dist = (np.concatenate(arrays) for arrays in zip(*(lines.arrays() for lines in technical_descriptions)))
+    else:
+        codes, deg, min, dist = encode_courses([line for lines in technical_descriptions for line in lines])
+    return offsets, codes, deg, min, dist
+
+# Segmented traverse: restart the cumulative sum at every lot's own reference point
+def traverse_batch(offsets, reference_x, reference_y, departures, latitudes):
+    lengths = np.diff(offsets)
+    sum_x = np.cumsum(departures)
+    sum_y = np.cumsum(latitudes)
+    start_x = np.concatenate(([0.0], sum_x))[offsets[:-1]]
+    start_y = np.concatenate(([0.0], sum_y))[offsets[:-1]]
+    x = np.repeat(reference_x - start_x, lengths) + sum_x
+    y = np.repeat(reference_y - start_y, lengths) + sum_y
+    return x, y
+
+# Compute the boundaries of many lots, each with its own tiepoint, in one call
+@instrumentation.timed("lotplotter.calculate_boundaries")
+def calculate_boundaries(tiepoints, technical_descriptions):
+    if len(tiepoints) != len(technical_descriptions):
+        raise ValueError("Expected one tiepoint per technical description.")
+    offsets, codes, deg, min, dist = pack_courses(technical_descriptions)
+
+    # Per lot reference points
+    easting = np.array([tiepoint['easting'] for tiepoint in tiepoints], dtype=np.float64)
+    northing = np.array([tiepoint['northing'] for tiepoint in tiepoints], dtype=np.float64)
+
+    departures, latitudes = compute_departures_latitudes(codes, deg, min, dist)
+    x, y = traverse_batch(offsets, easting, northing, departures, latitudes)
+    longitude_x, latitude_y = grid_to_geographic_batch(offsets, tiepoints, x, y)
+
+    return Boundaries(offsets, x, y, longitude_x, latitude_y)
+
+# Vectorized grid_to_geographic over many lots, each with its own tiepoint
+def grid_to_geographic_batch(offsets, tiepoints, x, y):
+    # Many lots share a few tiepoints, so build one projection per distinct tiepoint
+    slots = {}
+    projections = []
+    lot_slots = np.empty(len(tiepoints), dtype=np.intp)
+    for lot, tiepoint in enumerate(tiepoints):
+        slot = slots.get(id(tiepoint))
+        if slot is None:
+            slot = slots[id(tiepoint)] = len(projections)
+            projections.append(Projection(tiepoint))
+        lot_slots[lot] = slot
+    corner_slots = np.repeat(lot_slots, np.diff(offsets))
+
+    def corner_values(name):
+        return np.array([getattr(projection, name) for projection in projections], dtype=np.float64)[corner_slots]
+
+    longitude_x = np.round(corner_values('longitude') + (x - corner_values('easting')) / corner_values('longitude_unit'), 7)
+    latitude_y = np.round(corner_values('latitude') + (y - corner_values('northing')) / corner_values('latitude_unit'), 7)
+    return longitude_x, latitude_y
+
+# Shoelace area (with the ring closed back to the first corner) and linear misclosure of every lot in a batch
+def calculate_areas_misclosures(boundaries):
+    offsets, x, y = boundaries.offsets, boundaries.x, boundaries.y
+    lengths = np.diff(offsets)
+    starts = offsets[:-1]
+    nonempty = lengths > 0
+
+    # Work relative to each lot's first corner to keep the products small
+    first_x = np.repeat(x[starts[nonempty]], lengths[nonempty])
+    first_y = np.repeat(y[starts[nonempty]], lengths[nonempty])
+    local_x = x - first_x
+    local_y = y - first_y
+
+    # Every corner is paired with the next one, the last corner of a lot with its first
+    following = np.arange(1, len(x) + 1)
+    following[offsets[1:][nonempty] - 1] = starts[nonempty]
+    cross = local_x * local_y[following] - local_x[following] * local_y
+    area = np.zeros(len(lengths))
+    area[nonempty] = np.abs(np.add.reduceat(cross, starts[nonempty])) / 2
+
+    misclosure = np.zeros(len(lengths))
+    last = offsets[1:][nonempty] - 1
+    misclosure[nonempty] = np.hypot(local_x[last], local_y[last])
+    return area, misclosure
+
+# Closure of every lot in a batch. A lot runs from its first corner (the end of the tieline) back to that corner:
+# error_x/error_y is how far the last corner ends from the first, perimeter the length of the lot's own courses,
+# precision the 1:N relative precision (inf when closed exactly) and flagged marks lots below min_precision
+Closures = namedtuple('Closures', ['error_x', 'error_y', 'misclosure', 'perimeter', 'precision', 'area', 'flagged'])
+
+# Default minimum relative precision (1:N) for a lot to pass
+MIN_PRECISION = 5000
+
+# Length of the course ending at every corner, zero at each lot's first corner
+def lot_course_lengths(boundaries):
+    offsets, x, y = boundaries.offsets, boundaries.x, boundaries.y
+    course_lengths = np.zeros(len(x))
+    course_lengths[1:] = np.hypot(np.diff(x), np.diff(y))
+    course_lengths[offsets[:-1][np.diff(offsets) > 0]] = 0.0
+    return course_lengths
+
+# Linear error of closure, relative precision, area and tolerance flag of every lot in one pass
+@instrumentation.timed("lotplotter.check_closures")
+def check_closures(boundaries, min_precision=MIN_PRECISION):
+    offsets, x, y = boundaries.offsets, boundaries.x, boundaries.y
+    lengths = np.diff(offsets)
+    nonempty = lengths > 0
+    starts = offsets[:-1][nonempty]
+    last = offsets[1:][nonempty] - 1
+
+    error_x = np.zeros(len(lengths))
+    error_y = np.zeros(len(lengths))
+    error_x[nonempty] = x[last] - x[starts]
+    error_y[nonempty] = y[last] - y[starts]
+    misclosure = np.hypot(error_x, error_y)
+
+    perimeter = np.zeros(len(lengths))
+    perimeter[nonempty] = np.add.reduceat(lot_course_lengths(boundaries), starts) if len(starts) else 0.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(misclosure > 0, perimeter / misclosure, np.inf)
+    area, _ = calculate_areas_misclosures(boundaries)
+    return Closures(error_x, error_y, misclosure, perimeter, precision, area, precision < min_precision)
+
+# Compass rule (Bowditch) adjustment of every lot: each corner moves against the closure error in proportion to
+# the lot's course length travelled so far, so every lot ends exactly on its first corner; the tieline is unchanged
+@instrumentation.timed("lotplotter.adjust_compass_rule")
+def adjust_compass_rule(boundaries, tiepoints):
+    offsets, x, y = boundaries.offsets, boundaries.x, boundaries.y
+    lengths = np.diff(offsets)
+    closures = check_closures(boundaries)
+
+    # Segmented cumulative course length, restarting at every lot
+    course_lengths = np.cumsum(lot_course_lengths(boundaries))
+    travelled = course_lengths - np.repeat(np.concatenate(([0.0], course_lengths))[offsets[:-1]], lengths)
+    perimeter = np.repeat(closures.perimeter, lengths)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = np.where(perimeter > 0, travelled / perimeter, 0.0)
+
+    x = x - fraction * np.repeat(closures.error_x, lengths)
+    y = y - fraction * np.repeat(closures.error_y, lengths)
+    longitude_x, latitude_y = grid_to_geographic_batch(offsets, tiepoints, x, y)
+    return Boundaries(offsets, x, y, longitude_x, latitude_y)
@@ -0,0 +1,213 @@
+import math
+import numpy as np
+
+# Radius of the sphere used to measure lots in meters (WGS84 equatorial radius)
+EARTH_RADIUS = 6378137.0
+
+# Overlaps and gaps smaller than this many square meters are survey noise, e.g. shared boundaries
+# computed from different tiepoints
+MIN_AREA = 1.0
+
+# Facing edges further apart than this many meters are separate lots, not a gap between neighbours
+MAX_GAP = 2.0
+
+# Facing edges within this many degrees of parallel can bound a gap
+MAX_GAP_ANGLE = 5.0
+
+# Local east/north meters of longitudes/latitudes around an origin (equirectangular, fine at barangay scale)
+def to_meters(longitude, latitude, origin):
+    scale = math.radians(1) * EARTH_RADIUS
+    return (np.asarray(longitude) - origin[0]) * scale * math.cos(math.radians(origin[1])), (np.asarray(latitude) - origin[1]) * scale
+
+def to_degrees(x, y, origin):
+    scale = math.radians(1) * EARTH_RADIUS
+    return np.asarray(x) / (scale * math.cos(math.radians(origin[1]))) + origin[0], np.asarray(y) / scale + origin[1]
+
+# Signed shoelace area of a ring of (x, y) tuples, positive when counterclockwise
+def signed_area(ring):
+    area = 0.0
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+        area += x1 * y2 - x2 * y1
+    return area / 2
+
+def is_convex(ring):
+    sign = 0
+    for (x1, y1), (x2, y2), (x3, y3) in zip(ring, ring[1:] + ring[:1], ring[2:] + ring[:2]):
+        cross = (x2 - x1) * (y3 - y2) - (y2 - y1) * (x3 - x2)
+        if cross * sign < 0:
+            return False
+        sign = sign or cross
+    return True
+
+# Split a counterclockwise ring into counterclockwise triangles by ear clipping
+def triangulate(ring):
+    ring = list(ring)
+    triangles = []
+    while len(ring) > 3:
+        for index in range(len(ring)):
+            a, b, c = ring[index - 1], ring[index], ring[(index + 1) % len(ring)]
+            if (b[0] - a[0]) * (c[1] - b[1]) - (b[1] - a[1]) * (c[0] - b[0]) <= 0:
+                continue
+            triangle = [a, b, c]
+            if not any(point not in triangle and point_in_convex(point, triangle) for point in ring):
+                triangles.append(triangle)
+                del ring[index]
+                break
+        else:
+            # Self-intersecting or degenerate lot: keep the remaining fan as is
+            triangles.extend([ring[0], ring[index], ring[index + 1]] for index in range(1, len(ring) - 1))
+            return triangles
+    triangles.append(ring)
+    return triangles
+
+def point_in_convex(point, ring):
+    x, y = point
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+        if (x2 - x1) * (y - y1) - (y2 - y1) * (x - x1) < 0:
+            return False
+    return True
+
+# Sutherland-Hodgman: the part of a ring inside a convex counterclockwise ring
+def clip(ring, convex):
+    for (x1, y1), (x2, y2) in zip(convex, convex[1:] + convex[:1]):
+        if not ring:
+            break
+        dx, dy = x2 - x1, y2 - y1
+        sides = [dx * (y - y1) - dy * (x - x1) for x, y in ring]
+        clipped = []
+        for (p, side_p), (q, side_q) in zip(zip(ring, sides), zip(ring[1:] + ring[:1], sides[1:] + sides[:1])):
+            if side_p >= 0:
+                clipped.append(p)
+            if (side_p >= 0) != (side_q >= 0):
+                t = side_p / (side_p - side_q)
+                clipped.append((p[0] + t * (q[0] - p[0]), p[1] + t * (q[1] - p[1])))
+        ring = clipped
+    return ring
+
+# Overlap of two counterclockwise rings as (area, pieces): the first ring clipped by the convex pieces of the second
+def overlap(ring, convex_pieces):
+    pieces = [piece for piece in (clip(ring, convex) for convex in convex_pieces) if len(piece) >= 3]
+    return sum(signed_area(piece) for piece in pieces), pieces
+
+# Gap between two counterclockwise rings, as (area, slivers): the strips between edges of the two rings that face
+# each other, nearly parallel and less than max_gap apart
+def gap(ring, other, max_gap=MAX_GAP, max_angle=MAX_GAP_ANGLE):
+    area = 0.0
+    slivers = []
+    cos_angle = math.cos(math.radians(max_angle))
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+        length = math.hypot(x2 - x1, y2 - y1)
+        if length == 0:
+            continue
+        ux, uy = (x2 - x1) / length, (y2 - y1) / length
+        for (x3, y3), (x4, y4) in zip(other, other[1:] + other[:1]):
+            other_length = math.hypot(x4 - x3, y4 - y3)
+            # Facing edges of two counterclockwise rings run in opposite directions
+            if other_length == 0 or (ux * (x4 - x3) + uy * (y4 - y3)) / other_length > -cos_angle:
+                continue
+            # Position along the edge and distance to its outside (the right) of the other edge's ends
+            s3, d3 = (x3 - x1) * ux + (y3 - y1) * uy, (x3 - x1) * uy - (y3 - y1) * ux
+            s4, d4 = (x4 - x1) * ux + (y4 - y1) * uy, (x4 - x1) * uy - (y4 - y1) * ux
+            start, end = max(0.0, s4), min(length, s3)
+            if end <= start:
+                continue
+            d_start = d4 + (d3 - d4) * (start - s4) / (s3 - s4)
+            d_end = d4 + (d3 - d4) * (end - s4) / (s3 - s4)
+            if not (0 < d_start <= max_gap and 0 < d_end <= max_gap):
+                continue
+            area += (end - start) * (d_start + d_end) / 2
+            slivers.append([(x1 + ux * start, y1 + uy * start), (x1 + ux * end, y1 + uy * end),
+                (x1 + ux * end + uy * d_end, y1 + uy * end - ux * d_end), (x1 + ux * start + uy * d_start, y1 + uy * start - ux * d_start)])
+    return area, slivers
+
+# Pairs (first, second) of boxes that share a cell of a uniform grid, each pair once. Cells are about the size of the
+# median box, but never so small that the grid has more cells than boxes, so a lot meets a few neighbours whichever
+# way the lots are spread
+def grid_pairs(min_x, min_y, max_x, max_y):
+    count = len(min_x)
+    if count < 2:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    left, bottom = min_x.min(), min_y.min()
+    width, height = max_x.max() - left, max_y.max() - bottom
+    size = max(float(np.median(max_x - min_x)), float(np.median(max_y - min_y)), math.sqrt(width * height / count)) or 1.0
+    x0, x1 = ((min_x - left) // size).astype(np.int64), ((max_x - left) // size).astype(np.int64)
+    y0, y1 = ((min_y - bottom) // size).astype(np.int64), ((max_y - bottom) // size).astype(np.int64)
+    columns = int(x1.max()) + 1
+
+    # One entry per box and cell it covers, grouped by cell
+    spans = x1 - x0 + 1
+    counts = spans * (y1 - y0 + 1)
+    box = np.repeat(np.arange(count), counts)
+    within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cells = (y0[box] + within // spans[box]) * columns + x0[box] + within % spans[box]
+    order = np.argsort(cells, kind="stable")
+    box, cells = box[order], cells[order]
+
+    # Every later entry of the same cell
+    following = np.arange(1, len(cells) + 1)
+    pair_counts = np.searchsorted(cells, cells, side="right") - following
+    first = np.repeat(np.arange(len(cells)), pair_counts)
+    second = np.arange(pair_counts.sum()) - np.repeat(np.cumsum(pair_counts) - pair_counts, pair_counts) + np.repeat(following, pair_counts)
+    # Boxes sharing several cells are paired only in the cell of the lower left corner of their cells' overlap
+    first, second, cell = box[first], box[second], cells[first]
+    keep = np.maximum(y0[first], y0[second]) * columns + np.maximum(x0[first], x0[second]) == cell
+    return first[keep], second[keep]
+
+# Pairs (i, j), i < j, of lots whose bounding boxes widened by margin intersect, sorted. Only lots sharing a grid
+# cell (see grid_pairs) are compared
+def candidate_pairs(min_x, min_y, max_x, max_y, margin=0.0):
+    max_x, max_y = max_x + margin, max_y + margin
+    first, second = grid_pairs(min_x, min_y, max_x, max_y)
+    meets = (min_x[first] <= max_x[second]) & (min_x[second] <= max_x[first]) & (min_y[first] <= max_y[second]) & (min_y[second] <= max_y[first])
+    pairs = np.sort(np.column_stack((first[meets], second[meets])), axis=1)
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+# Overlapping and gapped pairs of closed lots in a ParcelSet, as (table rows, GeoJSON FeatureCollection)
+def find_overlaps_gaps(parcel_set, min_area=MIN_AREA, max_gap=MAX_GAP):
+    ids = np.flatnonzero(parcel_set.closed & (np.diff(parcel_set.offsets) >= 4))
+    if not len(ids):
+        return [], {"type": "FeatureCollection", "features": []}
+    origin = (float(parcel_set.longitude.mean()), float(parcel_set.latitude.mean()))
+    x, y = to_meters(parcel_set.longitude, parcel_set.latitude, origin)
+
+    # Counterclockwise rings in meters without the closing corner, and their convex pieces for clipping
+    rings = {}
+    for id in ids.tolist():
+        start, end = parcel_set.offsets[id], parcel_set.offsets[id + 1] - 1
+        ring = list(zip(x[start:end].tolist(), y[start:end].tolist()))
+        rings[id] = ring if signed_area(ring) >= 0 else ring[::-1]
+    pieces = {}
+
+    def convex_pieces(id):
+        if id not in pieces:
+            pieces[id] = [rings[id]] if is_convex(rings[id]) else triangulate(rings[id])
+        return pieces[id]
+
+    min_x = np.minimum.reduceat(x, parcel_set.offsets[:-1])[ids]
+    max_x = np.maximum.reduceat(x, parcel_set.offsets[:-1])[ids]
+    min_y = np.minimum.reduceat(y, parcel_set.offsets[:-1])[ids]
+    max_y = np.maximum.reduceat(y, parcel_set.offsets[:-1])[ids]
+    rows = []
+    features = []
+    for first, second in ids[candidate_pairs(min_x, min_y, max_x, max_y, max_gap)].tolist():
+        area, shapes = overlap(rings[first], convex_pieces(second))
+        kind = "overlap"
+        if area < min_area:
+            area, shapes = gap(rings[first], rings[second], max_gap)
+            kind = "gap"
+        if area < min_area:
+            continue
+        longitude, latitude = to_degrees(*np.concatenate(shapes).T, origin)
+        center_longitude, center_latitude = float(longitude.mean()), float(latitude.mean())
+        coordinates = np.column_stack((longitude, latitude)).tolist()
+        polygons = []
+        for shape in shapes:
+            ring, coordinates = coordinates[:len(shape)], coordinates[len(shape):]
+            polygons.append([ring + ring[:1]])
+        smaller = min(signed_area(rings[first]), signed_area(rings[second]))
+        row = {"kind": kind, "lot_id": parcel_set.lot_ids[first], "other_lot_id": parcel_set.lot_ids[second], "area": round(area, 2),
+            "percent": round(100 * area / smaller, 2) if smaller > 0 else None,
+            "latitude": round(center_latitude, 7), "longitude": round(center_longitude, 7)}
+        rows.append(row)
+        features.append({"type": "Feature", "properties": row, "geometry": {"type": "MultiPolygon", "coordinates": polygons}})
+    return rows, {"type": "FeatureCollection", "features": features}
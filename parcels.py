@@ -0,0 +1,202 @@
+import json
+import math
+import os
+import numpy as np
+import pyarrow.parquet as pq
+import lotplotter
+import ingest
+from tiepoint_index import KDTree
+
+# Leaflet's tile size in pixels, and the deepest zoom level it serves
+TILE_SIZE = 256
+MAX_ZOOM = 22
+
+# Vertices of a lot closer together than this many screen pixels are merged when simplifying
+SIMPLIFY_PIXELS = 1.0
+
+# Lots that close within this distance (in grid units) are drawn as polygons
+CLOSURE_TOLERANCE = 0.5
+
+# Longitude degrees covered by one screen pixel at a zoom level
+def degrees_per_pixel(zoom):
+    return 360.0 / (TILE_SIZE * 2 ** zoom)
+
+# Web Mercator tile x/y holding a latitude/longitude at a zoom level
+def tile_xy(latitude, longitude, zoom):
+    count = 2 ** zoom
+    latitude = np.radians(np.clip(latitude, -85.0511, 85.0511))
+    x = np.floor((np.asarray(longitude) + 180.0) / 360.0 * count)
+    y = np.floor((1.0 - np.log(np.tan(latitude) + 1.0 / np.cos(latitude)) / math.pi) / 2.0 * count)
+    return np.clip(x, 0, count - 1).astype(np.int64), np.clip(y, 0, count - 1).astype(np.int64)
+
+# Path of a pre-generated tile
+def tile_path(directory, zoom, x, y):
+    return os.path.join(directory, str(zoom), str(x), f"{y}.geojson")
+
+# Computed lots held as flat coordinate arrays (like lotplotter.Boundaries), indexed by bounding box for
+# viewport culling and simplified per zoom level for display
+class ParcelSet:
+    def __init__(self, lot_ids, tiepoints, offsets, longitude, latitude, misclosure):
+        # Lots without corners cannot be drawn
+        lengths = np.diff(offsets)
+        nonempty = lengths > 0
+        keep_corners = np.repeat(nonempty, lengths)
+        self.lot_ids = [lot_id for lot_id, keep in zip(lot_ids, nonempty.tolist()) if keep]
+        self.tiepoints = [tiepoint for tiepoint, keep in zip(tiepoints, nonempty.tolist()) if keep]
+        self.offsets = np.concatenate(([0], np.cumsum(lengths[nonempty])))
+        self.longitude = np.asarray(longitude, dtype=np.float64)[keep_corners]
+        self.latitude = np.asarray(latitude, dtype=np.float64)[keep_corners]
+        self.closed = np.asarray(misclosure)[nonempty] <= CLOSURE_TOLERANCE
+
+        starts = self.offsets[:-1]
+        if len(starts):
+            self.min_longitude = np.minimum.reduceat(self.longitude, starts)
+            self.max_longitude = np.maximum.reduceat(self.longitude, starts)
+            self.min_latitude = np.minimum.reduceat(self.latitude, starts)
+            self.max_latitude = np.maximum.reduceat(self.latitude, starts)
+        else:
+            self.min_longitude = self.max_longitude = self.min_latitude = self.max_latitude = np.empty(0)
+
+        # Index the box centers; a box query widened by the largest half extent finds every intersecting box
+        self.index = KDTree((self.min_longitude + self.max_longitude) / 2, (self.min_latitude + self.max_latitude) / 2)
+        self.half_width = float((self.max_longitude - self.min_longitude).max()) / 2 if len(starts) else 0.0
+        self.half_height = float((self.max_latitude - self.min_latitude).max()) / 2 if len(starts) else 0.0
+        self._simplified = {}
+
+    @classmethod
+    def from_boundaries(cls, lot_ids, tiepoints, boundaries):
+        _, misclosure = lotplotter.calculate_areas_misclosures(boundaries)
+        return cls(lot_ids, tiepoints, boundaries.offsets, boundaries.longitude, boundaries.latitude, misclosure)
+
+    def __len__(self):
+        return len(self.lot_ids)
+
+    # Bounding box of every lot as (min_latitude, min_longitude, max_latitude, max_longitude)
+    def bounds(self):
+        return (float(self.min_latitude.min()), float(self.min_longitude.min()), float(self.max_latitude.max()), float(self.max_longitude.max()))
+
+    # Ids of the lots whose bounding box intersects a latitude/longitude box, in lot order
+    def within(self, min_latitude, min_longitude, max_latitude, max_longitude):
+        ids = self.index.within(min_longitude - self.half_width, min_latitude - self.half_height, max_longitude + self.half_width, max_latitude + self.half_height)
+        intersects = ((self.min_longitude[ids] <= max_longitude) & (self.max_longitude[ids] >= min_longitude) &
+            (self.min_latitude[ids] <= max_latitude) & (self.max_latitude[ids] >= min_latitude))
+        return np.sort(ids[intersects])
+
+    # Corners kept at a zoom level and the lot offsets into them: a corner in the same pixel of the zoom's grid
+    # as the one before it is dropped, keeping each lot's first and last corner
+    def simplified(self, zoom):
+        zoom = max(0, min(int(zoom), MAX_ZOOM))
+        if zoom not in self._simplified:
+            tolerance = degrees_per_pixel(zoom) * SIMPLIFY_PIXELS
+            grid_x = np.floor(self.longitude / tolerance)
+            grid_y = np.floor(self.latitude / tolerance)
+            keep = np.ones(len(self.longitude), dtype=bool)
+            keep[1:] = (grid_x[1:] != grid_x[:-1]) | (grid_y[1:] != grid_y[:-1])
+            keep[self.offsets[:-1]] = True
+            keep[self.offsets[1:] - 1] = True
+            offsets = np.concatenate(([0], np.cumsum(np.add.reduceat(keep, self.offsets[:-1])))) if len(self) else np.zeros(1, dtype=np.int64)
+            # Digits beyond a tenth of a pixel only add payload
+            decimals = min(7, max(0, math.ceil(-math.log10(tolerance)) + 1))
+            self._simplified[zoom] = (np.round(self.longitude[keep], decimals), np.round(self.latitude[keep], decimals), offsets)
+        return self._simplified[zoom]
+
+    # GeoJSON FeatureCollection of the given lots simplified for a zoom level, closed lots as polygons
+    def geojson(self, ids, zoom):
+        longitude, latitude, offsets = self.simplified(zoom)
+        ids = np.asarray(ids, dtype=np.int64)
+        starts = offsets[ids]
+        lengths = offsets[ids + 1] - starts
+        corners = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths) + np.arange(lengths.sum())
+        coordinates = np.column_stack((longitude[corners], latitude[corners])).tolist()
+
+        features = []
+        end = 0
+        for id, length in zip(ids.tolist(), lengths.tolist()):
+            start, end = end, end + length
+            ring = coordinates[start:end]
+            if self.closed[id] and length >= 3:
+                geometry = {"type": "Polygon", "coordinates": [ring + [ring[0]]]}
+            else:
+                geometry = {"type": "LineString", "coordinates": ring}
+            features.append({"type": "Feature", "id": id, "properties": {"lot_id": self.lot_ids[id], "tiepoint": self.tiepoints[id]}, "geometry": geometry})
+        return {"type": "FeatureCollection", "features": features}
+
+    # Write GeoJSON tiles {zoom}/{x}/{y}.geojson for every tile that holds part of a lot, pre-simplified for
+    # the tile's zoom level, so very large sets are culled and simplified once instead of on every view
+    def write_tiles(self, directory, min_zoom, max_zoom):
+        tile_count = 0
+        for zoom in range(min_zoom, max_zoom + 1):
+            min_x, max_y = tile_xy(self.min_latitude, self.min_longitude, zoom)
+            max_x, min_y = tile_xy(self.max_latitude, self.max_longitude, zoom)
+            tiles = {}
+            for id, (x0, x1, y0, y1) in enumerate(zip(min_x.tolist(), max_x.tolist(), min_y.tolist(), max_y.tolist())):
+                for x in range(x0, x1 + 1):
+                    for y in range(y0, y1 + 1):
+                        tiles.setdefault((x, y), []).append(id)
+            for (x, y), ids in tiles.items():
+                path = tile_path(directory, zoom, x, y)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w", encoding="utf-8") as file:
+                    json.dump(self.geojson(ids, zoom), file, separators=(",", ":"))
+            tile_count += len(tiles)
+        return tile_count
+
+# Compute every valid lot of multi-lot file chunks (see ingest) into a ParcelSet, reporting invalid lots to errors
+def read_parcels(chunks, tiepoints, errors=None, batch_size=10000):
+    lot_ids, tiepoint_names, offsets, longitude, latitude, misclosure = [], [], [np.zeros(1, dtype=np.int64)], [], [], []
+    for lots in ingest.batch_lots(ingest.read_lots(chunks), tiepoints, batch_size, errors):
+        boundaries = lotplotter.calculate_boundaries([tiepoint for _, tiepoint, _ in lots], [courses for _, _, courses in lots])
+        lot_ids.extend(lot_id for lot_id, _, _ in lots)
+        tiepoint_names.extend(tiepoint["name"] for _, tiepoint, _ in lots)
+        offsets.append(boundaries.offsets[1:] + offsets[-1][-1])
+        longitude.append(boundaries.longitude)
+        latitude.append(boundaries.latitude)
+        misclosure.append(lotplotter.calculate_areas_misclosures(boundaries)[1])
+    return ParcelSet(lot_ids, tiepoint_names, np.concatenate(offsets),
+        np.concatenate(longitude) if longitude else np.empty(0), np.concatenate(latitude) if latitude else np.empty(0),
+        np.concatenate(misclosure) if misclosure else np.empty(0))
+
+# Load the computed corners of a batch run (ingest.OUTPUT_SCHEMA Parquet) into a ParcelSet
+def read_corners(source):
+    table = pq.read_table(source, columns=["lot_id", "tiepoint", "x", "y", "longitude", "latitude"])
+    lot_id = table.column("lot_id").to_numpy(zero_copy_only=False).astype(str)
+    starts = np.flatnonzero(np.concatenate(([True], lot_id[1:] != lot_id[:-1]))) if len(lot_id) else np.empty(0, dtype=np.int64)
+    offsets = np.concatenate((starts, [len(lot_id)]))
+    boundaries = lotplotter.Boundaries(offsets, *(table.column(column).to_numpy() for column in ["x", "y", "longitude", "latitude"]))
+    tiepoint = table.column("tiepoint").to_numpy(zero_copy_only=False)
+    return ParcelSet.from_boundaries(lot_id[starts].tolist(), tiepoint[starts].tolist(), boundaries)
+
+# Whether a parcel file holds computed corners rather than technical descriptions
+def is_corners_file(source, file_name):
+    return file_name.lower().endswith(".parquet") and "longitude" in pq.ParquetFile(source).schema_arrow.names
+
+# Zoom level that fits a (min_latitude, min_longitude, max_latitude, max_longitude) box in a map of the given size
+def fit_zoom(bounds, width, height, max_zoom=18):
+    min_latitude, min_longitude, max_latitude, max_longitude = bounds
+    span = max((max_longitude - min_longitude) / width, (max_latitude - min_latitude) / height)
+    if span <= 0:
+        return max_zoom
+    return max(0, min(max_zoom, math.floor(math.log2(360.0 / (TILE_SIZE * span)))))
+
+# Zoom levels present in a tile directory
+def tile_zooms(directory):
+    return sorted(int(name) for name in os.listdir(directory) if name.isdigit())
+
+# Merge the pre-generated tiles covering a latitude/longitude box, each lot once. Zoom levels outside the
+# generated range use the closest generated level
+def read_tiles(directory, min_latitude, min_longitude, max_latitude, max_longitude, zoom):
+    zooms = tile_zooms(directory)
+    if not zooms:
+        return {"type": "FeatureCollection", "features": []}
+    zoom = max(zooms[0], min(int(zoom), zooms[-1]))
+    min_x, max_y = tile_xy(min_latitude, min_longitude, zoom)
+    max_x, min_y = tile_xy(max_latitude, max_longitude, zoom)
+    features = {}
+    for x in range(int(min_x), int(max_x) + 1):
+        for y in range(int(min_y), int(max_y) + 1):
+            path = tile_path(directory, zoom, x, y)
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as file:
+                    for feature in json.load(file)["features"]:
+                        features[feature["id"]] = feature
+    return {"type": "FeatureCollection", "features": list(features.values())}
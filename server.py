@@ -1,17 +1,32 @@
 import streamlit as st
 import folium
 from streamlit_folium import st_folium
-import re
-import lotplotter
 import io
-import datetime
+import numpy as np
+import pandas as pd
+import lotplotter
+import td_parser
+import exporters
+import overlaps
+import instrumentation
+import technical_description
+from technical_description import TechnicalDescription
+from incremental_traverse import IncrementalTraverse
+from tiepoint_index import TiepointIndex
+from catalog import TiepointCatalog, CatalogView, build_catalog, validate_json_format
+from cache import LRUCache, boundary_key, technical_description_key, freeze
+import copy
 import csv
-import ezdxf
-import simplekml
-import shapefile
-import os
-import zipfile
+import datetime
+import functools
+import hmac
 import json
+import os
+import time
+from collections import deque
+
+# ingest, jobs and parcels import pyarrow.parquet, which only matters to someone importing multi-lot files or
+# parcels, so each is imported by the functions that need it
 
 ####################################################################
 # CONFIG
@@ -30,12 +45,16 @@ st.logo("images/logo.png", size="large", icon_image="images/logo_icon.png")
 # INITIALIZATION
 ####################################################################
 if "td_data" not in st.session_state:
-    st.session_state["td_data"] = []
+    st.session_state["td_data"] = TechnicalDescription()
+
+if "traverse" not in st.session_state:
+    st.session_state["traverse"] = IncrementalTraverse(st.session_state["td_data"])
 
-st.session_state["notif_td_data"] = []
+if "td_editor_version" not in st.session_state:
+    st.session_state["td_editor_version"] = 0
 
-if "page_index" not in st.session_state:
-    st.session_state["page_index"] = 0
+if "td_selected" not in st.session_state:
+    st.session_state["td_selected"] = []
 
 if "process_paste_confirmed" not in st.session_state:
     st.session_state["process_paste_confirmed"] = False
@@ -49,13 +68,102 @@ if "points" not in st.session_state:
 if "geographic" not in st.session_state:
     st.session_state["geographic"] = []
 
-if "tiepoint_data" not in st.session_state:
-    with open("tiepoints.json", "r") as file:
-        st.session_state["tiepoint_data"] = json.load(file)
+if "tiepoint_overlay" not in st.session_state:
+    st.session_state["tiepoint_overlay"] = []
+
+if "tiepoint_selected" not in st.session_state:
+    st.session_state["tiepoint_selected"] = None
+
+# Value of the tiepoint selectbox, which is driven only through the session state
+if "tiepoint_option" not in st.session_state:
+    st.session_state["tiepoint_option"] = st.session_state["tiepoint_selected"]
+
+if "boundary_key" not in st.session_state:
+    st.session_state["boundary_key"] = None
+
+# Value of the "Show parcels" toggle, which is driven only through the session state
+if "show_parcels" not in st.session_state:
+    st.session_state["show_parcels"] = True
+
+# Initial map center (Cebu)
+MAP_CENTER = (10.3157, 123.8854)
+
+if "map_focus" not in st.session_state:
+    st.session_state["map_focus"] = None
+    st.session_state["map_view"] = (MAP_CENTER, 11)
+
+if "parcel_set" not in st.session_state:
+    st.session_state["parcel_set"] = None
+
+# Overlapping and gapped parcel pairs as (table rows, GeoJSON), once checked
+if "overlaps" not in st.session_state:
+    st.session_state["overlaps"] = None
+
+# Seconds between progress updates of running background jobs, and rows per page of a job's lot status
+JOB_POLL_SECONDS = 1
+JOB_LOTS_PER_PAGE = 100
+
+# Ids of the session's background import jobs
+if "jobs" not in st.session_state:
+    st.session_state["jobs"] = []
+
+if "td_editor_errors" not in st.session_state:
+    st.session_state["td_editor_errors"] = []
+
+if "rerun_latency" not in st.session_state:
+    st.session_state["rerun_latency"] = {}
+
+# Reruns kept per session for the debug panel, shown to admins with ?debug=<LOTPLOTTER_ADMIN_TOKEN> in the URL
+RERUNS_SHOWN = 20
+ADMIN_TOKEN = os.environ.get("LOTPLOTTER_ADMIN_TOKEN")
+
+if "reruns" not in st.session_state:
+    st.session_state["reruns"] = deque(maxlen=RERUNS_SHOWN)
+
+# This is a full run, so every fragment is about to see the latest data
+st.session_state["rerun_app"] = False
+script_started = time.perf_counter()
+instrumentation.begin_trace("rerun.app")
 
 ####################################################################
 # FUNCTIONS
 ####################################################################
+# Keep the last rerun times of the app and of each fragment, in milliseconds
+def record_latency(name, started):
+    samples = st.session_state["rerun_latency"].setdefault(name, deque(maxlen=LATENCY_SAMPLES))
+    samples.append((time.perf_counter() - started) * 1000)
+
+# Keep the spans of a finished rerun for the debug panel
+def store_rerun(trace):
+    if trace is not None:
+        st.session_state["reruns"].append(trace)
+
+# Ask for a full rerun after a fragment callback changed data that other parts of the page depend on
+def request_app_rerun():
+    st.session_state["rerun_app"] = True
+
+# Independently rerunning part of the page; widget interactions inside it rerun only it, unless a callback
+# requested a full rerun. With run_every, it also reruns on its own every run_every seconds
+def timed_fragment(func=None, run_every=None):
+    if func is None:
+        return functools.partial(timed_fragment, run_every=run_every)
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        if st.session_state["rerun_app"]:
+            st.rerun()
+        started = time.perf_counter()
+        # Run on its own, the fragment is a rerun of its own; during a full run its spans belong to the app's
+        trace = None if instrumentation.current_trace() else instrumentation.begin_trace(f"rerun.{func.__name__}")
+        try:
+            with instrumentation.span(f"fragment.{func.__name__}"):
+                return func(*args, **kwargs)
+        finally:
+            record_latency(func.__name__, started)
+            if trace is not None:
+                store_rerun(instrumentation.end_trace())
+    return st.fragment(run, run_every=run_every)
+
 @st.dialog("⚠️Confirmation Required")
 def process_csv(data):
     st.warning("This action will overwrite your existing Technical Description Data.")
@@ -63,8 +171,7 @@ def process_csv(data):
     cols = st.columns(2)
     with cols[0]:
         if st.button("Confirm", use_container_width=True):
-            st.session_state["td_data"] = data
-            st.session_state["page_index"] = 0
+            set_td_data(data)
             st.session_state["process_csv_confirmed"] = True
             st.rerun()
     with cols[1]:
@@ -78,14 +185,108 @@ def process_paste_text(data):
     cols = st.columns(2)
     with cols[0]:
         if st.button("Confirm", use_container_width=True):
-            st.session_state["td_data"] = data
-            st.session_state["page_index"] = 0
+            set_td_data(data)
             st.session_state["process_paste_confirmed"] = True
             st.rerun()
     with cols[1]:
         if st.button("Cancel", use_container_width=True):
             st.rerun()
 
+# Incremental traverse over the session's technical description, reset when an import replaced it
+def td_traverse():
+    traverse = st.session_state["traverse"]
+    if traverse.technical_description is not st.session_state["td_data"]:
+        traverse.reset(st.session_state["td_data"], traverse.tiepoint)
+    return traverse
+
+# Computed boundaries shared by every session, keyed by their inputs
+@st.cache_resource
+def boundary_cache():
+    cache = LRUCache(max_entries=1024, max_bytes=256 * 1024 * 1024)
+    instrumentation.register_cache("boundary", cache)
+    return cache
+
+# Corner (x, y) and adjusted geographic (longitude, latitude) arrays, with the tieline if shown, and the closure
+# of the lot as computed (before any compass rule adjustment) as [misclosure, precision, area, perimeter]
+@instrumentation.timed("boundary.compute")
+def compute_boundary(tiepoint, show_tieline, x_adjustment, y_adjustment, compass_rule=False):
+    traverse = td_traverse()
+    traverse.set_tiepoint(tiepoint)
+    closures = lotplotter.check_closures(traverse_boundaries(traverse))
+    closure = np.array([float(values[0]) for values in (closures.misclosure, closures.precision, closures.area, closures.perimeter)])
+    # The cache keeps read-only arrays, and the traverse updates its own arrays in place, so none of them are shared
+    x, y = traverse.x.copy(), traverse.y.copy()
+    if compass_rule:
+        adjusted = lotplotter.adjust_compass_rule(traverse_boundaries(traverse), [tiepoint])
+        x, y = adjusted.x, adjusted.y
+    if show_tieline:
+        x = np.concatenate(([tiepoint["easting"]], x))
+        y = np.concatenate(([tiepoint["northing"]], y))
+    # The adjustment moves the projection's origin, so the corners are converted and shifted in one step
+    if x_adjustment or y_adjustment or compass_rule or show_tieline:
+        longitude, latitude = lotplotter.Projection(tiepoint, x_adjustment, y_adjustment).to_geographic(x, y)
+    else:
+        longitude, latitude = traverse.longitude.copy(), traverse.latitude.copy()
+    return x, y, longitude, latitude, closure
+
+@instrumentation.timed("boundary")
+def cached_boundary(tiepoint, show_tieline, x_adjustment, y_adjustment, compass_rule=False):
+    key = boundary_key(tiepoint, st.session_state["td_data"], show_tieline, x_adjustment, y_adjustment, compass_rule)
+    st.session_state["boundary_key"] = key
+    boundary = boundary_cache().get(key)
+    if boundary is None:
+        boundary = boundary_cache().put(key, *freeze(compute_boundary(tiepoint, show_tieline, x_adjustment, y_adjustment, compass_rule)))
+    return boundary
+
+# The traverse's lot as a one-lot batch for the engine's batch functions
+def traverse_boundaries(traverse):
+    return lotplotter.Boundaries(np.array([0, len(traverse.x)]), traverse.x, traverse.y, traverse.longitude, traverse.latitude)
+
+# Closure check of the plotted lot, from the closure cached with its boundary (see compute_boundary)
+def show_closure(closure, min_precision):
+    misclosure, precision, area, perimeter = (float(value) for value in closure)
+    cols = st.columns(4)
+    cols[0].metric("Misclosure", f"{misclosure:.3f} m")
+    cols[1].metric("Precision", "Closed" if precision == float("inf") else f"1:{precision:,.0f}")
+    cols[2].metric("Area", f"{area:,.2f} sq.m.")
+    cols[3].metric("Perimeter", f"{perimeter:,.2f} m")
+    if precision < min_precision:
+        st.warning(f"Relative precision 1:{precision:,.0f} is below 1:{min_precision:,}. Check the technical description for encoding errors.")
+
+# Export artifacts shared by every session, keyed by the geometry (or technical description) hash and format
+@st.cache_resource
+def export_cache():
+    cache = LRUCache(max_entries=256, max_bytes=64 * 1024 * 1024)
+    instrumentation.register_cache("export", cache)
+    return cache
+
+# The plotted lot as an exporter lot dict (see exporters)
+def current_lot():
+    tiepoint = st.session_state["tiepoint_selected"]
+    return {"lot_id": "Lot", "tiepoint": tiepoint["name"] if tiepoint else "", "td_data": st.session_state["td_data"].to_dicts(),
+        "points": st.session_state["points"], "geographic": st.session_state["geographic"], "tieline": st.session_state["switch"]}
+
+def prepare_export(fmt, key):
+    with instrumentation.span(f"download.{fmt}"):
+        content = exporters.render(fmt, current_lot())
+    export_cache().put((key, fmt), content, len(content))
+
+# Download button for an export that was already built, otherwise a button that builds it on demand
+def download_export(fmt, key):
+    exporter = exporters.registry()[fmt]
+    content = export_cache().get((key, fmt)) if key else None
+    if content is not None:
+        st.download_button(
+            label=f"Download {exporter.label}",
+            data=content,
+            file_name=f"Lotplotter_{datetime.datetime.now():%Y%m%d_%H%M%S}{exporter.extension}",
+            mime=exporter.mime,
+            key=f"download_{fmt}",
+            use_container_width=True
+        )
+    else:
+        st.button(f"Prepare {exporter.label}", key=f"prepare_{fmt}", on_click=prepare_export, args=(fmt, key), disabled=not key, use_container_width=True, icon=":material/download:")
+
 def display_td_data(data):
     if data["ns"] == "DS":
         return f"Due South, {data['dist']:.2f}"
@@ -101,257 +302,64 @@ def display_td_data(data):
 def display_line(index):
     return f"{'TP-1' if index == 0 else (f'{index}-{index+1}' if index < len(st.session_state['td_data']) - 1 else f'{index}-1')}:"
 
+# The same rules as every import (td_parser.parse_fields), with each problem shown on its own
 def validate_manual_input_form():
-    data = {"ns": st.session_state["new_ns"].upper(), 
-        "deg": st.session_state["new_deg"], 
-        "min": st.session_state["new_min"], 
-        "ew": st.session_state["new_ew"].upper(), 
-        "dist": st.session_state["new_dist"]}
-    valid = True
-    if data["ns"] in ["DN","DS","DW","DE"]:
-        data["deg"] = 0
-        data["min"] = 0
-        data["ew"] = ""
-    else:
-        if data["ns"] not in ["N","S"]:
-            notif_manual_input.error("Invalid input for NS. Please input 'N' for North or 'S' for South.")
-            valid = False
-        if data["ew"] not in ["E","W"]:
-            notif_manual_input.error("Invalid input for EW. Please input 'E' for East or 'W' for West.")
-            valid = False
-    if valid:
-        st.session_state["td_data"].append(data)
-        st.toast(f"###### Added :green[{display_td_data(data)}]", icon="🟢")
-
-
-def validate_update_form(index):
-    data = {"ns": st.session_state[f"update_ns_{index}"].upper(), 
-        "deg": st.session_state[f"update_deg_{index}"], 
-        "min": st.session_state[f"update_min_{index}"], 
-        "ew": st.session_state[f"update_ew_{index}"].upper(), 
-        "dist": st.session_state[f"update_dist_{index}"]}
-    valid = True
-    if data["ns"] in ["DN","DS","DW","DE"]:
-        data["deg"] = 0
-        data["min"] = 0
-        data["ew"] = ""
+    try:
+        data = td_parser.parse_fields(*(str(st.session_state[key]) for key in ["new_ns", "new_deg", "new_min", "new_ew", "new_dist"]))
+    except ValueError as e:
+        for problem in str(e).split("; "):
+            notif_manual_input.error(problem)
+        return
+    td_traverse().append(data)
+    reset_td_editor()
+    st.toast(f"###### Added :green[{display_td_data(data)}]", icon="🟢")
+
+
+# Show every invalid line of an import at once, so they can all be fixed before uploading again
+def show_parse_errors(notifier, errors):
+    notifier.error(f"{len(errors)} invalid line{'s' if len(errors) > 1 else ''}. Nothing was imported.")
+    for line_number, line, error in errors[:PARSE_ERRORS_SHOWN]:
+        notifier.error(f"{error} from line {line_number}: **{line}**")
+    if len(errors) > PARSE_ERRORS_SHOWN:
+        notifier.dataframe([{"Line": line_number, "Text": line, "Error": error} for line_number, line, error in errors], hide_index=True, use_container_width=True)
+
+# Parse imported lines into the technical description, asking before overwriting existing data
+def import_courses(lines, notifier, confirm_overwrite, confirmed_key):
+    errors = []
+    data = list(td_parser.parse(lines, errors))
+    if errors:
+        show_parse_errors(notifier, errors)
+    elif not data:
+        notifier.error("No Data")
+    elif st.session_state["td_data"]:
+        confirm_overwrite(data)
     else:
-        if data["ns"] not in ["N","S"]:
-            st.session_state["notif_td_data"][index].error("Invalid input for NS. Please input 'N' for North or 'S' for South.")
-            valid = False
-        if data["ew"] not in ["E","W"]:
-            st.session_state["notif_td_data"][index].error("Invalid input for EW. Please input 'E' for East or 'W' for West.")
-            valid = False
-    if valid:
-        st.session_state["td_data"][index] = data
-        st.toast(f"###### Updated :green[{display_td_data(data)}]", icon="🟢")
+        set_td_data(data)
+        st.session_state[confirmed_key] = True
+
+# Multi-lot file (lot_id and tiepoint columns) uploaded through the technical description importer
+def is_multi_lot(upload):
+    import ingest
+    first_line = upload.getvalue()[:4096].split(b"\n", 1)[0].decode("utf-8-sig", errors="replace")
+    return ingest.read_header(next(csv.reader([first_line]), [])) is not None
 
 def validate_import_csv_form():
     if st.session_state["csv_file"]:
-        csv_file = st.session_state["csv_file"].read()
-        decoded_data = csv_file.decode('utf-8')
-        lines = decoded_data.split('\n')
-
-        data = []
-        valid = True
-        for index, line in enumerate(lines):
-            if line:
-                split_line = re.split(r'[\t,]', line)
-
-                if len(split_line) == 5:
-                    ns, deg, min, ew, dist = (value.strip() for value in split_line)
-
-                    if ns in ["NS","ns"] or deg in ["Deg", "Degrees","deg"] or min in ["Min","Minutes","min"] or ew in ["EW","ew"] or dist in ["Dist","Distance","dist"]:
-                        continue
-                    if ns in ["DS", "DW", "DN", "DE"]:
-                        deg = 0
-                        min = 0
-                        ew = ""
-                        try:
-                            dist = float(dist)
-                        except ValueError:
-                            notif_import_csv.error(f"Invalid Dist value: {dist} from line {index+1}: **{line}**")
-                            valid = False
-                            break
-                    else:
-                        if ns not in ["N", "S"]:
-                            notif_import_csv.error(f"Invalid NS value: {ns} from line {index+1}: **{line}**")
-                            valid = False
-                            break
-
-                        try:
-                            deg = int(deg)
-                        except ValueError:
-                            notif_import_csv.error(f"Invalid Deg value: {deg} from line {index+1}: **{line}**")
-                            valid = False
-                            break
-
-                        try:
-                            min = int(min)
-                        except ValueError:
-                            notif_import_csv.error(f"Invalid Min value: {min} from line {index+1}: **{line}**")
-                            valid = False
-                            break
-
-                        if ew not in ["E", "W"]:
-                            notif_import_csv.error(f"Invalid EW value: {ew} from line {index+1}: **{line}**")
-                            valid = False
-                            break
-
-                        try:
-                            dist = float(dist)
-                        except ValueError:
-                            notif_import_csv.error(f"Invalid Dist value: {dist} from line {index+1}: **{line}**")
-                            valid = False
-                            break
-
-                    data.append({
-                        "ns": ns.upper(), 
-                        "deg": deg, 
-                        "min": min, 
-                        "ew": ew.upper(), 
-                        "dist": dist})
-
-                else:
-                    notif_import_csv.error(f"Invalid value from line {index+1}: **{line}**")
-                    valid = False
-                    break
-
-        if valid:
-            if len(data):
-                if st.session_state["td_data"]:
-                    process_csv(data)
-                else:
-                    st.session_state["td_data"] = data
-                    st.session_state["page_index"] = 0
-                    st.session_state["process_csv_confirmed"] = True
-            else:
-                notif_import_csv.error("No Data")
+        try:
+            multi_lot = is_multi_lot(st.session_state["csv_file"])
+        except ValueError as e:
+            notif_import_csv.error(f"An error occurred: {e}")
+            return
+        if multi_lot:
+            submit_import_job(st.session_state["csv_file"])
+            return
+        # Decode while parsing instead of copying the whole upload into a string; detach so the upload stays open
+        lines = io.TextIOWrapper(st.session_state["csv_file"], encoding="utf-8-sig", errors="replace")
+        import_courses(lines, notif_import_csv, process_csv, "process_csv_confirmed")
+        lines.detach()
 
 def validate_paste_text_form():
-    paste_text = st.session_state["paste_text"]
-    lines = paste_text.split('\n')
-    data = []
-    valid = True
-    for index, line in enumerate(lines):
-        if line:
-            split_line = re.split(r'[\t,]', line)
-
-            if len(split_line) == 5:
-                ns, deg, min, ew, dist = (value.strip() for value in split_line)
-
-                if ns in ["NS","ns"] or deg in ["Deg", "Degrees","deg"] or min in ["Min","Minutes","min"] or ew in ["EW","ew"] or dist in ["Dist","Distance","dist"]:
-                    continue
-
-                if ns in ["DS", "DW", "DN", "DE"]:
-                    deg = 0
-                    min = 0
-                    ew = ""
-                    try:
-                        dist = float(dist)
-                    except ValueError:
-                        notif_import_csv.error(f"Invalid Dist value: {dist} from line {index+1}: **{line}**")
-                        valid = False
-                        break
-                else:
-
-                    if ns not in ["N", "S"]:
-                        notif_paste.error(f"Invalid NS value: {ns} from line {index+1}: **{line}**")
-                        valid = False
-                        break
-
-                    try:
-                        deg = int(deg)
-                    except ValueError:
-                        notif_paste.error(f"Invalid Deg value: {deg} from line {index+1}: **{line}**")
-                        valid = False
-                        break
-
-                    try:
-                        min = int(min)
-                    except ValueError:
-                        notif_paste.error(f"Invalid Min value: {min} from line {index+1}: **{line}**")
-                        valid = False
-                        break
-
-                    if ew not in ["E", "W"]:
-                        notif_paste.error(f"Invalid EW value: {ew} from line {index+1}: **{line}**")
-                        valid = False
-                        break
-
-                    try:
-                        dist = float(dist)
-                    except ValueError:
-                        notif_paste.error(f"Invalid Dist value: {dist} from line {index+1}: **{line}**")
-                        valid = False
-                        break
-
-                data.append({
-                    "ns": ns.upper(), 
-                    "deg": deg, 
-                    "min": min, 
-                    "ew": ew.upper(), 
-                    "dist": dist})
-
-            else:
-                notif_paste.error(f"Invalid value from line {index+1}: **{line}**")
-                valid = False
-                break
-
-    if valid:
-        if len(data):
-            if st.session_state["td_data"]:
-                process_paste_text(data)
-            else:
-                st.session_state["td_data"] = data
-                st.session_state["page_index"] = 0
-                st.session_state["process_paste_confirmed"] = True
-        else:
-            notif_paste.error("No Data")
-
-# Define a function to validate the structure of the JSON data
-def validate_json_format(data):
-    # Expected keys for each tiepoint entry
-    required_keys = ["name", "northing", "easting", "latitude", "longitude", "k_latitude", "k_longitude"]
-    
-    # Check if the data is a list
-    if not isinstance(data, list):
-        return False, "The JSON should be a list of tiepoint entries."
-
-    # Check each tiepoint entry for the required keys and data types
-    for idx, item in enumerate(data):
-        if not isinstance(item, dict):
-            return False, f"Entry {idx + 1} is not a dictionary."
-        
-        # Check for required keys
-        for key in required_keys:
-            if key not in item:
-                return False, f"Missing key '{key}' in entry {idx + 1}."
-        
-        # Check the data types of the fields
-        if not isinstance(item["name"], str):
-            return False, f"Invalid type for 'name' in entry {idx + 1}. Expected string."
-        if not isinstance(item["northing"], (int, float)):
-            return False, f"Invalid type for 'northing' in entry {idx + 1}. Expected number."
-        if not isinstance(item["easting"], (int, float)):
-            return False, f"Invalid type for 'easting' in entry {idx + 1}. Expected number."
-        
-        # Validate latitude and longitude subfields (assuming they should be dictionaries with degrees, minutes, and seconds)
-        latitude = item.get("latitude", {})
-        if not isinstance(latitude, dict) or not all(k in latitude for k in ["deg", "min", "sec"]):
-            return False, f"Invalid format for 'latitude' in entry {idx + 1}."
-        
-        longitude = item.get("longitude", {})
-        if not isinstance(longitude, dict) or not all(k in longitude for k in ["deg", "min", "sec"]):
-            return False, f"Invalid format for 'longitude' in entry {idx + 1}."
-        
-        # Ensure k_latitude and k_longitude are numbers
-        if not isinstance(item["k_latitude"], (int, float)):
-            return False, f"Invalid type for 'k_latitude' in entry {idx + 1}. Expected number."
-        if not isinstance(item["k_longitude"], (int, float)):
-            return False, f"Invalid type for 'k_longitude' in entry {idx + 1}. Expected number."
-    
-    return True, "The JSON format is valid."
+    import_courses(io.StringIO(st.session_state["paste_text"]), notif_paste, process_paste_text, "process_paste_confirmed")
 
 def validate_import_json():
             # Check if a file has been uploaded
@@ -364,7 +372,8 @@ def validate_import_json():
                 is_valid, message = validate_json_format(data)
                 
                 if is_valid:
-                    st.session_state["tiepoint_data"] = data
+                    st.session_state["tiepoint_overlay"] = data
+                    st.session_state["tiepoint_index"] = TiepointIndex(data)
                     st.success("JSON file imported and validated successfully.")
                 else:
                     st.error(message)  # Show validation error message
@@ -375,34 +384,162 @@ def validate_import_json():
 
 
 
-def delete(index):
-    data = st.session_state['td_data'][index]
-    del st.session_state['td_data'][index]
-    st.toast(f"###### Deleted :green[{display_td_data(data)}]", icon="🟢")
-
-def copy(index):
-    data = st.session_state['td_data'][index]
-    st.session_state['td_data'].insert(index, data)
-    st.toast(f"###### Copied :green[{display_td_data(data)}]", icon="🟢")
-
-def move_up(index):
-    if index > 0:
-        data = st.session_state['td_data'][index]
-        st.session_state['td_data'][index], st.session_state['td_data'][index - 1] = (st.session_state['td_data'][index - 1], st.session_state['td_data'][index])
-        st.toast(f"###### Moved up :green[{display_td_data(data)}]", icon="🟢")
-
-def move_down(index):
-    if index < len(st.session_state['td_data'])-1:
-        data = st.session_state['td_data'][index]
-        st.session_state['td_data'][index], st.session_state['td_data'][index + 1] = (st.session_state['td_data'][index + 1], st.session_state['td_data'][index])
-        st.toast(f"###### Moved down :green[{display_td_data(data)}]", icon="🟢")
+# Grid editor columns, in technical description key order
+EDITOR_COLUMNS = ["NS", "Deg", "Min", "EW", "Dist"]
+
+# Display values of each quadrant code
+NS_VALUES = np.array([technical_description.QUADRANTS[code][0] for code in range(len(technical_description.QUADRANTS))], dtype=object)
+EW_VALUES = np.array([technical_description.QUADRANTS[code][1] for code in range(len(technical_description.QUADRANTS))], dtype=object)
+
+# Replace the technical description, e.g. after an import
+def set_td_data(data):
+    st.session_state["td_data"] = TechnicalDescription.from_dicts(data)
+    st.session_state["td_selected"] = []
+    reset_td_editor()
+
+# Start the grid editor over from the current data; its pending diff is relative to the data it was given
+def reset_td_editor():
+    st.session_state["td_editor_version"] += 1
+
+def td_editor_key():
+    return f"td_editor_{st.session_state['td_editor_version']}"
+
+# The whole technical description as one table for the grid editor
+def td_frame():
+    td = st.session_state["td_data"]
+    selected = np.zeros(len(td), dtype=bool)
+    selected[st.session_state["td_selected"]] = True
+    return pd.DataFrame({
+        "Line": [display_line(index)[:-1] for index in range(len(td))],
+        "NS": NS_VALUES[td.codes],
+        "Deg": td.deg,
+        "Min": td.min,
+        "EW": EW_VALUES[td.codes],
+        "Dist": td.dist,
+        "Select": selected,
+    })
+
+# Convert a grid editor row into a technical description dict, raising ValueError if invalid
+def editor_course(row):
+    return td_parser.parse_fields(*("" if row.get(column) is None else str(row[column]) for column in EDITOR_COLUMNS))
+
+# Apply every edit, added row and deleted row of the grid editor to the technical description in one step
+def apply_td_editor():
+    changes = st.session_state[td_editor_key()]
+    td = st.session_state["td_data"]
+    selected = set(st.session_state["td_selected"])
+    updates = {}
+    added = []
+    errors = []
+    for index, edits in changes["edited_rows"].items():
+        index = int(index)
+        if "Select" in edits:
+            (selected.add if edits["Select"] else selected.discard)(index)
+        course_edits = {column: value for column, value in edits.items() if column in EDITOR_COLUMNS}
+        if course_edits:
+            row = dict(zip(EDITOR_COLUMNS, (td[index][key] for key in technical_description.KEYS)))
+            try:
+                updates[index] = editor_course({**row, **course_edits})
+            except ValueError as e:
+                errors.append(f"Line {display_line(index)} {e}")
+    for position, row in enumerate(changes["added_rows"]):
+        try:
+            added.append(editor_course(row))
+        except ValueError as e:
+            errors.append(f"Added row {position + 1}: {e}")
+    deleted = set(changes["deleted_rows"])
+
+    if errors:
+        st.session_state["td_editor_errors"] = errors
+        st.session_state["td_selected"] = sorted(selected)
+        return
+    if not updates and not added and not deleted:
+        # Selection only: the grid already shows it, so keep the grid as it is
+        st.session_state["td_selected"] = sorted(selected)
+        return
+
+    order = [index for index in range(len(td)) if index not in deleted]
+    td_traverse().apply({index: data for index, data in updates.items() if index not in deleted}, order, added)
+    st.session_state["td_selected"] = [position for position, index in enumerate(order) if index in selected]
+    reset_td_editor()
+    request_app_rerun()
+    st.toast(f"###### Updated :green[{len(updates)}], added :green[{len(added)}], deleted :green[{len(deleted)}] courses", icon="🟢")
+
+# Rearrange the courses with one order (see TechnicalDescription.reorder), keeping the moved courses selected
+def reorder_selected(order, message):
+    selected = set(st.session_state["td_selected"])
+    td_traverse().apply(order=order)
+    st.session_state["td_selected"] = [position for position, index in enumerate(order) if index in selected and (position == 0 or order[position - 1] != index)]
+    reset_td_editor()
+    request_app_rerun()
+    st.toast(f"###### {message} :green[{len(selected)}] courses", icon="🟢")
+
+def delete_selected():
+    selected = set(st.session_state["td_selected"])
+    reorder_selected([index for index in range(len(st.session_state["td_data"])) if index not in selected], "Deleted")
+
+def copy_selected():
+    selected = set(st.session_state["td_selected"])
+    reorder_selected([index for index in range(len(st.session_state["td_data"])) for _ in range(2 if index in selected else 1)], "Copied")
+
+def move_up_selected():
+    selected = set(st.session_state["td_selected"])
+    order = list(range(len(st.session_state["td_data"])))
+    for position in range(1, len(order)):
+        if order[position] in selected and order[position - 1] not in selected:
+            order[position - 1], order[position] = order[position], order[position - 1]
+    reorder_selected(order, "Moved up")
+
+def move_down_selected():
+    selected = set(st.session_state["td_selected"])
+    order = list(range(len(st.session_state["td_data"])))
+    for position in range(len(order) - 2, -1, -1):
+        if order[position] in selected and order[position + 1] not in selected:
+            order[position], order[position + 1] = order[position + 1], order[position]
+    reorder_selected(order, "Moved down")
 
 def tiepoint_names(data):
     return data["name"]
 
-@st.cache_data
+# Shared read-only tiepoint catalog, opened once per process
+@st.cache_resource
+@instrumentation.timed("tiepoints.load")
+def tiepoint_catalog():
+    return TiepointCatalog(build_catalog("tiepoints.json", "tiepoints.sqlite"))
+
+# The shared catalog with the session's imported tiepoints layered on top
+def catalog_view():
+    return CatalogView(tiepoint_catalog(), st.session_state["tiepoint_overlay"])
+
+# Spatial index over the shared catalog, built once per process
+@st.cache_resource
+def base_tiepoint_index():
+    return TiepointIndex(tiepoint_catalog().all())
+
+@st.cache_resource
+def base_tiepoints_json():
+    return json.dumps(tiepoint_catalog().all(), indent=4)
+
+# Nearest tiepoints from the shared catalog and the session's imported tiepoints
+def nearby_tiepoints(latitude, longitude, count):
+    nearby = base_tiepoint_index().nearest(latitude, longitude, count)
+    if "tiepoint_index" in st.session_state:
+        overlay_names = set(catalog_view().overlay_names)
+        nearby = [(data, distance) for data, distance in nearby if data["name"] not in overlay_names]
+        nearby = sorted(nearby + st.session_state["tiepoint_index"].nearest(latitude, longitude, count), key=lambda item: item[1])[:count]
+    return nearby
+
+def select_tiepoint(data):
+    st.session_state["tiepoint_selected"] = data
+    st.session_state["tiepoint_option"] = data
+    request_app_rerun()
+
+def select_tiepoint_option():
+    st.session_state["tiepoint_selected"] = st.session_state["tiepoint_option"]
+    request_app_rerun()
+
 def map_folium(zoom):
-    m = folium.Map(location=(10.3157, 123.8854),zoom_start=zoom, tiles=None, control_scale=True)
+    m = folium.Map(location=MAP_CENTER,zoom_start=zoom, tiles=None, control_scale=True)
 
     folium.TileLayer(
         tiles='OpenStreetMap',
@@ -434,30 +571,258 @@ def map_folium(zoom):
     folium.LayerControl().add_to(m)
     return m
 
-# Constants
-ITEMS_PER_PAGE = 5
-
-# Determine the total number of pages
-total_pages = (len(st.session_state["td_data"]) - 1) // ITEMS_PER_PAGE + 1
-
-# Function to go to the next page
-def next_page():
-    if st.session_state["page_index"] < total_pages - 1:
-        st.session_state["page_index"] += 1
+# Base map, built once per session. st_folium keys the browser's map on the map script, so an unchanged base map
+# keeps the loaded map (tiles, layer choice, viewport) and only the overlay is sent on reruns. folium's render is
+# not repeatable on the same map, so each run renders a cheap copy of the session's unrendered map
+@instrumentation.timed("map.base")
+def base_map():
+    if "base_map" not in st.session_state:
+        st.session_state["base_map"] = map_folium(11)
+    return copy.deepcopy(st.session_state["base_map"])
+
+# Parcel overlay pushed to the existing map
+@instrumentation.timed("map.overlay")
+def parcel_overlay(latitude, longitude):
+    feature_group = folium.FeatureGroup(name="Parcel")
+    folium.PolyLine(locations=list(zip(latitude.tolist(), longitude.tolist())),
+        color="magenta",
+        weight=5,
+        fill_color="yellow",
+        fill_opacity=0.6,
+        fill=True,).add_to(feature_group)
+    return feature_group
+
+# Center and zoom of the map, moved only when the plotted lot changes to another tiepoint or technical description,
+# so adjustments and edits keep the user's viewport
+def map_view(latitude, longitude):
+    focus = (st.session_state["tiepoint_selected"]["name"], id(st.session_state["td_data"]), st.session_state["switch"])
+    if st.session_state["map_focus"] != focus:
+        st.session_state["map_focus"] = focus
+        start = 1 if st.session_state["switch"] else 0
+        st.session_state["map_view"] = ((float(latitude[start]), float(longitude[start])), 18)
+    return st.session_state["map_view"]
+
+# Import a batch run's computed corners for the map's parcel layer; multi-lot technical descriptions are
+# computed by a background job instead
+def import_parcels():
+    import parcels
+    upload = st.session_state["parcel_file"]
+    if not upload:
+        return
+    try:
+        if not parcels.is_corners_file(upload, upload.name):
+            submit_import_job(upload)
+            return
+        show_parcels(parcels.read_corners(upload))
+    except (ValueError, KeyError, OSError) as e:
+        notif_import_parcels.error(f"An error occurred: {e}")
+
+def show_parcels(parcel_set):
+    import parcels
+    if not len(parcel_set):
+        st.toast("###### No Data", icon="🔴")
+        return
+    st.session_state["parcel_set"] = parcel_set
+    st.session_state["overlaps"] = None
+    st.session_state["show_parcels"] = True
+
+    # Fit the map to the parcels
+    min_latitude, min_longitude, max_latitude, max_longitude = parcel_set.bounds()
+    st.session_state["map_view"] = (((min_latitude + max_latitude) / 2, (min_longitude + max_longitude) / 2), parcels.fit_zoom(parcel_set.bounds(), 800, 500))
+    st.toast(f"###### Imported :green[{len(parcel_set):,}] parcels", icon="🟢")
+
+def clear_parcels():
+    st.session_state["parcel_set"] = None
+    st.session_state["overlaps"] = None
+
+# Process-wide worker pool and job registry for large imports, shared by every session
+@st.cache_resource
+def job_queue():
+    import jobs
+    return jobs.JobQueue()
+
+# Compute a multi-lot upload in the background; the jobs panel follows its progress
+def submit_import_job(upload):
+    job = job_queue().submit(upload.name, upload.getvalue(), catalog_view().all(), st.session_state.get("min_precision", lotplotter.MIN_PRECISION))
+    st.session_state["jobs"].append(job.id)
+    st.toast(f"###### Importing {upload.name} in the background", icon="⏳")
+
+# The session's jobs that still exist, newest first
+def session_jobs():
+    found = [job_queue().get(job_id) for job_id in st.session_state["jobs"]]
+    st.session_state["jobs"] = [job.id for job in found if job is not None]
+    return [job for job in reversed(found) if job is not None]
+
+def remove_job(job_id):
+    job_queue().remove(job_id)
+    request_app_rerun()
+
+# Load a finished job's lots as the map's parcel layer
+def show_job_parcels(job_id):
+    import parcels
+    job = job_queue().get(job_id)
+    if job is not None:
+        show_parcels(parcels.read_corners(job.corners_path))
+    request_app_rerun()
+
+# Progress, per-lot status and results of one job
+def show_job(job):
+    import jobs
+    with st.container(border=True):
+        st.markdown(f"**{job.name}** · {job.status}")
+        if job.status == jobs.FAILED:
+            st.error(f"An error occurred: {job.error}")
+        elif job.total is None:
+            st.progress(job.progress, text=f"{job.done + job.skipped:,} lots · {job.skipped:,} skipped · {job.flagged:,} flagged")
+        else:
+            st.progress(job.progress, text=f"{job.done + job.skipped:,} of {job.total:,} lots · {job.skipped:,} skipped · {job.flagged:,} flagged")
 
-# Function to go to the previous page
-def prev_page():
-    if st.session_state["page_index"] > 0:
-        st.session_state["page_index"] -= 1
+        cols = st.columns(2)
+        if job.active:
+            cols[0].button("Cancel", key=f"cancel_{job.id}", on_click=job_queue().cancel, args=(job.id,), use_container_width=True, icon=":material/cancel:")
+        else:
+            cols[0].button("Show on Map", key=f"show_{job.id}", on_click=show_job_parcels, args=(job.id,), disabled=not job.done, use_container_width=True, icon=":material/map:")
+            cols[1].button("Remove", key=f"remove_{job.id}", on_click=remove_job, args=(job.id,), use_container_width=True, icon=":material/delete:")
+
+        lot_count = job.lot_count()
+        if lot_count:
+            pages = (lot_count - 1) // JOB_LOTS_PER_PAGE + 1
+            page = st.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, value=1, key=f"page_{job.id}") if pages > 1 else 1
+            st.dataframe(job.lots((page - 1) * JOB_LOTS_PER_PAGE, JOB_LOTS_PER_PAGE), hide_index=True, use_container_width=True, column_config={
+                "lot_id": "Lot", "tiepoint": "Tiepoint", "status": "Status", "corners": "Corners",
+                "area": st.column_config.NumberColumn("Area (sq.m.)", format="%.2f"), "misclosure": st.column_config.NumberColumn("Misclosure (m)", format="%.3f"),
+                "precision": st.column_config.NumberColumn("Precision 1:", format="%.0f"), "error": "Error"})
+        if not job.active and job.status != jobs.FAILED:
+            cols = st.columns(2)
+            cols[0].download_button("Download Lot Status CSV", job.lots_csv(), file_name=f"{os.path.splitext(job.name)[0]}_lots.csv", mime="text/csv", key=f"download_lots_{job.id}", use_container_width=True)
+            if job.done:
+                with open(job.corners_path, "rb") as file:
+                    cols[1].download_button("Download Corners Parquet", file.read(), file_name=f"{os.path.splitext(job.name)[0]}_corners.parquet", mime="application/vnd.apache.parquet", key=f"download_corners_{job.id}", use_container_width=True)
+
+# Follows running jobs, polling for progress; a full rerun swaps in the static panel once they have all finished
+@timed_fragment(run_every=JOB_POLL_SECONDS)
+def running_jobs_panel():
+    session = session_jobs()
+    for job in session:
+        show_job(job)
+    if not any(job.active for job in session):
+        st.rerun()
+
+@timed_fragment
+def jobs_panel():
+    for job in session_jobs():
+        show_job(job)
+
+# Check the imported parcels for overlaps (double titling, encroachment) and gaps between neighbours
+def find_overlaps():
+    rows, data = overlaps.find_overlaps_gaps(st.session_state["parcel_set"])
+    st.session_state["overlaps"] = (rows, data)
+    st.session_state["show_parcels"] = True
+    overlap_count = sum(row["kind"] == "overlap" for row in rows)
+    st.toast(f"###### Found :red[{overlap_count:,}] overlaps and :orange[{len(rows) - overlap_count:,}] gaps", icon="🔎")
+
+def overlap_style(feature):
+    color = "red" if feature["properties"]["kind"] == "overlap" else "orange"
+    return {"color": color, "weight": 2, "fillColor": color, "fillOpacity": 0.6}
+
+def overlap_layer():
+    feature_group = folium.FeatureGroup(name="Overlaps and Gaps")
+    data = st.session_state["overlaps"][1]
+    if data["features"]:
+        folium.GeoJson(data, style_function=overlap_style, tooltip=folium.GeoJsonTooltip(fields=["kind", "lot_id", "other_lot_id", "area"],
+            aliases=["Kind", "Lot", "Other Lot", "Area (sq.m.)"])).add_to(feature_group)
+    return feature_group
+
+# Table of the overlaps and gaps found, with a CSV download
+def show_overlaps():
+    rows = st.session_state["overlaps"][0]
+    with st.expander(f"Overlaps and Gaps ({len(rows):,})", expanded=bool(rows)):
+        if not rows:
+            st.caption(f"No overlaps or gaps of {overlaps.MIN_AREA:g} sq.m. or more between the parcels.")
+            return
+        table = pd.DataFrame(rows)
+        st.dataframe(table, hide_index=True, use_container_width=True, column_config={
+            "kind": "Kind", "lot_id": "Lot", "other_lot_id": "Other Lot", "area": st.column_config.NumberColumn("Area (sq.m.)", format="%.2f"),
+            "percent": st.column_config.NumberColumn("% of Smaller Lot", format="%.2f"), "latitude": "Latitude", "longitude": "Longitude"})
+        st.download_button("Download Overlaps and Gaps CSV", table.to_csv(index=False), file_name="overlaps_gaps.csv", mime="text/csv", use_container_width=True)
+
+# The debug panel is for admins only: the URL must carry ?debug=<LOTPLOTTER_ADMIN_TOKEN>, and without a token it is never shown
+def is_admin():
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(st.query_params.get("debug", ""), ADMIN_TOKEN)
+
+# Recording is process-wide, so this turns it on or off for every session
+def toggle_instrumentation():
+    instrumentation.enable(st.session_state["instrumentation_enabled"])
+
+def write_metrics():
+    st.toast(f"###### Metrics written to {instrumentation.dump()}", icon="🟢")
+
+def rerun_label(trace):
+    return f"{datetime.datetime.fromtimestamp(trace.started):%H:%M:%S} {trace.name} ({trace.milliseconds:,.0f} ms)"
+
+# Spans of the session's last reruns, and the span percentiles and cache hit rates of the whole process
+def debug_panel():
+    with st.expander("Debug", expanded=True):
+        st.toggle("Record spans", value=instrumentation.enabled, key="instrumentation_enabled", on_change=toggle_instrumentation, help="Time the phases of every session's reruns")
+        reruns = list(reversed(st.session_state["reruns"]))
+        if reruns:
+            trace = st.selectbox("Rerun", reruns, format_func=rerun_label, key="debug_rerun")
+            st.dataframe(pd.DataFrame([{"Span": "· " * depth + name, "Start (ms)": offset, "Time (ms)": milliseconds} for offset, depth, name, milliseconds in sorted(trace.spans)]),
+                hide_index=True, use_container_width=True, column_config={"Start (ms)": st.column_config.NumberColumn(format="%.1f"), "Time (ms)": st.column_config.NumberColumn(format="%.2f")})
+        elif instrumentation.enabled:
+            st.caption("No reruns recorded yet.")
+        else:
+            st.caption(f"Recording is off. Turn it on above, or start the app with {instrumentation.ENABLE_VARIABLE}=1.")
+
+        metrics = instrumentation.snapshot()
+        if metrics["spans"]:
+            st.dataframe(pd.DataFrame.from_dict(metrics["spans"], orient="index"), use_container_width=True)
+        if metrics["caches"]:
+            st.dataframe(pd.DataFrame.from_dict(metrics["caches"], orient="index"), use_container_width=True, column_config={"hit_rate": st.column_config.NumberColumn(format="%.2f")})
+        st.button("Write Metrics", on_click=write_metrics, use_container_width=True, icon=":material/save:", help=instrumentation.metrics_path)
+
+def parcel_style(feature):
+    return {"color": "cyan", "weight": 2, "fillOpacity": 0.1}
+
+# Parcel layer for the map's current viewport (widened by half a screen so small pans do not show gaps),
+# culled through the parcel index and simplified for the zoom level, or read from pre-generated tiles
+@instrumentation.timed("map.parcels")
+def parcel_layer(center, zoom):
+    import parcels
+    view = st.session_state.get("map") or {}
+    zoom = view.get("zoom") or zoom
+    bounds = view.get("bounds")
+    if bounds and bounds["_southWest"]["lat"] is not None:
+        south, west = bounds["_southWest"]["lat"], bounds["_southWest"]["lng"]
+        north, east = bounds["_northEast"]["lat"], bounds["_northEast"]["lng"]
+    else:
+        half_width, half_height = 400 * parcels.degrees_per_pixel(zoom), 250 * parcels.degrees_per_pixel(zoom)
+        south, west, north, east = center[0] - half_height, center[1] - half_width, center[0] + half_height, center[1] + half_width
+    margin_latitude, margin_longitude = (north - south) / 2, (east - west) / 2
+    box = (south - margin_latitude, west - margin_longitude, north + margin_latitude, east + margin_longitude)
+
+    parcel_set = st.session_state["parcel_set"]
+    if parcel_set is not None:
+        ids = parcel_set.within(*box)
+        data = parcel_set.geojson(ids[:MAX_PARCEL_FEATURES], zoom)
+        count = len(ids)
+    else:
+        data = parcels.read_tiles(PARCEL_TILES, *box, zoom)
+        count = len(data["features"])
 
-def go_to_page():
-    selected_page = st.session_state["goto_page"]
-    st.session_state["page_index"] = selected_page - 1
+    feature_group = folium.FeatureGroup(name="Parcels")
+    if data["features"]:
+        folium.GeoJson(data, style_function=parcel_style, tooltip=folium.GeoJsonTooltip(fields=["lot_id", "tiepoint"], aliases=["Lot", "Tiepoint"])).add_to(feature_group)
+    return feature_group, count
 
-# Slice the data to show only the items for the current page
-start_idx = st.session_state["page_index"] * ITEMS_PER_PAGE
-end_idx = start_idx + ITEMS_PER_PAGE
-current_td_data = st.session_state["td_data"][start_idx:end_idx]
+# Constants
+TIEPOINTS_PER_PAGE = 50
+# Most parcels drawn at once, and the pre-generated parcel tiles (cli.py --format tiles) to show when set
+MAX_PARCEL_FEATURES = 5000
+PARCEL_TILES = os.environ.get("LOTPLOTTER_PARCEL_TILES")
+LATENCY_SAMPLES = 100
+# Invalid import lines listed individually before falling back to a table
+PARSE_ERRORS_SHOWN = 20
 
 if st.session_state["process_paste_confirmed"]:
         st.session_state["process_paste_confirmed"] = False
@@ -469,85 +834,6 @@ if st.session_state["process_csv_confirmed"]:
         st.toast(f"###### Process Successful!", icon="🟢")
         st.snow()
 
-# Function to generate CSV content as a string
-def generate_csv():
-    with io.StringIO() as output:
-        writer = csv.DictWriter(output, fieldnames=["ns", "deg", "min", "ew", "dist"])
-        writer.writerow({"ns": "NS", "deg": "Deg", "min": "Min", "ew": "EW", "dist": "Dist"})
-        writer.writerows(st.session_state["td_data"])
-        return output.getvalue()
-
-def generate_dxf():
-    # Create a new DXF document with DXF version R2004
-    doc = ezdxf.new(dxfversion='R2004')
-    msp = doc.modelspace()
-
-    # Create a polyline from the provided coordinates
-    msp.add_lwpolyline(st.session_state["points"])
-
-    with io.StringIO() as string_stream:
-        # Write DXF to string stream
-        doc.write(string_stream)
-    
-        # Convert string to bytes
-        dxf_content = string_stream.getvalue().encode('utf-8')
-    
-    return dxf_content
-
-def generate_kml():
-    kml = simplekml.Kml()
-    # Add a line connecting the points
-    line = kml.newlinestring(name="Path", coords=st.session_state["geographic"])
-
-    line.style.linestyle.color = "ffff00ff"  # Magenta color
-    line.style.linestyle.width = 5  # Thickness of the line
-
-    # If you need to return the KML as a string:
-    return kml.kml()
-
-def generate_shp():
-    # Create a temporary directory for the shapefile
-    temp_dir = 'temp_shapefile'
-    os.makedirs(temp_dir, exist_ok=True)  # Create directory if it does not exist
-
-    # Path for the shapefile
-    shp_path = os.path.join(temp_dir, f"Lotplotter_{datetime.datetime.now():%Y%m%d_%H%M%S}")
-
-    # Create a shapefile writer
-    writer = shapefile.Writer(shp_path)
-    writer.shapeType = shapefile.POLYLINE  # Set the shape type to polyline
-
-    # Add fields and geometry
-    writer.field('NAME', 'C', '40')  # Add a character field
-    writer.line([st.session_state["geographic"]])  # Add the line geometry
-    writer.record('Path')  # Add a record
-
-    # Close the writer to finalize the shapefile
-    writer.close()
-
-    # Create a zip file containing the shapefile
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
-        for ext in ['.shp', '.shx', '.dbf']:
-            file_path = shp_path + ext
-            zip_file.write(file_path, arcname=os.path.basename(file_path))
-
-    # Move the cursor to the beginning of the BytesIO buffer
-    zip_buffer.seek(0)
-    try:
-        temp_dir = 'temp_shapefile'
-        if os.path.exists(temp_dir):
-            for file in os.listdir(temp_dir):
-                os.remove(os.path.join(temp_dir, file))
-            # os.rmdir(temp_dir)
-    except Exception as e:
-        print(f"Error deleting files in temp directory: {e}")
-
-    # Return the zip buffer for download
-    return zip_buffer
-
-
-
 ####################################################################
 # SIDEBAR
 ####################################################################
@@ -561,7 +847,7 @@ with st.sidebar:
             cols = st.columns([1,1,1,1,1.5])
             new_ns = cols[0].text_input("NS", key="new_ns")
             new_deg = cols[1].number_input("Deg", min_value=0, max_value=90, key="new_deg")
-            new_min =cols[2].number_input("Min", min_value=0, max_value=60, key="new_min")
+            new_min =cols[2].number_input("Min", min_value=0, max_value=59, key="new_min")
             new_ew = cols[3].text_input("EW", key="new_ew")
             new_dist = cols[4].number_input("Dist", min_value=0.00, step=1.00, key="new_dist")
 
@@ -587,6 +873,13 @@ with st.sidebar:
         with st.container(border=True):
             uploaded_file_json = st.file_uploader("Import Tiepoints JSON File", type="json", on_change=validate_import_json, key="json_file")
 
+        with st.container(border=True):
+            notif_import_parcels = st.container()
+            st.file_uploader("Import Parcels (multi-lot CSV/Parquet or computed corners Parquet)", type=["csv", "parquet"], key="parcel_file", on_change=import_parcels)
+            if st.session_state["parcel_set"] is not None:
+                st.button(f"Clear {len(st.session_state['parcel_set']):,} Parcels", on_click=clear_parcels, use_container_width=True, icon=":material/delete:")
+                st.button("Find Overlaps and Gaps", on_click=find_overlaps, use_container_width=True, icon=":material/join_inner:")
+
 
 ####################################################################
 # MAIN
@@ -596,155 +889,166 @@ st.subheader("Improved Lot Boundary Plotter")
 
 main_cols = st.columns([1,2])
 
-with main_cols[0]:
-    tiepoint = st.selectbox("Tiepoint", options=st.session_state["tiepoint_data"], index=None, format_func=tiepoint_names, key="tiepoint_selected")
+# Tiepoint search and selection; searching and paging rerun only this part
+@timed_fragment
+def tiepoint_panel():
+    tiepoints = catalog_view()
+    with instrumentation.span("tiepoints.page"):
+        search_cols = st.columns([3,1])
+        tiepoint_search = search_cols[0].text_input("Search Tiepoint", placeholder="Name, e.g. BLLM NO. 1", key="tiepoint_search")
+        with instrumentation.span("tiepoints.count"):
+            tiepoint_matches = tiepoints.count(tiepoint_search)
+        tiepoint_pages = (tiepoint_matches - 1) // TIEPOINTS_PER_PAGE + 1 if tiepoint_matches else 1
+        if st.session_state.get("tiepoint_page", 1) > tiepoint_pages:
+            st.session_state["tiepoint_page"] = 1
+        tiepoint_page = search_cols[1].number_input("Page", min_value=1, max_value=tiepoint_pages, value=1, key="tiepoint_page")
+        with instrumentation.span("tiepoints.search"):
+            tiepoint_options = tiepoints.search(tiepoint_search, (tiepoint_page - 1) * TIEPOINTS_PER_PAGE, TIEPOINTS_PER_PAGE)
+
+    # Keep the current selection available while searching for another tiepoint
+    tiepoint = st.session_state["tiepoint_selected"]
+    if tiepoint and tiepoint not in tiepoint_options:
+        tiepoint_options.insert(0, tiepoint)
+    st.selectbox("Tiepoint", options=tiepoint_options, format_func=tiepoint_names, key="tiepoint_option", on_change=select_tiepoint_option, help=f"{tiepoint_matches:,} matching tiepoints")
+    with st.expander("Nearby Tiepoints"):
+        nearby_cols = st.columns([3,1])
+        nearby_coordinate = nearby_cols[0].text_input("Latitude, Longitude", placeholder="10.3157, 123.8854", key="nearby_coordinate")
+        nearby_count = nearby_cols[1].number_input("Results", min_value=1, max_value=20, value=5, key="nearby_count")
+        if nearby_coordinate:
+            try:
+                latitude, longitude = (float(value) for value in nearby_coordinate.split(","))
+            except ValueError:
+                st.error("Invalid coordinate. Please input the latitude and longitude separated by a comma.")
+            else:
+                for index, (nearby_tiepoint, distance) in enumerate(nearby_tiepoints(latitude, longitude, nearby_count)):
+                    st.button(f"{nearby_tiepoint['name']} ({distance:,.0f} m)", key=f"nearby_{index}", use_container_width=True, on_click=select_tiepoint, args=(nearby_tiepoint,))
+
+# Technical description grid; selecting rows reruns only this part, applied edits rerun the app
+@timed_fragment
+def td_editor_panel():
     with st.container(border=True):
         st.write("Technical Descriptions")
-        output_td_data = st.container()
-        for index, data in enumerate(current_td_data):
-            current_index = start_idx + index
-            with output_td_data.popover(f"{display_line(current_index)} {display_td_data(data)}", use_container_width=True):
-                with st.form(key=f"update_form_{current_index}"):
-                    st.session_state["notif_td_data"].append(st.container())
-                    update_cols = st.columns(5)
-                    update_ns = update_cols[0].text_input("NS", value=data['ns'], key=f"update_ns_{current_index}")
-                    update_deg = update_cols[1].number_input("Deg", min_value=0, max_value=90, value=data['deg'], key=f"update_deg_{current_index}")
-                    update_min = update_cols[2].number_input("Min", min_value=0, max_value=60, value=data['min'], key=f"update_min_{current_index}")
-                    update_ew = update_cols[3].text_input("EW", value=data['ew'], key=f"update_ew_{current_index}")
-                    update_dist = update_cols[4].number_input("Dist", min_value=0.00, step=1.00, value=data['dist'], key=f"update_dist_{current_index}")
-                    st.form_submit_button("Update", on_click=validate_update_form, args=(current_index,), icon=":material/update:")
-
-                button_cols = st.columns(4)
-                button_cols[0].button("Delete", key=f"delete_{current_index}", use_container_width=True, on_click=delete, args=(current_index,), icon=":material/delete:")
-                button_cols[1].button("Copy", key=f"copy_{current_index}", use_container_width=True, on_click=copy, args=(current_index,), icon=":material/content_copy:")
-                button_cols[2].button("Move Up", key=f"move_up_{current_index}", use_container_width=True, on_click=move_up, args=(current_index,), disabled=True if current_index==0 else False, icon=":material/arrow_upward:")
-                button_cols[3].button("Move Down", key=f"move_down_{current_index}", use_container_width=True, on_click=move_down, args=(current_index,), disabled=False if current_index < len(st.session_state['td_data']) - 1 else True, icon=":material/arrow_downward:")
-
-        # Pagination controls
-        pagination_cols = st.columns(3)
-        if st.session_state["td_data"]:
-            with pagination_cols[0]:
-                if st.session_state["page_index"] > 0:
-                    st.button("Previous", on_click=prev_page, key="prev_page", use_container_width=True, disabled=False)
-                else:
-                    st.button("Previous", on_click=prev_page, key="prev_page", use_container_width=True, disabled=True)
+        for error in st.session_state["td_editor_errors"]:
+            st.error(error)
+        st.session_state["td_editor_errors"] = []
+        st.data_editor(
+            td_frame(),
+            key=td_editor_key(),
+            on_change=apply_td_editor,
+            num_rows="dynamic",
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                "Line": st.column_config.TextColumn("Line", disabled=True),
+                "NS": st.column_config.SelectboxColumn("NS", options=["N", "S", "DN", "DS", "DE", "DW"], required=True),
+                "Deg": st.column_config.NumberColumn("Deg", min_value=0, max_value=90, step=1),
+                "Min": st.column_config.NumberColumn("Min", min_value=0, max_value=59, step=1),
+                "EW": st.column_config.SelectboxColumn("EW", options=["E", "W"]),
+                "Dist": st.column_config.NumberColumn("Dist", min_value=0.00, step=0.01, format="%.2f", required=True),
+                "Select": st.column_config.CheckboxColumn("Select"),
+            },
+        )
 
-            with pagination_cols[1]:
-                st.html(f"<div style='text-align: center;'>Page {st.session_state['page_index'] + 1} of {total_pages}</div>")
-                selected_page = st.number_input("Go to page:", min_value=1, max_value=total_pages, step=None, value=min(st.session_state["page_index"] + 1,total_pages), key="goto_page", on_change=go_to_page)
+        # Bulk operations on the selected rows
+        no_selection = not st.session_state["td_selected"]
+        button_cols = st.columns(4)
+        button_cols[0].button("Delete", key="delete_selected", use_container_width=True, on_click=delete_selected, disabled=no_selection, icon=":material/delete:")
+        button_cols[1].button("Copy", key="copy_selected", use_container_width=True, on_click=copy_selected, disabled=no_selection, icon=":material/content_copy:")
+        button_cols[2].button("Move Up", key="move_up_selected", use_container_width=True, on_click=move_up_selected, disabled=no_selection, icon=":material/arrow_upward:")
+        button_cols[3].button("Move Down", key="move_down_selected", use_container_width=True, on_click=move_down_selected, disabled=no_selection, icon=":material/arrow_downward:")
+
+# Boundary and map, for the tiepoint, technical description and adjustment of the last full run
+@timed_fragment
+def map_panel(x_adjustment, y_adjustment):
+    if st.session_state["tiepoint_selected"] and st.session_state["td_data"]:
+        x, y, longitude, latitude, closure = cached_boundary(st.session_state["tiepoint_selected"], st.session_state["switch"], x_adjustment, y_adjustment, st.session_state["compass_rule"])
+        st.session_state["points"] = list(zip(x.tolist(), y.tolist()))
+        st.session_state["geographic"] = list(zip(longitude.tolist(), latitude.tolist()))
+        center, zoom = map_view(latitude, longitude)
+        overlay = parcel_overlay(latitude, longitude)
+    else:
+        center, zoom = st.session_state["map_view"]
+        overlay = folium.FeatureGroup(name="Parcel")
+
+    # With parcels shown, panning and zooming rerun this fragment to update the culled, simplified layer
+    layers = [overlay]
+    returned_objects = []
+    if st.session_state["show_parcels"] and (st.session_state["parcel_set"] is not None or PARCEL_TILES):
+        parcel_group, parcel_count = parcel_layer(center, zoom)
+        layers.insert(0, parcel_group)
+        returned_objects = ["bounds", "zoom"]
+        if parcel_count > MAX_PARCEL_FEATURES:
+            st.caption(f"Showing {MAX_PARCEL_FEATURES:,} of {parcel_count:,} parcels in view. Zoom in to see the rest.")
+        if st.session_state["overlaps"] is not None:
+            layers.insert(1, overlap_layer())
+    m = base_map()
+    with instrumentation.span("map.st_folium"):
+        st_folium(m, key="map", height=500, use_container_width=True, returned_objects=returned_objects, feature_group_to_add=layers, center=center, zoom=zoom)
+    if st.session_state["tiepoint_selected"] and st.session_state["td_data"]:
+        show_closure(closure, st.session_state["min_precision"])
+
+# Lazily built downloads; preparing one reruns only this part
+@timed_fragment
+def download_panel():
+    td_key = technical_description_key(st.session_state["td_data"])
+    plotted = bool(st.session_state["points"] and st.session_state["tiepoint_selected"])
+    for fmt, exporter in exporters.registry().items():
+        if exporter.boundary:
+            download_export(fmt, st.session_state["boundary_key"] if plotted else None)
+        else:
+            download_export(fmt, td_key)
 
-            with pagination_cols[2]:
-                if st.session_state["page_index"] < total_pages - 1:
-                    st.button("Next", on_click=next_page, key="next_page", use_container_width=True, disabled=False)
-                else:
-                    st.button("Next", on_click=next_page, key="next_page", use_container_width=True, disabled=True)
+    # Automatic download link in Streamlit
+    with instrumentation.span("download.tiepoints"):
+        tiepoints_json = json.dumps(catalog_view().all(), indent=4) if st.session_state["tiepoint_overlay"] else base_tiepoints_json()
+    st.download_button(
+        label="Download Tiepoints JSON file",
+        data=tiepoints_json,
+        file_name="tiepoints_export.json",
+        mime="application/json",
+        use_container_width=True
+    )
+
+with main_cols[0]:
+    tiepoint_panel()
+    td_editor_panel()
 
 with tabs[3]:
     switch = st.toggle("Show tieline", key="switch")
-    if tiepoint:
+    if st.session_state["parcel_set"] is not None or PARCEL_TILES:
+        st.toggle("Show parcels", key="show_parcels")
+    if st.session_state["tiepoint_selected"]:
         with st.container(border=True):
             cols = st.columns(2)
             x_adjustment = cols[0].number_input("X Adjustment", step=1.00, format="%.3f", key="x_adjustment")
-            y_adjustment = cols[1].number_input("Y Adjustment", step=1.00, format="%.3f", key="y_adjustment")  
+            y_adjustment = cols[1].number_input("Y Adjustment", step=1.00, format="%.3f", key="y_adjustment")
+    with st.container(border=True):
+        st.toggle("Adjust closure (compass rule)", key="compass_rule", help="Distribute the misclosure over the lot's corners in proportion to the distance travelled (Bowditch)")
+        st.number_input("Minimum precision 1:", min_value=1, value=lotplotter.MIN_PRECISION, step=1000, key="min_precision")
 
 with main_cols[1]:
-    if st.session_state["tiepoint_selected"] and st.session_state["td_data"]:
-        st.session_state["points"], st.session_state["geographic"], map_coord = lotplotter.calculate_boundary(st.session_state["tiepoint_selected"], st.session_state["td_data"])
-        if st.session_state["switch"] == True:
-            st.session_state["points"].insert(0,(st.session_state["tiepoint_selected"]["easting"],st.session_state["tiepoint_selected"]["northing"]))
-            st.session_state["geographic"].insert(0,(lotplotter.convert_dms_to_dd(st.session_state["tiepoint_selected"]["longitude"]), lotplotter.convert_dms_to_dd(st.session_state["tiepoint_selected"]["latitude"])))
-            map_coord.insert(0,(lotplotter.convert_dms_to_dd(st.session_state["tiepoint_selected"]["latitude"]), lotplotter.convert_dms_to_dd(st.session_state["tiepoint_selected"]["longitude"])))
-        m = map_folium(18)
-        adjusted_map_coord = [
-            (lat + y_adjustment / (3600 * st.session_state["tiepoint_selected"]["k_latitude"]),
-            long + x_adjustment / (3600 * st.session_state["tiepoint_selected"]["k_latitude"]))
-            for lat, long in map_coord
-        ]
-        # Reverse
-        st.session_state["geographic"] = [(coord[1], coord[0]) for coord in adjusted_map_coord]
-        if st.session_state["switch"] == True:
-            m.location = (adjusted_map_coord[1])
+    map_panel(st.session_state.get("x_adjustment", 0.0), st.session_state.get("y_adjustment", 0.0))
+    if st.session_state["overlaps"] is not None:
+        show_overlaps()
+    if st.session_state["jobs"]:
+        if any(job.active for job in session_jobs()):
+            running_jobs_panel()
         else:
-            m.location = (adjusted_map_coord[0])
-        folium.PolyLine(locations=adjusted_map_coord,
-            color="magenta",
-            weight=5,
-            fill_color="yellow",
-            fill_opacity=0.6,
-            fill=True,).add_to(m)
-    else:
-        m = map_folium(11)
-
-    st_folium(m, height=500, use_container_width=True, returned_objects=[])
+            jobs_panel()
 
 with tabs[2]:
-    st.download_button(
-        label="Download CSV",
-        data=generate_csv(),
-        file_name=f"Lotplotter_{datetime.datetime.now():%Y%m%d_%H%M%S}.csv",
-        mime="text/csv",
-        use_container_width=True
-    )
+    download_panel()
 
-    if st.session_state["points"] and st.session_state["tiepoint_selected"]:
-        st.download_button(
-            label="Download DXF",
-            data=generate_dxf(),
-            file_name=f"Lotplotter_{datetime.datetime.now():%Y%m%d_%H%M%S}.dxf",
-            mime="application/dxf",
-            use_container_width=True
-        )
-    else:
-        st.download_button(
-            label="Download DXF",
-            data="",
-            file_name=f"Lotplotter_{datetime.datetime.now():%Y%m%d_%H%M%S}.dxf",
-            mime="application/dxf",
-            use_container_width=True,
-            disabled=True
-        )
+# Rerun latency of the app and of each fragment, shown with ?latency in the URL
+if "latency" in st.query_params:
+    with st.sidebar:
+        for name, samples in st.session_state["rerun_latency"].items():
+            st.caption(f"{name}: last {samples[-1]:.0f} ms, median {np.median(samples):.0f} ms over {len(samples)} runs")
 
-    if st.session_state["geographic"] and st.session_state["tiepoint_selected"]:
-        st.download_button(
-            label="Download KML",
-            data=generate_kml(),
-            file_name=f"Lotplotter_{datetime.datetime.now():%Y%m%d_%H%M%S}.kml",
-            mime="application/kml",
-            use_container_width=True
-        )
-    else:
-        st.download_button(
-            label="Download KML",
-            data="",
-            file_name=f"Lotplotter_{datetime.datetime.now():%Y%m%d_%H%M%S}.kml",
-            mime="application/kml",
-            use_container_width=True,
-            disabled=True
-        )
+if is_admin():
+    with st.sidebar:
+        debug_panel()
 
-    if st.session_state["geographic"] and st.session_state["tiepoint_selected"]:
-        st.download_button(
-            label="Download SHP",
-            data=generate_shp(),
-            file_name=f"Lotplotter_{datetime.datetime.now():%Y%m%d_%H%M%S}.zip",
-            mime="application/zip",
-            use_container_width=True
-        )
-    else:
-        st.download_button(
-            label="Download SHP",
-            data="",
-            file_name=f"Lotplotter_{datetime.datetime.now():%Y%m%d_%H%M%S}.zip",
-            mime="application/zip",
-            use_container_width=True,
-            disabled=True
-        )
-
-    # Automatic download link in Streamlit
-    st.download_button(
-        label="Download Tiepoints JSON file",
-        data=json.dumps(st.session_state["tiepoint_data"], indent=4),
-        file_name="tiepoints_export.json",
-        mime="application/json",
-        use_container_width=True
-    )
+record_latency("app", script_started)
+store_rerun(instrumentation.end_trace())
+instrumentation.dump_if_due()
@@ -0,0 +1,100 @@
+import math
+import re
+
+# Due bearings carry no angle
+DUE_BEARINGS = ["DN", "DS", "DE", "DW"]
+
+# Any field with one of these values marks a header line
+HEADER_NAMES = frozenset(["ns", "deg", "degrees", "min", "minutes", "ew", "dist", "distance"])
+
+# Delimited lines: NS, Deg, Min, EW, Dist separated by tabs or commas
+FIELD_SEPARATOR = re.compile(r"[\t,]")
+
+# Free-text bearings as written in titles, e.g. "N 45°30' E, 120.50 m", "S. 12 deg. 05 min. W., 35.2 m." or "Due North 12.5 m",
+# or as the app displays them, e.g. "N 45-30 E, 120.50", optionally after a line label such as "1-2"
+BEARING_PATTERN = re.compile(r"""
+    \s*(?:\d+\s*-\s*\d+\s*[.:]?\s+)?
+    (?:
+        (?:D\.?\s*|DUE\s+)(?P<due>N|S|E|W)(?:ORTH|OUTH|AST|EST)?\.?
+    |
+        (?P<ns>[NS])\.?\s*
+        (?P<deg>\d{1,3})\s*(?:°|º|DEG(?:REES?)?\.?|D\.?|-)?\s*
+        (?:(?P<min>\d{1,2})\s*(?:'|’|′|MIN(?:UTES?)?\.?)?\s*)?
+        (?P<ew>[EW])\.?
+    )
+    \s*[,;:]?\s*
+    (?P<dist>\d+(?:\.\d*)?|\.\d+)\s*(?:M|MTS?|METERS?|METRES?)?\.?\s*
+    """, re.IGNORECASE | re.VERBOSE)
+
+# Convert the five fields of a course into a technical description dict, raising ValueError with every problem found.
+# Quadrant bearings run from 0 to 90 degrees and distances are finite and not negative
+def parse_fields(ns, deg, min, ew, dist):
+    ns = ns.strip().upper()
+    ew = ew.strip().upper()
+    problems = []
+    if ns in DUE_BEARINGS:
+        deg = 0
+        min = 0
+        ew = ""
+    else:
+        if ns not in ["N", "S"]:
+            problems.append(f"Invalid NS value: {ns}")
+        try:
+            deg = int(deg)
+        except ValueError:
+            problems.append(f"Invalid Deg value: {deg.strip()}")
+        else:
+            if not 0 <= deg <= 90:
+                problems.append(f"Deg out of range (0-90): {deg}")
+        try:
+            min = int(min)
+        except ValueError:
+            problems.append(f"Invalid Min value: {min.strip()}")
+        else:
+            if not 0 <= min <= 59:
+                problems.append(f"Min out of range (0-59): {min}")
+            elif deg == 90 and min:
+                problems.append(f"Bearing over 90 degrees: {deg}-{min:02d}")
+        if ew not in ["E", "W"]:
+            problems.append(f"Invalid EW value: {ew}")
+    try:
+        dist = float(dist)
+    except ValueError:
+        problems.append(f"Invalid Dist value: {dist.strip()}")
+    else:
+        if not (math.isfinite(dist) and dist >= 0):
+            problems.append(f"Dist out of range (0 or more): {dist}")
+    if problems:
+        raise ValueError("; ".join(problems))
+    return {"ns": ns, "deg": deg, "min": min, "ew": ew, "dist": dist}
+
+# Convert one line into a technical description dict, None for blank and header lines
+def parse_line(line):
+    fields = FIELD_SEPARATOR.split(line)
+    if len(fields) == 5:
+        if any(field.strip().lower() in HEADER_NAMES for field in fields):
+            return None
+        return parse_fields(*fields)
+    if not line.strip():
+        return None
+
+    match = BEARING_PATTERN.fullmatch(line)
+    if match is None:
+        raise ValueError("Invalid value")
+    if match["due"]:
+        return parse_fields("D" + match["due"], "0", "0", "", match["dist"])
+    return parse_fields(match["ns"], match["deg"], match["min"] or "0", match["ew"], match["dist"])
+
+# Yield the courses of any iterable of lines (a text stream, a list), appending (line number, line, error) to errors
+# for every invalid line instead of stopping at the first one
+def parse(lines, errors=None):
+    for line_number, line in enumerate(lines, 1):
+        line = line.rstrip("\r\n")
+        try:
+            course = parse_line(line)
+        except ValueError as e:
+            if errors is not None:
+                errors.append((line_number, line, str(e)))
+            continue
+        if course is not None:
+            yield course
@@ -0,0 +1,199 @@
+import numpy as np
+import lotplotter
+
+# Reverse lookup of the engine's quadrant codes
+QUADRANTS = {code: quadrant for quadrant, code in lotplotter.QUADRANT_CODES.items()}
+
+# Keys of the legacy technical description dicts
+KEYS = ("ns", "deg", "min", "ew", "dist")
+
+# Lightweight view of a single course, readable like the legacy dict
+class Course:
+    __slots__ = ("technical_description", "index")
+
+    def __init__(self, technical_description, index):
+        self.technical_description = technical_description
+        self.index = index
+
+    @property
+    def ns(self):
+        return QUADRANTS[int(self.technical_description.codes[self.index])][0]
+
+    @property
+    def ew(self):
+        return QUADRANTS[int(self.technical_description.codes[self.index])][1]
+
+    @property
+    def deg(self):
+        return int(self.technical_description.deg[self.index])
+
+    @property
+    def min(self):
+        return int(self.technical_description.min[self.index])
+
+    @property
+    def dist(self):
+        return float(self.technical_description.dist[self.index])
+
+    def __getitem__(self, key):
+        if key not in KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in KEYS}
+
+    def __repr__(self):
+        return f"Course({self.to_dict()})"
+
+# Array backed technical description: one quadrant code, degree, minute and distance per course
+class TechnicalDescription:
+    def __init__(self, capacity=16):
+        self.size = 0
+        self._codes = np.empty(capacity, dtype=np.int8)
+        self._deg = np.empty(capacity, dtype=np.int16)
+        self._min = np.empty(capacity, dtype=np.int16)
+        self._dist = np.empty(capacity, dtype=np.float64)
+
+    @classmethod
+    def from_dicts(cls, data):
+        technical_description = cls(capacity=max(len(data), 16))
+        codes, deg, min, dist = lotplotter.encode_courses(data)
+        technical_description.size = len(data)
+        technical_description._codes[:len(data)] = codes
+        technical_description._deg[:len(data)] = deg
+        technical_description._min[:len(data)] = min
+        technical_description._dist[:len(data)] = dist
+        return technical_description
+
+    def to_dicts(self):
+        return [course.to_dict() for course in self]
+
+    # Views over the used part of the arrays
+    @property
+    def codes(self):
+        return self._codes[:self.size]
+
+    @property
+    def deg(self):
+        return self._deg[:self.size]
+
+    @property
+    def min(self):
+        return self._min[:self.size]
+
+    @property
+    def dist(self):
+        return self._dist[:self.size]
+
+    def arrays(self):
+        return self.codes, self.deg, self.min, self.dist
+
+    @property
+    def nbytes(self):
+        return self._codes.nbytes + self._deg.nbytes + self._min.nbytes + self._dist.nbytes
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for index in range(self.size):
+            yield Course(self, index)
+
+    def _check_index(self, index):
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("technical description index out of range")
+        return index
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.size)
+            technical_description = TechnicalDescription(capacity=max(len(range(start, stop, step)), 16))
+            technical_description.size = len(range(start, stop, step))
+            for source, target in zip(self.arrays(), technical_description.arrays()):
+                target[:] = source[index]
+            return technical_description
+        return Course(self, self._check_index(index))
+
+    def __setitem__(self, index, data):
+        index = self._check_index(index)
+        self._codes[index] = lotplotter.encode_quadrant(data["ns"], data["ew"])
+        self._deg[index] = int(data["deg"])
+        self._min[index] = int(data["min"])
+        self._dist[index] = float(data["dist"])
+
+    def __delitem__(self, index):
+        self.delete(index)
+
+    def _grow(self):
+        capacity = max(len(self._codes) * 2, 16)
+        for name in ("_codes", "_deg", "_min", "_dist"):
+            array = getattr(self, name)
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            setattr(self, name, grown)
+
+    def insert(self, index, data):
+        index = max(0, min(index if index >= 0 else index + self.size, self.size))
+        if self.size == len(self._codes):
+            self._grow()
+        for array in (self._codes, self._deg, self._min, self._dist):
+            array[index + 1:self.size + 1] = array[index:self.size]
+        self.size += 1
+        self[index] = data
+
+    def append(self, data):
+        self.insert(self.size, data)
+
+    def delete(self, index):
+        index = self._check_index(index)
+        for array in (self._codes, self._deg, self._min, self._dist):
+            array[index:self.size - 1] = array[index + 1:self.size]
+        self.size -= 1
+
+    # Duplicate the course at index, matching the UI's copy button
+    def copy(self, index):
+        index = self._check_index(index)
+        if self.size == len(self._codes):
+            self._grow()
+        for array in (self._codes, self._deg, self._min, self._dist):
+            array[index + 1:self.size + 1] = array[index:self.size]
+        self.size += 1
+
+    # Rearrange the courses in one step: the new course i is the old course order[i], so one order can delete,
+    # duplicate and move any number of courses
+    def reorder(self, order):
+        order = np.asarray(order, dtype=np.intp)
+        if len(order) and (order.min() < 0 or order.max() >= self.size):
+            raise IndexError("technical description index out of range")
+        capacity = max(len(order), len(self._codes), 16)
+        for name in ("_codes", "_deg", "_min", "_dist"):
+            array = getattr(self, name)
+            reordered = np.empty(capacity, dtype=array.dtype)
+            reordered[:len(order)] = array[order]
+            setattr(self, name, reordered)
+        self.size = len(order)
+
+    def swap(self, index, other):
+        index = self._check_index(index)
+        other = self._check_index(other)
+        for array in (self._codes, self._deg, self._min, self._dist):
+            array[index], array[other] = array[other], array[index]
+
+    def move_up(self, index):
+        if index > 0:
+            self.swap(index, index - 1)
+
+    def move_down(self, index):
+        if index < self.size - 1:
+            self.swap(index, index + 1)
+
+    def __eq__(self, other):
+        if not isinstance(other, TechnicalDescription):
+            return NotImplemented
+        return self.size == other.size and all(np.array_equal(a, b) for a, b in zip(self.arrays(), other.arrays()))
+
+    def __repr__(self):
+        return f"TechnicalDescription({self.to_dicts()})"
@@ -0,0 +1,41 @@
+import json
+import os
+import sys
+import pytest
+
+# The app's modules are top-level files in the repository root, and server.py opens its data files relative to it
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# A lot whose courses do not close, plotted from the first catalog tiepoint
+COURSES = [
+    {"ns": "N", "deg": 10, "min": 5, "ew": "E", "dist": 100.0},
+    {"ns": "S", "deg": 80, "min": 0, "ew": "E", "dist": 50.0},
+    {"ns": "S", "deg": 10, "min": 0, "ew": "W", "dist": 60.0},
+    {"ns": "N", "deg": 80, "min": 0, "ew": "W", "dist": 50.0},
+]
+
+@pytest.fixture
+def root(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    return ROOT
+
+@pytest.fixture
+def tiepoint():
+    with open(os.path.join(ROOT, "tiepoints.json"), "r") as file:
+        return json.load(file)[0]
+
+# A fresh app session (server.py under Streamlit's AppTest) with the lot plotted
+@pytest.fixture
+def plotted_app(root, tiepoint):
+    from streamlit.testing.v1 import AppTest
+    from technical_description import TechnicalDescription
+    def start():
+        app = AppTest.from_file("server.py", default_timeout=60)
+        app.run()
+        app.session_state["td_data"] = TechnicalDescription.from_dicts(COURSES)
+        app.session_state["tiepoint_selected"] = tiepoint
+        app.run()
+        assert not app.exception, app.exception
+        return app
+    return start
@@ -0,0 +1,46 @@
+import json
+import pytest
+import api
+from conftest import COURSES
+
+CSV_HEADER = "Lot ID,Tiepoint,NS,Deg,Min,EW,Dist\n"
+
+@pytest.fixture
+def worker(tiepoint):
+    api.init_worker([tiepoint])
+    yield
+    api.init_worker([])
+
+def lots_csv(lot_id):
+    return "".join(f"{lot_id},0,{course['ns']},{course['deg']},{course['min']},{course['ew']},{course['dist']}\n" for course in COURSES)
+
+@pytest.mark.parametrize("body", [
+    "Lot ID,NS,Deg,Min,EW,Dist\nA,N,10,5,E,100\n".encode("utf-8"),
+    (CSV_HEADER + lots_csv("Lote Ñ")).encode("latin-1"),
+])
+def test_invalid_csv_is_a_request_error(worker, body):
+    with pytest.raises(api.RequestError) as error:
+        api.read_batch(body, True)
+    assert error.value.status == 400
+
+def test_tiepoint_with_non_numeric_dms(tiepoint):
+    with pytest.raises(api.RequestError) as error:
+        api.resolve_tiepoint(dict(tiepoint, latitude=dict(tiepoint["latitude"], deg="ten")), {}.get)
+    assert error.value.status == 400
+
+# The ?compass_rule= argument holds unless the JSON body sets it
+def test_compass_rule_from_body_only_when_set(worker, tiepoint):
+    lot = {"tiepoint": tiepoint["name"], "td_data": COURSES}
+    assert api.read_batch(json.dumps({"lots": [lot]}), False, True)[1]
+    assert not api.read_batch(json.dumps({"lots": [lot], "compass_rule": False}), False, True)[1]
+    assert api.read_batch(json.dumps({"lots": [lot], "compass_rule": True}), False)[1]
+
+def test_null_lot_id_keeps_default(worker, tiepoint):
+    lots, _ = api.read_batch(json.dumps({"lots": [{"lot_id": None, "tiepoint": tiepoint["name"], "td_data": COURSES}]}), False)
+    assert lots[0][0] == "0"
+    assert api.read_batch((CSV_HEADER + lots_csv("A")).encode("utf-8"), True)[0][0][0] == "A"
+
+def test_content_disposition_quotes_file_name():
+    header = api.content_disposition('a"b é.zip')
+    assert header == "attachment; filename=\"a_b__.zip\"; filename*=UTF-8''a%22b%20%C3%A9.zip"
+    assert api.content_disposition(api.exporters.safe_file_name('a"b') + ".zip").startswith('attachment; filename="a_b.zip"')
@@ -0,0 +1,36 @@
+import io
+import os
+import numpy as np
+import pyarrow.parquet as pq
+import cli
+import ingest
+import lotplotter
+from conftest import COURSES, ROOT
+
+CSV_HEADER = "Lot ID,Tiepoint,NS,Deg,Min,EW,Dist\n"
+
+def lots_csv(lot_ids, tiepoint="0"):
+    return "".join(f"{lot_id},{tiepoint},{course['ns']},{course['deg']},{course['min']},{course['ew']},{course['dist']}\n" for lot_id in lot_ids for course in COURSES)
+
+# Multi-lot CSV files round-trip through `cli.py -f parquet` into one corners file, skipping the invalid lot
+def test_cli_parquet_round_trip(tmp_path, tiepoint):
+    (tmp_path / "a.csv").write_text(CSV_HEADER + lots_csv(["A", "B"]) + lots_csv(["BAD"], "unknown"))
+    (tmp_path / "b.csv").write_text(CSV_HEADER + lots_csv(["C"]))
+    output = tmp_path / "out" / "corners.parquet"
+    assert cli.main([str(tmp_path / "a.csv"), str(tmp_path / "b.csv"), "-f", "parquet", "-o", str(output), "-t", os.path.join(ROOT, "tiepoints.json")]) == 0
+
+    table = pq.read_table(output)
+    assert table.schema == ingest.OUTPUT_SCHEMA
+    assert table.column("lot_id").to_pylist() == [lot_id for lot_id in "ABC" for _ in COURSES]
+    assert table.column("corner").to_pylist() == list(range(len(COURSES))) * 3
+    expected = lotplotter.calculate_boundaries([tiepoint], [COURSES])
+    for column in ["x", "y", "longitude", "latitude"]:
+        np.testing.assert_allclose(table.column(column).to_numpy().reshape(3, -1), np.tile(getattr(expected, column), (3, 1)))
+
+def test_ingest_stream_with_compass_rule(tmp_path, tiepoint):
+    output = str(tmp_path / "corners.parquet")
+    errors = []
+    assert ingest.ingest(io.StringIO(CSV_HEADER + lots_csv(["A"])), output, [tiepoint], errors=errors, compass_rule=True) == (1, len(COURSES))
+    adjusted = lotplotter.adjust_compass_rule(lotplotter.calculate_boundaries([tiepoint], [COURSES]), [tiepoint])
+    np.testing.assert_allclose(pq.read_table(output).column("x").to_numpy(), adjusted.x)
+    assert errors == []
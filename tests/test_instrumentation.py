@@ -0,0 +1,29 @@
+import json
+import threading
+import instrumentation
+
+# Concurrent reruns of several sessions (threads) write the metrics file at the same time
+def test_concurrent_dumps(tmp_path, monkeypatch):
+    path = tmp_path / "metrics.json"
+    monkeypatch.setattr(instrumentation, "metrics_path", str(path))
+    monkeypatch.setattr(instrumentation, "enabled", True)
+    monkeypatch.setattr(instrumentation, "DUMP_SECONDS", 0)
+    instrumentation.record("test.span", 1.0)
+    failures = []
+
+    def dump():
+        try:
+            for _ in range(3):
+                instrumentation.dump_if_due()
+                instrumentation.dump()
+        except Exception as e:
+            failures.append(e)
+
+    threads = [threading.Thread(target=dump) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not failures
+    assert json.loads(path.read_text(encoding="utf-8"))["spans"]["test.span"]["count"] >= 1
+    assert [file.name for file in tmp_path.iterdir()] == ["metrics.json"]
@@ -0,0 +1,68 @@
+import os
+import time
+import pyarrow.parquet as pq
+import ingest
+import jobs
+from conftest import COURSES
+
+def finished_job(queue, name, finished):
+    job = jobs.Job(name, queue.directory)
+    os.makedirs(job.directory)
+    job.status = jobs.DONE
+    job.finished = finished
+    queue.jobs[job.id] = job
+    return job
+
+# Finished jobs and their directories are deleted once too old or beyond the newest max_jobs; active jobs stay
+def test_expire_finished_jobs(tmp_path):
+    queue = jobs.JobQueue(1, str(tmp_path), job_seconds=60, max_jobs=2)
+    now = time.time()
+    expired = finished_job(queue, "expired.csv", now - 120)
+    oldest = finished_job(queue, "oldest.csv", now - 30)
+    kept = [finished_job(queue, "older.csv", now - 20), finished_job(queue, "newest.csv", now - 10)]
+    active = jobs.Job("active.csv", queue.directory)
+    queue.jobs[active.id] = active
+
+    assert queue.get(expired.id) is None
+    assert set(queue.jobs) == {job.id for job in kept} | {active.id}
+    assert sorted(os.listdir(tmp_path)) == sorted(job.id for job in kept)
+    assert expired.removed and oldest.removed and not active.removed
+    queue.executor.shutdown()
+
+# Multi-lot CSV upload of count lots, with every tenth lot from an unknown tiepoint
+def lots_csv(count):
+    return ("Lot ID,Tiepoint,NS,Deg,Min,EW,Dist\n" + "".join(f"L{lot},{'X' if lot % 10 == 9 else 0},{course['ns']},{course['deg']},{course['min']},{course['ew']},{course['dist']}\n"
+        for lot in range(count) for course in COURSES)).encode("utf-8")
+
+def test_lots_pages_across_batches(tmp_path):
+    job = jobs.Job("lots.csv", str(tmp_path))
+    for errors in [[("A", "e")] * 3, [("B", "e")] * 5, [("C", "e")] * 2]:
+        job.add_lots(jobs.skipped_lots(errors))
+    assert job.lot_count() == 10
+    ids = job.lots().lot_id.tolist()
+    for offset, limit in [(0, 4), (2, 4), (3, 5), (7, 10), (10, 5), (0, None)]:
+        assert job.lots(offset, limit).lot_id.tolist() == ids[offset:offset + limit if limit else None]
+
+# A cancelled job stops reading the upload at the next work unit
+def test_cancel_stops_reading(tmp_path, tiepoint, monkeypatch):
+    read = []
+    read_lots = ingest.read_lots
+    monkeypatch.setattr(ingest, "read_lots", lambda chunks: (read.append(lot) or lot for lot in read_lots(chunks)))
+    queue = jobs.JobQueue(1, str(tmp_path))
+    job = jobs.Job("lots.csv", queue.directory)
+    job.cancel_event.set()
+    queue._run(job, lots_csv(2000), [tiepoint], 5000)
+    assert job.status == jobs.CANCELLED
+    assert len(read) <= 2 * jobs.BATCH_SIZE
+    queue.executor.shutdown()
+
+# Once done, the corners file is complete and every lot has its status
+def test_run_job(tmp_path, tiepoint):
+    queue = jobs.JobQueue(1, str(tmp_path))
+    job = jobs.Job("lots.csv", queue.directory)
+    queue._run(job, lots_csv(600), [tiepoint], 5000)
+    assert job.status == jobs.DONE, job.error
+    assert (job.total, job.done, job.skipped) == (600, 540, 60)
+    assert job.lot_count() == 600 and job.progress == 1.0
+    assert pq.read_table(job.corners_path).num_rows == 540 * len(COURSES)
+    queue.executor.shutdown()
@@ -0,0 +1,31 @@
+import itertools
+import numpy as np
+import overlaps
+
+# Touching 10 m x 10 m lots on a rows x columns grid, as (min_x, min_y, max_x, max_y)
+def lot_grid(rows, columns):
+    x, y = np.meshgrid(np.arange(columns) * 10.0, np.arange(rows) * 10.0)
+    x, y = x.ravel(), y.ravel()
+    return x, y, x + 10.0, y + 10.0
+
+def intersecting_pairs(min_x, min_y, max_x, max_y, margin):
+    return [(i, j) for i, j in itertools.combinations(range(len(min_x)), 2)
+        if min_x[i] <= max_x[j] + margin and min_x[j] <= max_x[i] + margin and min_y[i] <= max_y[j] + margin and min_y[j] <= max_y[i] + margin]
+
+def test_candidate_pairs_match_every_intersecting_pair():
+    rng = np.random.default_rng(19)
+    min_x, min_y = rng.uniform(0, 500, 300), rng.uniform(0, 300, 300)
+    max_x, max_y = min_x + rng.exponential(20, 300), min_y + rng.exponential(20, 300)
+    max_x[0] = min_x[0] + 400
+    for margin in [0.0, 2.0]:
+        pairs = overlaps.candidate_pairs(min_x, min_y, max_x, max_y, margin)
+        assert [tuple(pair) for pair in pairs.tolist()] == intersecting_pairs(min_x, min_y, max_x, max_y, margin)
+
+# Lots are compared with a few neighbours each, however they are spread: a square grid, a row or a column of lots
+def test_candidates_grow_linearly():
+    for rows, columns in [(30, 30), (60, 60), (1, 900), (900, 1), (1, 3600), (3600, 1)]:
+        min_x, min_y, max_x, max_y = lot_grid(rows, columns)
+        first, _ = overlaps.grid_pairs(min_x, min_y, max_x + 2.0, max_y + 2.0)
+        assert len(first) <= 8 * rows * columns
+        # Every neighbour, diagonals included, touches
+        assert len(overlaps.candidate_pairs(min_x, min_y, max_x, max_y, 2.0)) == (rows - 1) * columns + rows * (columns - 1) + 2 * (rows - 1) * (columns - 1)
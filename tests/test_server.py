@@ -0,0 +1,76 @@
+import io
+import ingest
+import lotplotter
+from conftest import COURSES
+
+# Regressions of the Streamlit app, run through Streamlit's AppTest
+
+# The cached boundary must not share (and freeze) the arrays the traverse keeps editing in place
+def test_reorder_after_plot(plotted_app):
+    app = plotted_app()
+    points = app.session_state["points"]
+    app.session_state["td_selected"] = [1]
+    app.run()
+    app.button(key="move_up_selected").click().run()
+    assert not app.exception, app.exception
+    assert app.session_state["td_data"].to_dicts()[0]["deg"] == 80
+    assert app.session_state["points"] != points
+
+def closure_metrics(app):
+    return {metric.label: metric.value for metric in app.metric}
+
+# A second session hits the boundary cached by the first, without ever traversing the lot itself
+def test_closure_on_cached_boundary(plotted_app, tiepoint):
+    closures = lotplotter.check_closures(lotplotter.calculate_boundaries([tiepoint], [COURSES]))
+    first = closure_metrics(plotted_app())
+    second = closure_metrics(plotted_app())
+    assert first["Misclosure"] == f"{closures.misclosure[0]:.3f} m"
+    assert first["Precision"] != "Closed"
+    assert second == first
+
+# Picking a nearby tiepoint selects it in the tiepoint selectbox, which takes its value only from the session state
+def test_select_nearby_tiepoint(root, tiepoint):
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file("server.py", default_timeout=60)
+    app.run()
+    latitude, longitude = (sum(tiepoint[axis][part] / scale for part, scale in [("deg", 1), ("min", 60), ("sec", 3600)]) for axis in ["latitude", "longitude"])
+    app.text_input(key="nearby_coordinate").input(f"{latitude}, {longitude}").run()
+    app.button(key="nearby_0").click().run()
+    assert not app.exception, app.exception
+    assert not [warning.value for warning in app.warning if "tiepoint_option" in warning.value]
+    assert app.session_state["tiepoint_selected"]["name"] == tiepoint["name"]
+    assert app.selectbox(key="tiepoint_option").value["name"] == tiepoint["name"]
+
+# Finding overlaps turns the parcel layer on through the session state, which alone drives the "Show parcels" toggle
+def test_find_overlaps_shows_parcels(root, tiepoint):
+    from streamlit.testing.v1 import AppTest
+    import parcels
+    courses = "\n".join(f"{lot},0,{course['ns']},{course['deg']},{course['min']},{course['ew']},{course['dist']}" for lot in ["A", "B"] for course in COURSES)
+    app = AppTest.from_file("server.py", default_timeout=60)
+    app.run()
+    app.session_state["parcel_set"] = parcels.read_parcels(ingest.read_csv_chunks(io.StringIO("Lot ID,Tiepoint,NS,Deg,Min,EW,Dist\n" + courses)), [tiepoint])
+    app.run()
+    app.toggle(key="show_parcels").set_value(False).run()
+    next(button for button in app.button if button.label == "Find Overlaps and Gaps").click().run()
+    assert not app.exception, app.exception
+    assert not [warning.value for warning in app.warning if "show_parcels" in warning.value]
+    assert app.toggle(key="show_parcels").value
+
+# The manual input form follows the import rules: each problem is shown, and valid courses are normalized
+def test_manual_input(root):
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file("server.py", default_timeout=60)
+    app.run()
+    app.text_input(key="new_ns").input("X")
+    app.text_input(key="new_ew").input("Q")
+    next(button for button in app.button if button.label == "Add").click().run()
+    assert [error.value for error in app.error] == ["Invalid NS value: X", "Invalid EW value: Q"]
+    assert not len(app.session_state["td_data"])
+    app.text_input(key="new_ns").input("n")
+    app.number_input(key="new_deg").set_value(45)
+    app.number_input(key="new_min").set_value(30)
+    app.text_input(key="new_ew").input("e")
+    app.number_input(key="new_dist").set_value(12.5)
+    next(button for button in app.button if button.label == "Add").click().run()
+    assert not app.exception, app.exception
+    assert app.session_state["td_data"].to_dicts() == [{"ns": "N", "deg": 45, "min": 30, "ew": "E", "dist": 12.5}]
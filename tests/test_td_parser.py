@@ -0,0 +1,53 @@
+import io
+import pytest
+import td_parser
+import ingest
+
+@pytest.mark.parametrize("fields, problem", [
+    (("N", "40000", "0", "E", "10"), "Deg out of range"),
+    (("N", "95", "0", "E", "10"), "Deg out of range"),
+    (("N", "-1", "0", "E", "10"), "Deg out of range"),
+    (("N", "10", "70", "E", "10"), "Min out of range"),
+    (("N", "10", "60", "E", "10"), "Min out of range"),
+    (("N", "90", "30", "E", "10"), "Bearing over 90 degrees"),
+    (("N", "10", "5", "E", "nan"), "Dist out of range"),
+    (("N", "10", "5", "E", "inf"), "Dist out of range"),
+    (("N", "10", "5", "E", "-2.5"), "Dist out of range"),
+    (("DN", "", "", "", "nan"), "Dist out of range"),
+])
+def test_parse_fields_out_of_range(fields, problem):
+    with pytest.raises(ValueError, match=problem):
+        td_parser.parse_fields(*fields)
+
+@pytest.mark.parametrize("fields, course", [
+    (("n", "0", "0", "e", "0"), {"ns": "N", "deg": 0, "min": 0, "ew": "E", "dist": 0.0}),
+    (("S", "90", "0", "W", "12.5"), {"ns": "S", "deg": 90, "min": 0, "ew": "W", "dist": 12.5}),
+    (("N", "89", "59", "E", "1"), {"ns": "N", "deg": 89, "min": 59, "ew": "E", "dist": 1.0}),
+    (("DS", "x", "x", "", "3"), {"ns": "DS", "deg": 0, "min": 0, "ew": "", "dist": 3.0}),
+])
+def test_parse_fields_in_range(fields, course):
+    assert td_parser.parse_fields(*fields) == course
+
+# Free-text lines go through the same checks, and every invalid line is reported instead of stopping the parse
+def test_parse_reports_out_of_range_lines():
+    errors = []
+    courses = list(td_parser.parse(["N 95 E 10", "N 45°30' E, 120.50 m", "N 10-70 E 5", "Due North 12.5 m", "N,40000,0,E,10"], errors))
+    assert courses == [{"ns": "N", "deg": 45, "min": 30, "ew": "E", "dist": 120.5}, {"ns": "DN", "deg": 0, "min": 0, "ew": "", "dist": 12.5}]
+    assert [(line_number, error) for line_number, _, error in errors] == [
+        (1, "Deg out of range (0-90): 95"), (3, "Min out of range (0-59): 70"), (5, "Deg out of range (0-90): 40000")]
+
+# Courses as the app displays them (server.display_td_data) can be pasted back in
+def test_parse_displayed_courses():
+    courses = list(td_parser.parse(["N 45-30 E, 120.50", "S 05-07 W, 3.00", "1-2 N 89-59 W, 0.25", "Due South, 12.00"]))
+    assert courses == [
+        {"ns": "N", "deg": 45, "min": 30, "ew": "E", "dist": 120.5},
+        {"ns": "S", "deg": 5, "min": 7, "ew": "W", "dist": 3.0},
+        {"ns": "N", "deg": 89, "min": 59, "ew": "W", "dist": 0.25},
+        {"ns": "DS", "deg": 0, "min": 0, "ew": "", "dist": 12.0},
+    ]
+
+# A multi-lot file skips the lot with the bad course and keeps the others
+def test_read_lots_skips_out_of_range_lot():
+    text = "lot_id,tiepoint,ns,deg,min,ew,dist\nA,0,N,10,0,E,5\nB,0,N,40000,0,E,5\nC,0,S,10,0,W,nan\nD,0,S,10,0,W,5\n"
+    lots = list(ingest.read_lots(ingest.read_csv_chunks(io.StringIO(text))))
+    assert [(lot_id, error is None) for lot_id, _, _, error in lots] == [("A", True), ("B", False), ("C", False), ("D", True)]
@@ -0,0 +1,124 @@
+import math
+import numpy as np
+import lotplotter
+
+# Approximate meters per degree of latitude/longitude (at the equator) for geographic distances
+METERS_PER_DEGREE_LATITUDE = 110574.0
+METERS_PER_DEGREE_LONGITUDE = 111320.0
+
+# Static 2D k-d tree: points are reordered so every node covers one contiguous slice of order
+class KDTree:
+    def __init__(self, x, y, leaf_size=32):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.order = np.arange(len(self.x))
+        self.leaf_size = leaf_size
+        self.node_start, self.node_end = [], []
+        self.node_left, self.node_right = [], []
+        self.node_box = []
+        if len(self.x):
+            self._build(0, len(self.x))
+
+    def _build(self, start, end):
+        ids = self.order[start:end]
+        x, y = self.x[ids], self.y[ids]
+        node = len(self.node_start)
+        self.node_start.append(start)
+        self.node_end.append(end)
+        self.node_box.append((float(x.min()), float(y.min()), float(x.max()), float(y.max())))
+        self.node_left.append(-1)
+        self.node_right.append(-1)
+        if end - start > self.leaf_size:
+            # Split at the median of the wider axis
+            values = x if x.max() - x.min() >= y.max() - y.min() else y
+            middle = (end - start) // 2
+            self.order[start:end] = ids[np.argpartition(values, middle)]
+            self.node_left[node] = self._build(start, start + middle)
+            self.node_right[node] = self._build(start + middle, end)
+        return node
+
+    # Squared distance from a point to a node's bounding box
+    def _box_distance(self, node, x, y):
+        min_x, min_y, max_x, max_y = self.node_box[node]
+        dx = min_x - x if x < min_x else (x - max_x if x > max_x else 0.0)
+        dy = min_y - y if y < min_y else (y - max_y if y > max_y else 0.0)
+        return dx * dx + dy * dy
+
+    # Ids of all points inside the box, inclusive
+    def within(self, min_x, min_y, max_x, max_y):
+        found = []
+        stack = [0] if self.node_start else []
+        while stack:
+            node = stack.pop()
+            box = self.node_box[node]
+            if box[0] > max_x or box[2] < min_x or box[1] > max_y or box[3] < min_y:
+                continue
+            ids = self.order[self.node_start[node]:self.node_end[node]]
+            if box[0] >= min_x and box[2] <= max_x and box[1] >= min_y and box[3] <= max_y:
+                found.append(ids)
+            elif self.node_left[node] == -1:
+                x, y = self.x[ids], self.y[ids]
+                found.append(ids[(x >= min_x) & (x <= max_x) & (y >= min_y) & (y <= max_y)])
+            else:
+                stack.extend((self.node_left[node], self.node_right[node]))
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+    # Ids and distances of the count nearest points, closest first
+    def nearest(self, x, y, count=5):
+        count = min(count, len(self.x))
+        best_ids = np.empty(0, dtype=np.int64)
+        best_distances = np.empty(0)
+        if count == 0:
+            return best_ids, best_distances
+        worst = math.inf
+        stack = [(0.0, 0)]
+        while stack:
+            box_distance, node = stack.pop()
+            if box_distance > worst:
+                continue
+            if self.node_left[node] == -1:
+                ids = self.order[self.node_start[node]:self.node_end[node]]
+                best_ids = np.concatenate((best_ids, ids))
+                best_distances = np.concatenate((best_distances, (self.x[ids] - x) ** 2 + (self.y[ids] - y) ** 2))
+                if len(best_ids) > count:
+                    keep = np.argpartition(best_distances, count - 1)[:count]
+                    best_ids, best_distances = best_ids[keep], best_distances[keep]
+                if len(best_ids) == count:
+                    worst = float(best_distances.max())
+                continue
+            # Visit the closer child first (pushed last)
+            children = sorted(((self._box_distance(child, x, y), child) for child in (self.node_left[node], self.node_right[node])), reverse=True)
+            stack.extend(child for child in children if child[0] <= worst)
+        closest = np.argsort(best_distances, kind="stable")
+        return best_ids[closest], np.sqrt(best_distances[closest])
+
+# Spatial index over a tiepoint list, by grid coordinates and by latitude/longitude
+class TiepointIndex:
+    def __init__(self, tiepoints):
+        self.tiepoints = tiepoints
+        self.grid = KDTree([tiepoint["easting"] for tiepoint in tiepoints], [tiepoint["northing"] for tiepoint in tiepoints])
+        longitude = np.array([lotplotter.convert_dms_to_dd(tiepoint["longitude"]) for tiepoint in tiepoints], dtype=np.float64)
+        latitude = np.array([lotplotter.convert_dms_to_dd(tiepoint["latitude"]) for tiepoint in tiepoints], dtype=np.float64)
+
+        # Project to meters around the catalog's mean latitude so distances are comparable on both axes
+        self.longitude_scale = METERS_PER_DEGREE_LONGITUDE * math.cos(math.radians(float(latitude.mean()) if len(latitude) else 0.0))
+        self.geographic = KDTree(longitude * self.longitude_scale, latitude * METERS_PER_DEGREE_LATITUDE)
+
+    # Nearest tiepoints to a latitude/longitude as (tiepoint, distance in meters)
+    def nearest(self, latitude, longitude, count=5):
+        ids, distances = self.geographic.nearest(longitude * self.longitude_scale, latitude * METERS_PER_DEGREE_LATITUDE, count)
+        return [(self.tiepoints[id], distance) for id, distance in zip(ids.tolist(), distances.tolist())]
+
+    # Nearest tiepoints to an easting/northing as (tiepoint, distance)
+    def nearest_grid(self, easting, northing, count=5):
+        ids, distances = self.grid.nearest(easting, northing, count)
+        return [(self.tiepoints[id], distance) for id, distance in zip(ids.tolist(), distances.tolist())]
+
+    # Tiepoints inside a latitude/longitude bounding box
+    def within(self, min_latitude, min_longitude, max_latitude, max_longitude):
+        ids = self.geographic.within(min_longitude * self.longitude_scale, min_latitude * METERS_PER_DEGREE_LATITUDE, max_longitude * self.longitude_scale, max_latitude * METERS_PER_DEGREE_LATITUDE)
+        return [self.tiepoints[id] for id in ids.tolist()]
+
+    # Tiepoints inside an easting/northing bounding box
+    def within_grid(self, min_easting, min_northing, max_easting, max_northing):
+        return [self.tiepoints[id] for id in self.grid.within(min_easting, min_northing, max_easting, max_northing).tolist()]